@@ -33,6 +33,7 @@ import warnings
 import re
 import datetime
 import os
+from math import ceil
 
 from numpy import (unicode_, ndarray)
 
@@ -45,16 +46,21 @@ from gwpy.segments import (SegmentList, Segment, DataQualityFlag)
 
 from . import (globalv, mode)
 from .data import (get_channel, add_timeseries, add_spectrogram,
-                   add_coherence_component_spectrogram)
+                   add_coherence_component_spectrogram, FILTER_STATE,
+                   PYRAMID_LEVELS, PYRAMID_STATISTICS, downsample_timeseries,
+                   pyramid_key)
+from .data.sketch import (SpectrumSketch, add_spectrum_sketch)
 from .triggers import (EventTable, add_triggers)
 
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
 
 re_rate = re.compile('_EVENT_RATE_')
+re_channel = re.compile(r'[A-Z][0-9]:[\w\-.]+')
 
 
 def write_data_archive(outfile, channels=True, timeseries=True,
-                       spectrogram=True, segments=True, triggers=True):
+                       spectrogram=True, segments=True, triggers=True,
+                       pyramid=False):
     """Build and save an HDF archive of data processed in this job.
 
     Parameters
@@ -65,6 +71,11 @@ def write_data_archive(outfile, channels=True, timeseries=True,
     timeseries : `bool`, optional
         include `TimeSeries` data in archive
 
+    pyramid : `bool`, optional
+        include downsampled trends of each `TimeSeries`, at each of the
+        `~gwsumm.data.PYRAMID_LEVELS`, for use in long-span modes
+        (see `write_pyramid`)
+
     spectrogram : `bool`, optional
         include `Spectrogram` data in archive
 
@@ -102,6 +113,8 @@ def write_data_archive(outfile, channels=True, timeseries=True,
             if timeseries:
                 tgroup = h5file.create_group('timeseries')
                 sgroup = h5file.create_group('statevector')
+                if pyramid:
+                    pgroup = h5file.create_group('pyramid')
                 # loop over channels
                 for c, tslist in globalv.DATA.items():
                     c = get_channel(c)
@@ -127,6 +140,16 @@ def write_data_archive(outfile, channels=True, timeseries=True,
                         else:
                             group = tgroup
                         _write_object(ts, group, path=name, format='hdf5')
+                        # archive trends
+                        if pyramid and group is tgroup:
+                            write_pyramid(ts, name, pgroup)
+
+                # store filter states, to continue filtering next time
+                fgroup = h5file.create_group('filter-state')
+                for key, (rate, end, zf) in FILTER_STATE.items():
+                    dset = fgroup.create_dataset(key, data=zf)
+                    dset.attrs['sample_rate'] = rate
+                    dset.attrs['end'] = end
 
             # -- spectrogram --------------------
 
@@ -142,6 +165,10 @@ def write_data_archive(outfile, channels=True, timeseries=True,
                             name = '%s,%s' % (key, spec.t0.value)
                             _write_object(spec, group, path=name,
                                           format='hdf5')
+                # store percentile sketches, to merge in longer spans
+                group = h5file.create_group('spectrum-sketch')
+                for key, sketch in globalv.SPECTRUM_SKETCHES.items():
+                    sketch.write(group, key)
 
             # -- segments -----------------------
 
@@ -167,7 +194,7 @@ def write_data_archive(outfile, channels=True, timeseries=True,
             os.remove(backup)
 
 
-def read_data_archive(sourcefile):
+def read_data_archive(sourcefile, resolution=None, trends_only=None):
     """Read archived data from an HDF5 archive source
 
     This method reads all found data into the data containers defined by
@@ -177,11 +204,33 @@ def read_data_archive(sourcefile):
     ----------
     sourcefile : `str`
         path to source HDF5 file
+
+    resolution : `float`, optional
+        the time resolution (seconds) required of `TimeSeries` trends; if
+        given, and the archive contains trend pyramids, the coarsest
+        trends no longer than this are read alongside the full data,
+        and stored under keys given by `~gwsumm.data.pyramid_key`
+
+    trends_only : `set` of `str`, optional
+        the names of channels for which only trends are needed (see
+        `find_trend_channels`), the full data for these channels are not
+        read if trends at the chosen resolution were archived
     """
     from h5py import File
 
+    trends_only = set(trends_only or ())
+
     with File(sourcefile, 'r') as h5file:
 
+        # -- pyramid ----------------------------
+
+        trends = {}
+        level = get_pyramid_level(h5file, resolution)
+        if level is not None:
+            for path, dataset in h5file['pyramid'][str(level)].items():
+                name, stat = path.rsplit(',', 1)
+                trends.setdefault(name, {})[stat] = dataset
+
         # -- channels ---------------------------
 
         try:
@@ -197,7 +246,16 @@ def read_data_archive(sourcefile):
 
         # -- timeseries -------------------------
 
-        for dataset in h5file.get('timeseries', {}).values():
+        for name, dataset in h5file.get('timeseries', {}).items():
+            pyramid = [(stat, TimeSeries.read(trend, format='hdf5')) for
+                       stat, trend in sorted(trends.get(name, {}).items())]
+            # skip the full data if the trends will do
+            if pyramid and str(pyramid[0][1].channel) in trends_only:
+                channel = get_channel(pyramid[0][1].channel)
+                for stat, trend in pyramid:
+                    trend.channel = channel
+                    _add_trend(trend, pyramid_key(channel.ndsname, stat))
+                continue
             ts = TimeSeries.read(dataset, format='hdf5')
             if (re.search(r'\.(rms|min|mean|max|n)\Z', ts.channel.name) and
                     ts.sample_rate.value == 1.0):
@@ -215,6 +273,15 @@ def read_data_archive(sourcefile):
                 globalv.DATA[ts.channel.ndsname].pop(-1)
                 t = globalv.DATA[ts.channel.ndsname][-1].span[-1]
                 add_timeseries(ts.crop(start=t), key=ts.channel.ndsname)
+            for stat, trend in pyramid:
+                trend.channel = ts.channel
+                _add_trend(trend, pyramid_key(ts.channel.ndsname, stat))
+
+        # -- filter state -----------------------
+
+        for key, dataset in h5file.get('filter-state', {}).items():
+            FILTER_STATE[key] = (float(dataset.attrs['sample_rate']),
+                                 float(dataset.attrs['end']), dataset[()])
 
         # -- statevector -- ---------------------
 
@@ -233,6 +300,8 @@ def read_data_archive(sourcefile):
                 spec = Spectrogram.read(dataset, format='hdf5')
                 spec.channel = get_channel(spec.channel)
                 add_(spec, key=key)
+        for key, group in h5file.get('spectrum-sketch', {}).items():
+            add_spectrum_sketch(SpectrumSketch.read(group), key)
 
         # -- segments ---------------------------
 
@@ -247,6 +316,95 @@ def read_data_archive(sourcefile):
             load_table(dataset)
 
 
+def write_pyramid(timeseries, name, parent):
+    """Add downsampled trends of a `TimeSeries` to the given HDF5 group
+
+    Bins are aligned to the start of the UTC day containing the data (the
+    span of a daily archive), so that no partial bins are written at the
+    day boundaries.
+
+    Parameters
+    ----------
+    timeseries : `~gwpy.timeseries.TimeSeries`
+        the data to trend
+
+    name : `str`
+        the name of the archived ``timeseries`` dataset
+
+    parent : `h5py.Group`
+        the ``pyramid`` group in which to add the trends, one sub-group
+        is created for each level
+    """
+    origin = from_gps(timeseries.t0.value).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    origin = float(to_gps(origin))
+    for level in PYRAMID_LEVELS:
+        for stat in PYRAMID_STATISTICS:
+            trend = downsample_timeseries(timeseries, level, statistic=stat,
+                                          origin=origin)
+            if trend is None:
+                break
+            _write_object(trend, parent.require_group(str(level)),
+                          path='%s,%s' % (name, stat), format='hdf5')
+
+
+def get_pyramid_level(h5file, resolution):
+    """Returns the coarsest trend level in an archive that meets a resolution
+
+    Returns
+    -------
+    level : `int`, `None`
+        the chosen level, or `None` if no suitable trends were archived
+    """
+    if resolution is None:
+        return None
+    levels = [int(level) for level in h5file.get('pyramid', {}) if
+              int(level) <= resolution]
+    if levels:
+        return max(levels)
+    return None
+
+
+def find_trend_channels(tabs):
+    """Find the channels whose data are only shown as time-series
+
+    Archived trends can be drawn in place of the full data for a channel
+    shown on its own in `~gwsumm.plot.TimeSeriesDataPlot` figures, so the
+    full data needn't be read for channels that aren't used by any other
+    plot, tab, or state definition.
+
+    Parameters
+    ----------
+    tabs : `list` of `~gwsumm.tabs.Tab`
+        the tabs to process
+
+    Returns
+    -------
+    channels : `set` of `str`
+        the names of those channels for which trends suffice
+    """
+    trends = set()
+    full = set()
+    for tab in tabs:
+        plots = getattr(tab, 'plots', []) + getattr(tab, 'subplots', [])
+        for plot in plots:
+            if getattr(plot, 'type', None) == 'timeseries':
+                for _, clist in plot.get_channel_groups():
+                    (trends if len(clist) == 1 else full).update(
+                        map(str, clist))
+            else:
+                full.update(map(str, getattr(plot, 'channels', [])))
+        for attr in ('channel', 'channels'):
+            value = getattr(tab, attr, None)
+            if isinstance(value, (list, tuple)):
+                full.update(map(str, value))
+            elif value is not None:
+                full.add(str(value))
+        for state in getattr(tab, 'states', []):
+            full.update(re_channel.findall(state.definition or ''))
+    return trends - full
+
+
 def backup_existing_archive(filename, suffix='.h5',
                             prefix='gw_summary_archive_', dir=None):
     """Create a copy of an existing archive.
@@ -287,6 +445,29 @@ def find_daily_archives(start, end, ifo, tag, basedir=os.curdir):
 
 # -- utility methods --------------------------------------------------------
 
+def _add_trend(trend, key):
+    """Add an archived trend to the global memory cache
+
+    Bins overlapping trends already stored for this key (e.g. partial bins
+    at the boundary between daily archives) are dropped.
+    """
+    dt = trend.dt.value
+    start, end = map(float, trend.span)
+    try:
+        stored = globalv.DATA[key].segments
+    except KeyError:
+        stored = SegmentList()
+    for seg in stored:
+        if seg[0] <= start < seg[1]:
+            start = min(start + ceil((seg[1] - start) / dt) * dt, end)
+        elif start < seg[0] < end:
+            end = max(end - ceil((end - seg[0]) / dt) * dt, start)
+    i = int(round((start - trend.span[0]) / dt))
+    j = int(round((end - trend.span[0]) / dt))
+    if j > i:
+        add_timeseries(trend[i:j], key=key)
+
+
 def _write_object(data, *args, **kwargs):
     """Internal method to write something to HDF5 with error handling
     """
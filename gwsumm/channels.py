@@ -20,6 +20,7 @@
 """
 
 import re
+import threading
 from functools import wraps
 
 from astropy.units import Unit
@@ -40,6 +41,10 @@ re_channel = re.compile(r'[A-Z]\d:[a-zA-Z0-9]+'  # core channel section L1:TEST
                         r'(?:,[a-z-]+)?')  # NDS channel type
 
 
+# lock for access to globalv.CHANNELS from multiple threads
+CHANNELS_LOCK = threading.RLock()
+
+
 # -- channel creation ---------------------------------------------------------
 
 def _match(channel):
@@ -113,13 +118,16 @@ def _update_dependent(channel):
 
 def _with_update_dependent(func):
     """Decorate ``func`` to call `_update_dependent()` upon exit
+
+    The whole call holds the `CHANNELS_LOCK`.
     """
     @wraps(func)
     def wrapped_func(*args, **kwargs):
         _update = kwargs.pop('find_parent', True)
-        out = func(*args, **kwargs)
-        if _update and out.trend:
-            out = _update_dependent(out)
+        with CHANNELS_LOCK:
+            out = func(*args, **kwargs)
+            if _update and out.trend:
+                out = _update_dependent(out)
         return out
     return wrapped_func
 
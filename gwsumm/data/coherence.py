@@ -34,9 +34,11 @@ from gwpy.frequencyseries import FrequencySeries
 from gwpy.spectrogram import SpectrogramList
 
 from .. import globalv
+from ..store import SpectrogramStore
 from ..utils import (vprint, safe_eval)
 from ..channels import get_channel
-from .utils import (use_segmentlist, get_fftparams, make_globalv_key)
+from .utils import (use_segmentlist, get_fftparams, make_globalv_key,
+                    cast_for_storage)
 from .timeseries import (get_timeseries, get_timeseries_dict)
 
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
@@ -109,7 +111,7 @@ def _get_coherence_spectrogram(channel_pair, segments, config=None,
         fftparams.pop(fftkey, None)
 
     # if there are no existing spectrogram, initialize as a list
-    globalv.SPECTROGRAMS.setdefault(key, SpectrogramList())
+    globalv.SPECTROGRAMS.setdefault(key, SpectrogramStore())
 
     # XXX HACK: use dummy timeseries to find lower sampling rate
     if len(segments) > 0:
@@ -128,7 +130,7 @@ def _get_coherence_spectrogram(channel_pair, segments, config=None,
 
     # initialize component lists if they don't exist yet
     for ck in ckeys:
-        globalv.COHERENCE_COMPONENTS.setdefault(ck, SpectrogramList())
+        globalv.COHERENCE_COMPONENTS.setdefault(ck, SpectrogramStore())
 
     # get data if query=True or if there are new segments
     query &= abs(new) != 0
@@ -246,8 +248,8 @@ def _get_coherence_spectrogram(channel_pair, segments, config=None,
                 _get_from_list(globalv.COHERENCE_COMPONENTS[ck], seg) for
                 ck in ckeys]
             csg = abs(cxy)**2 / cxx / cyy
-            globalv.SPECTROGRAMS[key].append(csg)
-            globalv.SPECTROGRAMS[key].coalesce()
+            csg = cast_for_storage(csg, channel=channel1)
+            globalv.SPECTROGRAMS[key].add(csg)
 
     if not return_:
         return
@@ -255,38 +257,13 @@ def _get_coherence_spectrogram(channel_pair, segments, config=None,
     elif return_components:
 
         # return list of component spectrogram lists
-        out = [SpectrogramList(), SpectrogramList(), SpectrogramList()]
-        for comp in components:
-            index = components.index(comp)
-            ckey = ckeys[index]
-            for specgram in globalv.COHERENCE_COMPONENTS[ckey]:
-                for seg in segments:
-                    if abs(seg) < specgram.dt.value:
-                        continue
-                    if specgram.span.intersects(seg):
-                        common = specgram.span & type(seg)(
-                                     seg[0], seg[1] + specgram.dt.value)
-                        s = specgram.crop(*common)
-                        if s.shape[0]:
-                            out[index].append(s)
-            out[index] = out[index].coalesce()
-        return out
+        return [globalv.COHERENCE_COMPONENTS[ckey].crop_segments(
+                    segments, pad=True) for ckey in ckeys]
 
     else:
 
         # return list of coherence spectrograms
-        out = SpectrogramList()
-        for specgram in globalv.SPECTROGRAMS[key]:
-            for seg in segments:
-                if abs(seg) < specgram.dt.value:
-                    continue
-                if specgram.span.intersects(seg):
-                    common = specgram.span & type(seg)(
-                                 seg[0], seg[1] + specgram.dt.value)
-                    s = specgram.crop(*common)
-                    if s.shape[0]:
-                        out.append(s)
-        return out.coalesce()
+        return globalv.SPECTROGRAMS[key].crop_segments(segments, pad=True)
 
 
 def get_coherence_spectrum(channel_pair, segments, config=None,
@@ -379,10 +356,9 @@ def add_coherence_component_spectrogram(specgram, key=None, coalesce=True):
     """
     if key is None:
         key = specgram.name or str(specgram.channel)
-    globalv.COHERENCE_COMPONENTS.setdefault(key, SpectrogramList())
-    globalv.COHERENCE_COMPONENTS[key].append(specgram)
-    if coalesce:
-        globalv.COHERENCE_COMPONENTS[key].coalesce()
+    globalv.COHERENCE_COMPONENTS.setdefault(key, SpectrogramStore())
+    specgram = cast_for_storage(specgram)
+    globalv.COHERENCE_COMPONENTS[key].add(specgram, coalesce=coalesce)
 
 
 @use_segmentlist
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+
+"""FFT backends, and caches of windows and plans, for the spectral layer
+
+The active backend is used by `gwsumm.data.welch` for all batched
+spectrograms, and can be chosen with the ``[general] fft-backend``
+configuration option:
+
+==========  ================================================================
+Backend     Description
+==========  ================================================================
+``scipy``   `scipy.fft` (the default), with ``fft-workers`` threads per FFT
+``pyfftw``  FFTW via `pyfftw`, with plan wisdom stored in the ``fft-wisdom``
+            file across runs; this backend is also installed as the global
+            `scipy.fft` backend, so is used by all `gwpy` spectral methods
+``lal``     `lal.REAL8ForwardFFT`, with plans cached by `gwpy` for the
+            lifetime of the process
+==========  ================================================================
+"""
+
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+
+import numpy
+
+from scipy import signal
+
+from gwpy.signal.window import canonical_name
+
+from ..utils import vprint
+
+try:
+    from scipy import fft as scipy_fft
+except ImportError:  # scipy < 1.4
+    scipy_fft = None
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+#: cache of window arrays, keyed by ``(length, window)``
+WINDOWS = OrderedDict()
+
+#: maximum number of windows to cache
+WINDOW_CACHE_SIZE = 64
+
+#: cache of median bias factors, keyed by number of averages
+MEDIAN_BIAS = {}
+
+
+# -- caches -------------------------------------------------------------------
+
+def get_window(window, length):
+    """Return the window array of the given length, from the cache if possible
+
+    Parameters
+    ----------
+    window : `str`, `tuple`
+        the name of the window, or a ``(name, param)`` tuple, as accepted by
+        :func:`scipy.signal.get_window`
+
+    length : `int`
+        the number of samples in the window
+
+    Returns
+    -------
+    window : `numpy.ndarray`
+        the window array, this is shared between callers, so is read-only
+    """
+    if isinstance(window, str):
+        window = canonical_name(window)
+    key = (length, window)
+    try:
+        WINDOWS.move_to_end(key)
+        return WINDOWS[key]
+    except KeyError:
+        pass
+    win = signal.get_window(window, length)
+    win.flags.writeable = False
+    WINDOWS[key] = win
+    while len(WINDOWS) > WINDOW_CACHE_SIZE:
+        WINDOWS.popitem(last=False)
+    return win
+
+
+def median_bias(n):
+    """Return the bias factor of the median of ``n`` PSD estimates
+
+    This matches the correction applied by :func:`scipy.signal.welch`
+    with ``average='median'``.
+    """
+    try:
+        return MEDIAN_BIAS[n]
+    except KeyError:
+        ii_2 = 2 * numpy.arange(1., (n - 1) // 2 + 1)
+        MEDIAN_BIAS[n] = 1 + numpy.sum(1. / (ii_2 + 1) - 1. / ii_2)
+        return MEDIAN_BIAS[n]
+
+
+# -- backends -----------------------------------------------------------------
+
+class FFTBackend(object):
+    """Base class for FFT backends
+
+    Parameters
+    ----------
+    workers : `int`, optional
+        the number of threads to use for each FFT, if supported
+
+    wisdom : `str`, optional
+        the path of a file in which to persist plan wisdom, if supported
+    """
+    name = None
+
+    def __init__(self, workers=1, wisdom=None):
+        self.workers = int(workers)
+        self.wisdom = wisdom and os.path.expanduser(wisdom)
+
+    def rfft(self, x, axis=-1):
+        """Return the one-sided FFT of real input along the given axis
+        """
+        raise NotImplementedError("%s has no rfft method"
+                                  % type(self).__name__)
+
+    def activate(self):
+        """Install this backend for use by other libraries
+        """
+        pass
+
+    def load_wisdom(self):
+        """Load plan wisdom from disk, returns `True` if wisdom was read
+        """
+        return False
+
+    def save_wisdom(self):
+        """Save plan wisdom to disk, returns `True` if wisdom was written
+        """
+        return False
+
+
+class ScipyBackend(FFTBackend):
+    """FFTs using `scipy.fft`
+
+    `scipy.fft` caches plans internally, so there is no wisdom to persist.
+    """
+    name = 'scipy'
+
+    def rfft(self, x, axis=-1):
+        if scipy_fft is None:
+            return numpy.fft.rfft(x, axis=axis)
+        return scipy_fft.rfft(x, axis=axis, workers=self.workers)
+
+
+class PyFFTWBackend(FFTBackend):
+    """FFTs using FFTW via `pyfftw`
+
+    Parameters
+    ----------
+    effort : `str`, optional
+        the FFTW planner effort, with persistent ``wisdom`` the cost of
+        ``'FFTW_MEASURE'`` (or higher) is only paid once
+    """
+    name = 'pyfftw'
+
+    def __init__(self, workers=1, wisdom=None, effort='FFTW_MEASURE'):
+        super(PyFFTWBackend, self).__init__(workers=workers, wisdom=wisdom)
+        import pyfftw
+        import pyfftw.interfaces.cache
+        import pyfftw.interfaces.scipy_fft
+        pyfftw.interfaces.cache.enable()
+        self._pyfftw = pyfftw
+        self._fft = pyfftw.interfaces.scipy_fft
+        self.effort = effort
+
+    def rfft(self, x, axis=-1):
+        return self._fft.rfft(x, axis=axis, workers=self.workers,
+                              planner_effort=self.effort)
+
+    def activate(self):
+        if scipy_fft is not None:
+            scipy_fft.set_global_backend(self._fft)
+
+    def load_wisdom(self):
+        if not self.wisdom or not os.path.isfile(self.wisdom):
+            return False
+        with open(self.wisdom, 'rb') as f:
+            self._pyfftw.import_wisdom(pickle.load(f))
+        return True
+
+    def save_wisdom(self):
+        if not self.wisdom:
+            return False
+        # write to a temporary file first, so that concurrent jobs never
+        # read a partial file
+        dirname = os.path.dirname(os.path.abspath(self.wisdom))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(self._pyfftw.export_wisdom(), f)
+        os.rename(tmp, self.wisdom)
+        return True
+
+
+class LALBackend(FFTBackend):
+    """FFTs using `lal.REAL8ForwardFFT`
+
+    LAL does not expose its FFTW wisdom, so plans are only cached for the
+    lifetime of the process.
+
+    Parameters
+    ----------
+    level : `int`, optional
+        the LAL FFT plan level, higher levels take longer to plan, but
+        produce faster FFTs
+    """
+    name = 'lal'
+
+    def __init__(self, workers=1, wisdom=None, level=None):
+        super(LALBackend, self).__init__(workers=workers, wisdom=wisdom)
+        from gwpy.signal.fft import lal as fft_lal
+        self._fft_lal = fft_lal
+        self.level = level
+
+    def activate(self):
+        if self.level is not None:
+            self._fft_lal.LAL_FFTPLAN_LEVEL = self.level
+
+    def rfft(self, x, axis=-1):
+        import lal
+        x = numpy.moveaxis(x, axis, -1)
+        n = x.shape[-1]
+        if x.dtype == numpy.float32:
+            create, ccreate, fft = (lal.CreateREAL4Vector,
+                                    lal.CreateCOMPLEX8Vector,
+                                    lal.REAL4ForwardFFT)
+        else:
+            x = x.astype('float64', copy=False)
+            create, ccreate, fft = (lal.CreateREAL8Vector,
+                                    lal.CreateCOMPLEX16Vector,
+                                    lal.REAL8ForwardFFT)
+        plan = self._fft_lal.generate_fft_plan(n, dtype=x.dtype)
+        invec = create(n)
+        outvec = ccreate(n // 2 + 1)
+        flat = x.reshape(-1, n)
+        out = numpy.empty((flat.shape[0], n // 2 + 1),
+                          dtype=outvec.data.dtype)
+        for i, row in enumerate(flat):
+            invec.data = row
+            fft(outvec, invec, plan)
+            out[i] = outvec.data
+        return numpy.moveaxis(out.reshape(x.shape[:-1] + (n // 2 + 1,)),
+                              -1, axis)
+
+
+BACKENDS = OrderedDict((b.name, b) for b in (
+    ScipyBackend,
+    PyFFTWBackend,
+    LALBackend,
+))
+
+BACKEND = ScipyBackend()
+
+
+def plan_level(duration):
+    """Return the LAL FFT plan level appropriate for a job duration
+
+    Longer jobs perform more FFTs of each size, so are worth planning more
+    carefully.
+    """
+    if duration > 200000:
+        return 3
+    if duration > 40000:
+        return 2
+    return 1
+
+
+def get_backend():
+    """Return the active `FFTBackend`
+    """
+    return BACKEND
+
+
+def set_backend(name, **kwargs):
+    """Set the active `FFTBackend`
+
+    Parameters
+    ----------
+    name : `str`
+        the name of the backend, one of the keys of `BACKENDS`
+
+    **kwargs
+        other keyword arguments are passed to the backend constructor
+
+    Returns
+    -------
+    backend : `FFTBackend`
+        the new active backend
+    """
+    global BACKEND
+    try:
+        backend = BACKENDS[name.lower()](**kwargs)
+    except KeyError:
+        raise ValueError("Unknown FFT backend %r, choose one of: %s"
+                         % (name, ', '.join(BACKENDS)))
+    if backend.load_wisdom():
+        vprint("    Loaded FFT wisdom from %s\n" % backend.wisdom)
+    backend.activate()
+    BACKEND = backend
+    return backend
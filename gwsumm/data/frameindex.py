@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Persistent on-disk index of GWF frame files
+
+The `FrameIndex` records the path and GPS segment of each frame file of
+a given type in an SQLite database, so that repeated frame lookups can be
+answered locally, rather than by querying the datafind server each time.
+
+GWF files are stored in 'epoch' directories, named by the observatory,
+frametype, and the leading digits of the GPS times they contain, e.g.::
+
+    /archive/frames/H1_R/H-H1_R-12345/H-H1_R-1234500000-64.gwf
+
+The index records the parent directory (the 'root') of each epoch
+directory it learns about, and refreshes itself by scanning only those
+epoch directories that are newer than, or the same as, the newest
+directory it already knows about.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+
+from gwpy.io.cache import file_segment
+from gwpy.segments import (Segment, SegmentList)
+
+from .. import globalv
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+re_epoch_dir = re.compile(r'\A(?P<obs>[A-Z]+)-(?P<tag>\S+)-(?P<epoch>\d+)\Z')
+re_gwf = re.compile(r'\A[A-Z]+-\S+-\d+-\d+\.gwf\Z')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    ifo TEXT, frametype TEXT, start REAL, end REAL, path TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS frames_span ON frames (ifo, frametype, start);
+CREATE TABLE IF NOT EXISTS roots (
+    ifo TEXT, frametype TEXT, root TEXT,
+    UNIQUE (ifo, frametype, root)
+);
+CREATE TABLE IF NOT EXISTS epochs (
+    root TEXT, name TEXT,
+    UNIQUE (root, name)
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    ifo TEXT, frametype TEXT, start REAL, end REAL
+);
+"""
+
+INDEXES = {}
+
+# time (seconds) after which a frame listing is assumed to be complete,
+# more recent data may still be written after a query
+LATENCY = 3600
+
+
+def get_frame_index(path):
+    """Return the `FrameIndex` for the given database path
+
+    Each database is only opened once per process.
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    try:
+        return INDEXES[path]
+    except KeyError:
+        INDEXES[path] = FrameIndex(path)
+        return INDEXES[path]
+
+
+def _epoch_segment(name):
+    """Return the GPS `Segment` covered by an epoch directory
+    """
+    epoch = re_epoch_dir.match(name).group('epoch')
+    scale = 10 ** (10 - len(epoch))
+    start = int(epoch) * scale
+    return Segment(start, start + scale)
+
+
+def complete_segment(segment, paths, latency=LATENCY):
+    """Return the part of a segment for which a list of files is complete
+
+    The list is assumed complete up to the end of the last file, or up to
+    ``latency`` seconds before `globalv.NOW`, whichever is later.
+
+    Returns
+    -------
+    complete : `~gwpy.segments.Segment`, `None`
+        the complete part of ``segment``, or `None`
+    """
+    start, end = segment
+    complete = min(end, globalv.NOW - latency)
+    for path in paths:
+        complete = max(complete, min(end, file_segment(path)[1]))
+    if complete <= start:
+        return None
+    return Segment(start, complete)
+
+
+class FrameIndex(object):
+    """An SQLite database of GWF file paths and their GPS segments
+
+    Each thread uses its own connection to the database, so a single
+    index can be shared by the threads of a process.
+
+    Parameters
+    ----------
+    path : `str`
+        the path of the database file, this will be created if needed
+    """
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._connections = []
+        self._connection.executescript(SCHEMA)
+        self._connection.commit()
+
+    @property
+    def _connection(self):
+        """The connection to the database for the current thread
+        """
+        try:
+            return self._local.connection
+        except AttributeError:
+            conn = self._local.connection = sqlite3.connect(
+                self.path, timeout=60, check_same_thread=False)
+            with self._lock:
+                self._connections.append(conn)
+            return conn
+
+    def close(self):
+        """Close all connections to the database
+        """
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    # -- write methods ------------------
+
+    def add_files(self, ifo, frametype, paths):
+        """Add a number of GWF files to the index
+
+        The parent directory of each file's epoch directory is recorded as a
+        root to scan in subsequent refreshes.
+
+        Returns
+        -------
+        nnew : `int`
+            the number of files not already in the index
+        """
+        rows = []
+        roots = set()
+        epochs = set()
+        for path in paths:
+            seg = file_segment(path)
+            rows.append((ifo, frametype, float(seg[0]), float(seg[1]), path))
+            root, epoch = os.path.split(os.path.dirname(path))
+            if re_epoch_dir.match(epoch):
+                roots.add(root)
+                epochs.add((root, epoch))
+        with self._connection as conn:
+            nnew = conn.executemany("INSERT OR IGNORE INTO frames VALUES "
+                                    "(?, ?, ?, ?, ?)", rows).rowcount
+            conn.executemany("INSERT OR IGNORE INTO roots VALUES (?, ?, ?)",
+                             [(ifo, frametype, root) for root in roots])
+            conn.executemany("INSERT OR IGNORE INTO epochs VALUES (?, ?)",
+                             epochs)
+        return nnew
+
+    def add_coverage(self, ifo, frametype, segment):
+        """Record that the index is complete for the given segment
+        """
+        with self._lock:
+            coverage = self.coverage(ifo, frametype)
+            coverage.append(Segment(*map(float, segment)))
+            coverage.coalesce()
+            with self._connection as conn:
+                conn.execute("DELETE FROM coverage WHERE ifo = ? AND "
+                             "frametype = ?", (ifo, frametype))
+                conn.executemany(
+                    "INSERT INTO coverage VALUES (?, ?, ?, ?)",
+                    [(ifo, frametype, float(seg[0]), float(seg[1]))
+                     for seg in coverage])
+
+    def refresh(self, ifo, frametype):
+        """Scan new epoch directories for the given frametype
+
+        Only the newest epoch directory already known to the index (which
+        may have received new files), and any newer directories, are read.
+
+        Returns
+        -------
+        nfiles : `int`
+            the number of new files found in the scanned directories
+        """
+        nfiles = 0
+        roots = [row[0] for row in self._connection.execute(
+            "SELECT root FROM roots WHERE ifo = ? AND frametype = ?",
+            (ifo, frametype))]
+        for root in roots:
+            try:
+                dirs = sorted(d for d in os.listdir(root) if
+                              re_epoch_dir.match(d))
+            except OSError:
+                continue
+            newest = self._connection.execute(
+                "SELECT MAX(name) FROM epochs WHERE root = ?",
+                (root,)).fetchone()[0] or ''
+            for name in dirs:
+                if name < newest:
+                    continue
+                epochdir = os.path.join(root, name)
+                paths = [os.path.join(epochdir, f) for
+                         f in os.listdir(epochdir) if re_gwf.match(f)]
+                nfiles += self.add_files(ifo, frametype, paths)
+                with self._connection as conn:
+                    conn.execute("INSERT OR IGNORE INTO epochs VALUES (?, ?)",
+                                 (root, name))
+                # the index is complete for this epoch, up to the latest
+                # file, more files may still be written to recent epochs
+                seg = _epoch_segment(name)
+                seg = complete_segment(
+                    Segment(seg[0], min(seg[1], globalv.NOW)), paths)
+                if seg is not None:
+                    self.add_coverage(ifo, frametype, seg)
+        return nfiles
+
+    # -- read methods -------------------
+
+    def coverage(self, ifo, frametype):
+        """Return the segments for which this index is complete
+        """
+        return SegmentList(Segment(*row) for row in self._connection.execute(
+            "SELECT start, end FROM coverage WHERE ifo = ? AND frametype = ?",
+            (ifo, frametype))).coalesce()
+
+    def find(self, ifo, frametype, start, end):
+        """Find all indexed files overlapping the given GPS interval
+
+        Returns
+        -------
+        paths : `list` of `str`
+            the paths of all matching files, sorted by start time
+
+        missing : `~gwpy.segments.SegmentList`
+            the parts of the ``[start, end)`` interval for which the index
+            is not known to be complete
+        """
+        paths = [row[0] for row in self._connection.execute(
+            "SELECT path FROM frames WHERE ifo = ? AND frametype = ? "
+            "AND start < ? AND end > ? ORDER BY start",
+            (ifo, frametype, float(end), float(start)))]
+        span = SegmentList([Segment(start, end)])
+        return paths, span - self.coverage(ifo, frametype)
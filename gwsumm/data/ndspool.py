@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Pooled connections to NDS2 servers
+
+Opening an `nds2.connection` requires a round-trip (and authentication)
+with the server, so the `NDSConnectionPool` keeps connections open for
+re-use by all data requests in a process, keyed by
+``(host, port, protocol)``.
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from gwpy.io import nds2 as io_nds2
+from gwpy.segments import Segment
+from gwpy.timeseries import (TimeSeriesDict, TimeSeriesList,
+                             StateVector, StateVectorList)
+
+from ..utils import vprint
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+
+def _connect(host, port=None, protocol=None):
+    """Open a new `nds2.connection`
+    """
+    if protocol is None:
+        return io_nds2.connect(host, port)
+    import nds2
+    return nds2.connection(host, port, int(protocol))
+
+
+class NDSConnectionPool(object):
+    """A thread-safe pool of open NDS2 connections
+
+    Parameters
+    ----------
+    connect : `callable`, optional
+        the function used to open a new connection, taking
+        ``(host, port, protocol)`` arguments, defaults to opening an
+        `nds2.connection`
+
+    maxsize : `int`, optional
+        the maximum number of idle connections to keep open for each server
+    """
+    def __init__(self, connect=_connect, maxsize=4):
+        self._connect = connect
+        self.maxsize = maxsize
+        self._idle = dict()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    @staticmethod
+    def _key(host, port=None, protocol=None):
+        return (host, None if port is None else int(port),
+                None if protocol is None else int(protocol))
+
+    @staticmethod
+    def is_healthy(connection):
+        """Returns `True` if the given connection looks usable
+        """
+        try:
+            connection.get_protocol()
+        except Exception:
+            return False
+        return True
+
+    def acquire(self, host, port=None, protocol=None):
+        """Return an open connection to the given server
+
+        An idle connection is re-used if one passes the health check,
+        otherwise a new connection is opened.
+        """
+        key = self._key(host, port, protocol)
+        while True:
+            with self._lock:
+                try:
+                    connection = self._idle.get(key, []).pop()
+                except IndexError:
+                    break
+            if self.is_healthy(connection):
+                self.reused += 1
+                return connection
+            self.discard(connection)
+        connection = self._connect(*key)
+        with self._lock:
+            self.opened += 1
+        return connection
+
+    def release(self, connection, host, port=None, protocol=None):
+        """Return a connection to the pool for re-use
+        """
+        key = self._key(host, port, protocol)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append(connection)
+                return
+        self.discard(connection)
+
+    @staticmethod
+    def discard(connection):
+        """Close a connection, ignoring any errors
+        """
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self, host, port=None, protocol=None):
+        """Context manager to borrow a connection from this pool
+
+        If an exception is raised in the context, the connection is
+        closed, rather than returned to the pool.
+        """
+        connection = self.acquire(host, port=port, protocol=protocol)
+        try:
+            yield connection
+        except Exception:
+            self.discard(connection)
+            raise
+        else:
+            self.release(connection, host, port=port, protocol=protocol)
+
+    def close(self):
+        """Close all idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, dict()
+        for connections in idle.values():
+            for connection in connections:
+                self.discard(connection)
+
+
+POOL = NDSConnectionPool()
+
+
+def fetch(channels, start, end, host, port=None, protocol=None, pool=POOL,
+          chunk=None, nproc=1, series_class=TimeSeriesDict, **kwargs):
+    """Fetch data from an NDS2 server using pooled connections
+
+    Parameters
+    ----------
+    channels : `list` of `str`
+        the names of the channels to fetch
+
+    start : `int`
+        the GPS start time of the request
+
+    end : `int`
+        the GPS end time of the request
+
+    host : `str`
+        the name of the NDS2 server
+
+    port : `int`, optional
+        the port on which to connect
+
+    protocol : `int`, optional
+        the NDS protocol version to use
+
+    pool : `NDSConnectionPool`, optional
+        the pool from which to take connections
+
+    chunk : `int`, optional
+        the maximum duration (seconds) of a single request, longer requests
+        are split into chunks, and fetched concurrently over several
+        connections
+
+    nproc : `int`, optional
+        the number of chunks to fetch at once
+
+    series_class : `type`, optional
+        the `dict` class with which to fetch data, defaults to
+        `~gwpy.timeseries.TimeSeriesDict`
+
+    **kwargs
+        other keyword arguments are passed to ``series_class.fetch``
+
+    Returns
+    -------
+    data : ``series_class``
+        the data for each channel
+    """
+    segment = Segment(int(start), int(end))
+    if chunk:
+        chunks = [Segment(t, min(t + int(chunk), segment[1])) for
+                  t in range(segment[0], segment[1], int(chunk))]
+    else:
+        chunks = [segment]
+
+    def _fetch(seg):
+        # try once more on a new connection, in case the server has
+        # dropped the pooled one
+        for attempt in (0, 1):
+            try:
+                with pool.connection(host, port=port,
+                                     protocol=protocol) as connection:
+                    return series_class.fetch(channels, seg[0], seg[1],
+                                              connection=connection,
+                                              **kwargs)
+            except RuntimeError:
+                if attempt:
+                    raise
+
+    nthreads = max(min(int(nproc), len(chunks)), 1)
+    if nthreads == 1:
+        results = list(map(_fetch, chunks))
+    else:
+        vprint("        fetching %d chunks over %d connections\n"
+               % (len(chunks), nthreads))
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            results = list(executor.map(_fetch, chunks))
+
+    # join chunks (once per channel, appending to a growing copy of each
+    # series would copy the data once per chunk)
+    if issubclass(series_class.EntryClass, StateVector):
+        ListClass = StateVectorList
+    else:
+        ListClass = TimeSeriesList
+    chunked = OrderedDict()
+    for tsd in results:
+        for name, series in tsd.items():
+            chunked.setdefault(name, ListClass()).append(series)
+    out = series_class()
+    for name, serieslist in chunked.items():
+        if len(serieslist) == 1:
+            out[name] = serieslist[0]
+        else:
+            out[name] = serieslist.join()
+    return out
@@ -20,9 +20,12 @@
 """
 
 import re
+import warnings
 
 import numpy
 
+from astropy import (constants, units)
+
 from gwpy import astro
 from gwpy.timeseries import (TimeSeries, TimeSeriesList)
 from gwpy.frequencyseries import FrequencySeries
@@ -36,6 +39,13 @@ from .spectral import get_spectrogram
 
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
 
+#: keyword arguments understood by each range kernel
+INSPIRAL_KWARGS = ('snr', 'mass1', 'mass2', 'fmin', 'fmax', 'horizon')
+BURST_KWARGS = ('snr', 'energy', 'fmin', 'fmax')
+
+#: cache of range kernels, keyed by frequency grid and range parameters
+RANGE_KERNELS = {}
+
 
 def get_range_channel(channel, **rangekwargs):
     """Return the meta-channel name used to store range data
@@ -83,11 +93,137 @@ def get_range(channel, segments, config=None, cache=None,
         for sg in spectrograms:
             ts = TimeSeries(numpy.zeros(sg.shape[0],), unit='Mpc',
                             epoch=sg.epoch, dx=sg.dx, channel=key)
-            for i in range(sg.shape[0]):
-                psd = sg[i]
-                psd = FrequencySeries(psd.value, f0=psd.x0, df=psd.dx)
-                ts[i] = range_func(psd, **rangekwargs)
+            kernel = get_range_kernel(sg.f0.value, sg.df.value, sg.shape[1],
+                                      **rangekwargs)
+            if kernel is not None:
+                ts[:] = apply_range_kernel(kernel, sg.value)
+            else:
+                for i in range(sg.shape[0]):
+                    psd = sg[i]
+                    psd = FrequencySeries(psd.value, f0=psd.x0, df=psd.dx)
+                    ts[i] = range_func(psd, **rangekwargs)
             add_timeseries(ts, key=key)
 
     if return_:
         return get_timeseries(key, segments, query=False)
+
+
+# -- range kernels ------------------------------------------------------------
+
+def _trapz_weights(x):
+    """Return the weights such that ``numpy.trapz(y, x) == weights @ y``
+    """
+    weights = numpy.zeros(x.size)
+    if x.size > 1:
+        dx = numpy.diff(x) / 2.
+        weights[:-1] += dx
+        weights[1:] += dx
+    return weights
+
+
+def get_range_kernel(f0, df, nfreq, **rangekwargs):
+    """Return the kernel that calculates range from PSDs on a frequency grid
+
+    Both the inspiral and burst ranges are integrals over the PSD of the
+    form ``(sum_i w_i * psd_i ** power) ** root``, so the weights ``w_i``
+    are calculated once for each frequency grid and set of range parameters,
+    reproducing :func:`gwpy.astro.inspiral_range` and
+    :func:`gwpy.astro.burst_range`.
+
+    Parameters
+    ----------
+    f0 : `float`
+        the frequency (Hz) of the first PSD bin
+
+    df : `float`
+        the frequency spacing (Hz) of the PSD bins
+
+    nfreq : `int`
+        the number of PSD bins
+
+    **rangekwargs
+        the range parameters, as accepted by the `gwpy.astro` functions
+
+    Returns
+    -------
+    kernel : `tuple`, `None`
+        ``(mask, weights, power, root)``, or `None` if the range parameters
+        are not supported
+    """
+    burst = 'energy' in rangekwargs
+    supported = BURST_KWARGS if burst else INSPIRAL_KWARGS
+    if set(rangekwargs) - set(supported):
+        return None
+    key = (f0, df, nfreq, burst, tuple(sorted(
+        (k, str(v)) for k, v in rangekwargs.items())))
+    try:
+        return RANGE_KERNELS[key]
+    except KeyError:
+        pass
+
+    freqs = f0 + df * numpy.arange(nfreq)
+    kwargs = dict((k, v) for k, v in rangekwargs.items() if
+                  k not in ('fmin', 'fmax'))
+    # (default frequency limits match those of gwpy.astro exactly)
+    if burst:
+        fmin = rangekwargs.get('fmin', 100) or f0
+        fmax = rangekwargs.get('fmax', 500) or f0 + df * nfreq
+        power, root = -1/2., 1/3.
+    else:
+        mtotal = units.Quantity(float(rangekwargs.get('mass1', 1.4)) +
+                                float(rangekwargs.get('mass2', 1.4)),
+                                'solMass')
+        fisco = (constants.c ** 3 / (constants.G * 6**1.5 * numpy.pi *
+                                     mtotal)).to('Hz').value
+        fmin = rangekwargs.get('fmin', None)
+        if fmin is None:
+            fmin = df
+        fmax = rangekwargs.get('fmax', None) or fisco
+        if fmax > fisco:
+            warnings.warn("Upper frequency bound greater than ISCO "
+                          "frequency of %s Hz, using ISCO" % fisco)
+            fmax = fisco
+        power, root = -1., 1/2.
+    mask = (freqs >= fmin) & (freqs < fmax)
+
+    # get the frequency-dependent part of the integrand for a unit PSD
+    ones = FrequencySeries(numpy.ones(mask.sum()), frequencies=freqs[mask],
+                           unit='1/Hz')
+    with numpy.errstate(divide='ignore'):  # 0 Hz
+        if burst:
+            factor = astro.burst_range_spectrum(ones, **kwargs).to(
+                'Mpc').value ** 3 / (fmax - fmin)
+            power *= 3
+        else:
+            factor = astro.inspiral_range_psd(ones, **kwargs).to(
+                'Mpc^2 / Hz').value
+    weights = factor * _trapz_weights(freqs[mask])
+
+    # drop bins that don't contribute (i.e. 0 Hz, whose integrand is
+    # always zero), so that they don't need to be evaluated
+    keep = weights != 0
+    mask[numpy.flatnonzero(mask)[~keep]] = False
+    weights = weights[keep]
+    RANGE_KERNELS[key] = kernel = (mask, weights, power, root)
+    return kernel
+
+
+def apply_range_kernel(kernel, psds):
+    """Calculate the range (Mpc) for each row of a 2-D array of PSDs
+
+    Parameters
+    ----------
+    kernel : `tuple`
+        the kernel for the PSD frequency grid, from `get_range_kernel`
+
+    psds : `numpy.ndarray`
+        a 2-D array of PSDs, one per row
+
+    Returns
+    -------
+    range : `numpy.ndarray`
+        the range for each row of ``psds``
+    """
+    mask, weights, power, root = kernel
+    with numpy.errstate(divide='ignore'):
+        return (psds[:, mask] ** power).dot(weights) ** root
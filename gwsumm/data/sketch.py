@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Mergeable percentile sketches of spectrogram data
+
+A `SpectrumSketch` records, for each frequency bin, a histogram of the
+(logarithm of the) values seen in a number of spectrograms.
+Percentiles can then be estimated from the histograms to a fixed relative
+precision, without holding the spectrograms in memory, and sketches for
+separate times (e.g. consecutive days) can be merged.
+"""
+
+import warnings
+
+import numpy
+
+from astropy import units
+
+from gwpy.frequencyseries import FrequencySeries
+from gwpy.segments import (Segment, SegmentList)
+
+from .. import globalv
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+#: default number of histogram bins per decade
+RESOLUTION = 100
+
+
+def _ordinal(n):
+    """Return the ordinal string for a number, e.g. ``'5th'``
+    """
+    n = int(n) if float(n).is_integer() else n
+    if isinstance(n, int) and n % 100 not in (11, 12, 13):
+        suffix = {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')
+    else:
+        suffix = 'th'
+    return '%s%s' % (n, suffix)
+
+
+class SpectrumSketch(object):
+    """A log-binned histogram of spectrogram values in each frequency bin
+
+    Each value ``x > 0`` is counted in bin ``floor(log10(x) * resolution)``
+    of its frequency's histogram, so percentiles are known to within a
+    factor of ``10 ** (1 / resolution)``; values ``<= 0`` are counted
+    separately, and non-finite values are ignored.
+
+    Parameters
+    ----------
+    resolution : `int`, optional
+        the number of histogram bins per decade
+
+    name : `str`, optional
+        the name of the spectrograms
+    """
+    def __init__(self, resolution=RESOLUTION, name=None):
+        self.resolution = int(resolution)
+        self.name = name
+        self.channel = None
+        self.unit = None
+        self.f0 = None
+        self.df = None
+        self.segments = SegmentList()
+        # number of spectra added (including those with non-finite values)
+        self.count = 0
+        # histogram counts, row i counts bins offset[i] onwards
+        self.counts = numpy.zeros((0, 0), dtype='uint32')
+        self.offset = numpy.zeros(0, dtype='int64')
+        self.zeros = numpy.zeros(0, dtype='uint32')
+
+    @property
+    def nfreq(self):
+        """The number of frequency bins in this sketch
+        """
+        return self.offset.size
+
+    # -- update -------------------------
+
+    def _init(self, nfreq, f0, df, unit, channel=None):
+        self.counts = numpy.zeros((nfreq, 0), dtype='uint32')
+        self.offset = numpy.zeros(nfreq, dtype='int64')
+        self.zeros = numpy.zeros(nfreq, dtype='uint32')
+        self.f0 = f0
+        self.df = df
+        self.unit = unit
+        self.channel = channel
+
+    def _check_compatible(self, nfreq, f0, df, unit):
+        if (nfreq, f0, df) != (self.nfreq, self.f0, self.df):
+            raise ValueError("Cannot combine spectral data with different "
+                             "frequency arrays")
+        if unit != self.unit:
+            warnings.warn("units do not match: %s vs %s, using %s"
+                          % (self.unit, unit, self.unit))
+
+    def _extend(self, lo, hi):
+        """Extend each histogram to cover bins ``lo`` to ``hi`` (inclusive)
+
+        Rows with ``lo > hi`` are left unchanged.
+        """
+        width = self.counts.shape[1]
+        filled = self.counts.any(axis=1)
+        new = lo <= hi
+        start = self.offset.copy()
+        end = self.offset + width - 1
+        empty = new & ~filled
+        start[empty] = lo[empty]
+        end[empty] = hi[empty]
+        both = new & filled
+        start[both] = numpy.minimum(start[both], lo[both])
+        end[both] = numpy.maximum(end[both], hi[both])
+        newwidth = int(max(width, (end - start).max() + 1 if
+                           self.nfreq else 0))
+        if newwidth == width and (start == self.offset).all():
+            return
+        shift = numpy.where(filled, self.offset - start, 0)
+        counts = numpy.zeros((self.nfreq, newwidth), dtype=self.counts.dtype)
+        cols = numpy.arange(width) + shift[:, None]
+        counts[numpy.arange(self.nfreq)[:, None], cols] = self.counts
+        self.counts = counts
+        self.offset = start
+
+    def update(self, specgram):
+        """Add the spectra from a `~gwpy.spectrogram.Spectrogram`
+
+        Parameters
+        ----------
+        specgram : `~gwpy.spectrogram.Spectrogram`
+            the data to add, the frequency array must match that of any
+            data already added
+        """
+        nfreq = specgram.shape[1]
+        f0 = specgram.f0.value
+        df = specgram.df.value
+        if self.f0 is None:
+            self._init(nfreq, f0, df, specgram.unit, specgram.channel)
+            if self.name is None:
+                self.name = specgram.name
+        else:
+            self._check_compatible(nfreq, f0, df, specgram.unit)
+        if not specgram.shape[0]:
+            return
+        self.count += specgram.shape[0]
+
+        values = numpy.asarray(specgram.value, dtype=float)
+        finite = numpy.isfinite(values)
+        positive = finite & (values > 0)
+        self.zeros += (finite & ~positive).sum(axis=0).astype('uint32')
+
+        # work out histogram bin for each value
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            idx = numpy.floor(numpy.log10(numpy.where(positive, values, 1)) *
+                              self.resolution).astype('int64')
+        big = numpy.iinfo('int64').max
+        self._extend(numpy.where(positive, idx, big).min(axis=0),
+                     numpy.where(positive, idx, -big).max(axis=0))
+
+        # and count
+        width = self.counts.shape[1]
+        flat = (idx - self.offset) + numpy.arange(nfreq) * width
+        self.counts += numpy.bincount(
+            flat[positive], minlength=self.counts.size).reshape(
+                self.counts.shape).astype('uint32')
+        self.segments |= SegmentList([Segment(*map(float, specgram.span))])
+
+    def merge(self, other):
+        """Merge the counts from another `SpectrumSketch` into this one
+
+        The two sketches should describe data from different times.
+        """
+        if other.resolution != self.resolution:
+            raise ValueError("Cannot merge sketches with different "
+                             "resolutions")
+        if other.f0 is None:
+            return self
+        if self.f0 is None:
+            self._init(other.nfreq, other.f0, other.df, other.unit,
+                       other.channel)
+            self.name = self.name or other.name
+        else:
+            self._check_compatible(other.nfreq, other.f0, other.df,
+                                   other.unit)
+        filled = other.counts.any(axis=1)
+        owidth = other.counts.shape[1]
+        self._extend(numpy.where(filled, other.offset, 1),
+                     numpy.where(filled, other.offset + owidth - 1, 0))
+        shift = numpy.where(filled, other.offset - self.offset, 0)
+        cols = numpy.arange(owidth) + shift[:, None]
+        self.counts[numpy.arange(self.nfreq)[:, None], cols] += other.counts
+        self.zeros += other.zeros
+        self.count += other.count
+        self.segments |= other.segments
+        return self
+
+    # -- query --------------------------
+
+    def percentile(self, percentile):
+        """Estimate a given percentile of the data in each frequency bin
+
+        Parameters
+        ----------
+        percentile : `float`
+            percentile (0 - 100) to estimate
+
+        Returns
+        -------
+        spectrum : `~gwpy.frequencyseries.FrequencySeries`
+            the percentile in each frequency bin, with `NaN` for empty bins
+        """
+        if self.f0 is None:
+            raise ValueError("cannot calculate percentile of empty sketch")
+        cumsum = numpy.cumsum(self.counts, axis=1, dtype='int64')
+        cumsum += self.zeros[:, None]
+        total = cumsum[:, -1] if cumsum.shape[1] else self.zeros
+        rank = percentile / 100. * (total - 1)
+        if cumsum.shape[1]:
+            idx = (cumsum > rank[:, None]).argmax(axis=1)
+        else:
+            idx = numpy.zeros(self.nfreq, dtype=int)
+        out = 10 ** ((self.offset + idx + .5) / self.resolution)
+        out[self.zeros > rank] = 0
+        out[total == 0] = numpy.nan
+        if self.name is not None:
+            name = '%s: %s percentile' % (self.name, _ordinal(percentile))
+        else:
+            name = None
+        return FrequencySeries(
+            out, f0=self.f0, df=self.df, unit=self.unit, name=name,
+            channel=self.channel,
+            epoch=self.segments[0][0] if self.segments else None)
+
+    # -- I/O ----------------------------
+
+    def write(self, parent, path):
+        """Write this sketch to a new group in an HDF5 file
+
+        Parameters
+        ----------
+        parent : `h5py.Group`
+            the parent group in which to write
+
+        path : `str`
+            the name of the new group
+        """
+        group = parent.create_group(path)
+        group.create_dataset('counts', data=self.counts, compression='gzip')
+        group.create_dataset('offset', data=self.offset)
+        group.create_dataset('zeros', data=self.zeros)
+        group.create_dataset('segments', data=numpy.array(
+            [tuple(seg) for seg in self.segments],
+            dtype=float).reshape(-1, 2))
+        group.attrs['resolution'] = self.resolution
+        group.attrs['count'] = self.count
+        for attr in ('f0', 'df'):
+            value = getattr(self, attr)
+            if value is not None:
+                group.attrs[attr] = value
+        for attr in ('name', 'channel', 'unit'):
+            value = getattr(self, attr)
+            if value is not None:
+                group.attrs[attr] = str(value)
+        return group
+
+    @classmethod
+    def read(cls, group):
+        """Read a sketch from an HDF5 group written by `SpectrumSketch.write`
+        """
+        from ..channels import get_channel
+        attrs = group.attrs
+        new = cls(resolution=attrs['resolution'], name=attrs.get('name'))
+        if 'f0' in attrs:
+            new._init(group['offset'].size, float(attrs['f0']),
+                      float(attrs['df']),
+                      units.Unit(attrs['unit']) if 'unit' in attrs else None,
+                      channel=attrs.get('channel'))
+            new.counts = group['counts'][()]
+            new.offset = group['offset'][()]
+            new.zeros = group['zeros'][()]
+            try:
+                new.count = int(attrs['count'])
+            except KeyError:  # written before the count was recorded
+                new.count = int(new.counts[0].sum() + new.zeros[0])
+        if new.channel is not None:
+            new.channel = get_channel(new.channel)
+        new.segments = SegmentList(Segment(*seg) for
+                                   seg in group['segments'][()])
+        return new
+
+
+def add_spectrum_sketch(sketch, key):
+    """Add a `SpectrumSketch` to the global memory cache
+
+    If a sketch is already stored for this key, and covers different times,
+    the two are merged, otherwise the sketch with the most data is kept.
+    """
+    try:
+        current = globalv.SPECTRUM_SKETCHES[key]
+    except KeyError:
+        globalv.SPECTRUM_SKETCHES[key] = sketch
+        return sketch
+    if not abs(current.segments & sketch.segments):
+        return current.merge(sketch)
+    if abs(sketch.segments) > abs(current.segments):
+        globalv.SPECTRUM_SKETCHES[key] = sketch
+        return sketch
+    return current
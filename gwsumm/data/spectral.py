@@ -36,17 +36,21 @@ from astropy import units
 
 from gwpy.segments import DataQualityFlag
 from gwpy.frequencyseries import FrequencySeries
-from gwpy.spectrogram import SpectrogramList
+from gwpy.spectrogram import (Spectrogram, SpectrogramList)
 
 from .. import (globalv, io)
+from ..store import SpectrogramStore
 from ..utils import (vprint, safe_eval)
 from ..channels import (
     get_channel,
     split_combination as split_channel_combination,
 )
-from .utils import (use_segmentlist, make_globalv_key, get_fftparams)
+from .utils import (use_segmentlist, make_globalv_key, get_fftparams,
+                    cast_for_storage)
 from .mathutils import (get_with_math, parse_math_definition)
 from .timeseries import (get_timeseries, get_timeseries_dict)
+from .sketch import SpectrumSketch
+from .welch import (BATCH_METHODS, map_welch)
 
 OPERATOR = {
     '*': operator.mul,
@@ -95,22 +99,7 @@ def _get_spectrogram(channel, segments, config=None, cache=None,
                      frametype=None, nproc=1,
                      datafind_error='raise', **fftparams):
     channel = get_channel(channel)
-
-    # if we aren't given a method, check to see whether data have already
-    # been processed, if so, choose that one
-    if fftparams.get('method', None) is None:
-        methods = set([key.split(';')[1] for key in globalv.SPECTROGRAMS
-                       if key.startswith('%s;' % channel.ndsname)])
-        try:
-            fftparams['method'] = list(methods)[0]
-        except IndexError:
-            fftparams['method'] = 'welch'
-
-    # clean fftparams dict using channel default values
-    fftparams = get_fftparams(channel, **fftparams)
-    # override special-case methods
-    if format in ['rayleigh']:
-        fftparams.method = format
+    fftparams = _resolve_fftparams(channel, format=format, **fftparams)
 
     # key used to store the coherence spectrogram in globalv
     key = make_globalv_key(channel, fftparams)
@@ -123,7 +112,7 @@ def _get_spectrogram(channel, segments, config=None, cache=None,
     new = segments - havesegs
     query &= abs(new) != 0
 
-    globalv.SPECTROGRAMS.setdefault(key, SpectrogramList())
+    globalv.SPECTROGRAMS.setdefault(key, SpectrogramStore())
 
     if query:
         # extract spectrogram stride from dict
@@ -139,15 +128,7 @@ def _get_spectrogram(channel, segments, config=None, cache=None,
             raise TypeError(msg)
 
         # read channel information
-        try:
-            filter_ = channel.frequency_response
-        except AttributeError:
-            filter_ = None
-        else:
-            if isinstance(filter_, str) and os.path.isfile(filter_):
-                filter_ = io.read_frequencyseries(filter_)
-            elif isinstance(filter_, str):
-                filter_ = safe_eval(filter_, strict=True)
+        filter_ = _get_frequency_response(channel)
 
         # get time-series data
         timeserieslist = get_timeseries(channel, new, config=config,
@@ -158,6 +139,7 @@ def _get_spectrogram(channel, segments, config=None, cache=None,
         if len(timeserieslist):
             vprint("    Calculating (%s) spectrograms for %s"
                    % (fftparams['method'], str(channel)))
+        tslist = []
         for ts in timeserieslist:
             # if too short for a single segment, continue
             if abs(ts.span) < (stride + fftparams.get('overlap', 0)):
@@ -166,49 +148,20 @@ def _get_spectrogram(channel, segments, config=None, cache=None,
             d = size_for_spectrogram(ts.duration.to('s').value, stride,
                                      fftparams['fftlength'],
                                      fftparams.get('overlap', 0))
-            ts = ts.crop(ts.span[0], ts.span[0] + d, copy=False)
-            # calculate spectrogram
-            try:
-                # rayleigh spectrogram has its own instance method
-                if fftparams.get('method', None) == 'rayleigh':
-                    spec_kw = fftparams.copy()
-                    for fftkey in ('method', 'scheme',):  # remove ASD keys
-                        spec_kw.pop(fftkey, None)
-                    spec_func = ts.rayleigh_spectrogram
-                else:
-                    spec_kw = fftparams
-                    spec_func = ts.spectrogram
-                specgram = spec_func(stride, nproc=nproc, **spec_kw)
-            except ZeroDivisionError:
-                if stride == 0:
-                    raise ZeroDivisionError("Spectrogram stride is 0")
-                elif fftparams['fftlength'] == 0:
-                    raise ZeroDivisionError("FFT length is 0")
-                else:
-                    raise
-            except ValueError as e:
-                if 'has no unit' in str(e):
-                    unit = ts.unit
-                    ts._unit = units.Unit('count')
-                    specgram = ts.spectrogram(stride, nproc=nproc, **fftparams)
-                    specgram._unit = unit ** 2 / units.Hertz
-                else:
-                    raise
-            if isinstance(filter_, FrequencySeries) and (
-                    fftparams['method'] not in ['rayleigh']):
-                specgram = apply_transfer_function_series(specgram, filter_)
-            elif filter_ and fftparams['method'] not in ['rayleigh']:
-                # manually setting x0 is a hack against precision error
-                # somewhere inside the **(1/2.) operation (Quantity)
-                x0 = specgram.x0.value
-                specgram = (specgram ** (1/2.)).filter(*filter_,
-                                                       inplace=True) ** 2
-                specgram.x0 = x0
-            if specgram.unit is None:
-                specgram._unit = channel.unit
-            elif len(globalv.SPECTROGRAMS[key]):
-                specgram._unit = globalv.SPECTROGRAMS[key][-1].unit
-            add_spectrogram(specgram, key=key)
+            tslist.append(ts.crop(ts.span[0], ts.span[0] + d, copy=False))
+        # distribute segments over a process pool, if we can
+        params = dict(fftparams, stride=stride)
+        if nproc > 1 and len(tslist) > 1 and _can_batch(params) and all(
+                _density_unit(ts) is not None for ts in tslist):
+            specgrams = (group[0] for group in _welch_spectrograms(
+                [([ts], params) for ts in tslist], nproc=nproc))
+        else:
+            specgrams = (_calculate_spectrogram(ts, stride, fftparams,
+                                                nproc=nproc) for
+                         ts in tslist)
+        for specgram in specgrams:
+            _store_spectrogram(specgram, channel, key, filter_,
+                               fftparams['method'])
             vprint('.')
         if len(timeserieslist):
             vprint('\n')
@@ -217,24 +170,45 @@ def _get_spectrogram(channel, segments, config=None, cache=None,
         return
 
     # return correct data
-    out = SpectrogramList()
-    for specgram in globalv.SPECTROGRAMS[key]:
-        for seg in segments:
-            if abs(seg) < specgram.dt.value:
-                continue
-            if specgram.span.intersects(seg):
-                common = specgram.span & type(seg)(seg[0],
-                                                   seg[1] + specgram.dt.value)
-                s = specgram.crop(*common)
-                if format in ['amplitude', 'asd']:
-                    s = s**(1/2.)
-                elif format in ['rayleigh']:
-                    # XXX FIXME: this corrects the bias offset in Rayleigh
-                    med = numpy.median(s.value)
-                    s /= med
-                if s.shape[0]:
-                    out.append(s)
-    return out.coalesce()
+    out = globalv.SPECTROGRAMS[key].crop_segments(segments, pad=True)
+    for i, s in enumerate(out):
+        if format in ['amplitude', 'asd']:
+            out[i] = s**(1/2.)
+        elif format in ['rayleigh']:
+            # XXX FIXME: this corrects the bias offset in Rayleigh
+            out[i] = s / numpy.median(s.value)
+    return out
+
+
+def _calculate_spectrogram(ts, stride, fftparams, nproc=1):
+    """Calculate the spectrogram of a `TimeSeries` using gwpy
+    """
+    try:
+        # rayleigh spectrogram has its own instance method
+        if fftparams.get('method', None) == 'rayleigh':
+            spec_kw = fftparams.copy()
+            for fftkey in ('method', 'scheme',):  # remove ASD keys
+                spec_kw.pop(fftkey, None)
+            spec_func = ts.rayleigh_spectrogram
+        else:
+            spec_kw = fftparams
+            spec_func = ts.spectrogram
+        return spec_func(stride, nproc=nproc, **spec_kw)
+    except ZeroDivisionError:
+        if stride == 0:
+            raise ZeroDivisionError("Spectrogram stride is 0")
+        elif fftparams['fftlength'] == 0:
+            raise ZeroDivisionError("FFT length is 0")
+        else:
+            raise
+    except ValueError as e:
+        if 'has no unit' in str(e):
+            unit = ts.unit
+            ts._unit = units.Unit('count')
+            specgram = ts.spectrogram(stride, nproc=nproc, **fftparams)
+            specgram._unit = unit ** 2 / units.Hertz
+            return specgram
+        raise
 
 
 def add_spectrogram(specgram, key=None, coalesce=True):
@@ -242,10 +216,176 @@ def add_spectrogram(specgram, key=None, coalesce=True):
     """
     if key is None:
         key = specgram.name or str(specgram.channel)
-    globalv.SPECTROGRAMS.setdefault(key, SpectrogramList())
-    globalv.SPECTROGRAMS[key].append(specgram)
-    if coalesce:
-        globalv.SPECTROGRAMS[key].coalesce()
+    globalv.SPECTROGRAMS.setdefault(key, SpectrogramStore())
+    specgram = cast_for_storage(specgram)
+    globalv.SPECTROGRAMS[key].add(specgram, coalesce=coalesce)
+
+
+def _resolve_fftparams(channel, format='power', **fftparams):
+    """Work out the `FftParams` with which to process a channel
+    """
+    # if we aren't given a method, check to see whether data have already
+    # been processed, if so, choose that one
+    if fftparams.get('method', None) is None:
+        methods = set([key.split(';')[1] for key in globalv.SPECTROGRAMS
+                       if key.startswith('%s;' % channel.ndsname)])
+        try:
+            fftparams['method'] = list(methods)[0]
+        except IndexError:
+            fftparams['method'] = 'welch'
+
+    # clean fftparams dict using channel default values
+    fftparams = get_fftparams(channel, **fftparams)
+    # override special-case methods
+    if format in ['rayleigh']:
+        fftparams.method = format
+    return fftparams
+
+
+def _get_frequency_response(channel):
+    """Parse the ``frequency_response`` filter for a channel, if given
+    """
+    try:
+        filter_ = channel.frequency_response
+    except AttributeError:
+        return None
+    if isinstance(filter_, str) and os.path.isfile(filter_):
+        return io.read_frequencyseries(filter_)
+    elif isinstance(filter_, str):
+        return safe_eval(filter_, strict=True)
+    return filter_
+
+
+def _store_spectrogram(specgram, channel, key, filter_, method):
+    """Apply the channel filter to a new spectrogram, and store it
+    """
+    if isinstance(filter_, FrequencySeries) and (
+            method not in ['rayleigh']):
+        specgram = apply_transfer_function_series(specgram, filter_)
+    elif filter_ and method not in ['rayleigh']:
+        # manually setting x0 is a hack against precision error
+        # somewhere inside the **(1/2.) operation (Quantity)
+        x0 = specgram.x0.value
+        specgram = (specgram ** (1/2.)).filter(*filter_,
+                                               inplace=True) ** 2
+        specgram.x0 = x0
+    if specgram.unit is None:
+        specgram._unit = channel.unit
+    elif len(globalv.SPECTROGRAMS[key]):
+        specgram._unit = globalv.SPECTROGRAMS[key][-1].unit
+    add_spectrogram(specgram, key=key)
+
+
+# -- batched spectrograms -----------------------------------------------------
+
+def _can_batch(fftparams):
+    """Returns `True` if the given FFT parameters can be batched
+    """
+    return (fftparams.get('method') in BATCH_METHODS and
+            fftparams.get('scheme') is None and
+            bool(fftparams.get('stride')) and
+            bool(fftparams.get('fftlength')))
+
+
+def _density_unit(ts):
+    """Returns the unit of the PSD of a `TimeSeries`, or `None`
+    """
+    try:
+        return ts.unit ** 2 / units.Hertz
+    except (TypeError, ValueError):
+        return None
+
+
+def _welch_spectrograms(groups, nproc=1):
+    """Calculate Welch spectrograms for groups of like-sampled series
+
+    Parameters
+    ----------
+    groups : `list` of `tuple`
+        ``(series, fftparams)`` pairs, where ``series`` is a `list` of
+        `~gwpy.timeseries.TimeSeries` with the same sample rate and size
+
+    nproc : `int`, optional
+        the number of processes over which to distribute the groups
+
+    Yields
+    ------
+    specgrams : `list` of `~gwpy.spectrogram.Spectrogram`
+        the spectrogram of each series in a group
+    """
+    jobs = []
+    for series, params in groups:
+        jobs.append(([ts.value for ts in series],
+                     series[0].sample_rate.decompose().value, {
+                         'stride': params['stride'],
+                         'fftlength': params['fftlength'],
+                         'overlap': params.get('overlap'),
+                         'window': params.get('window'),
+                         'average': BATCH_METHODS[params['method']],
+                     }))
+    for (series, params), (freqs, psds) in zip(
+            groups, map_welch(jobs, nproc=nproc)):
+        yield [Spectrogram(psd, unit=_density_unit(ts), epoch=ts.t0,
+                           dt=params['stride'], f0=freqs[0],
+                           df=freqs[1] - freqs[0], name=ts.name,
+                           channel=ts.channel, copy=False)
+               for ts, psd in zip(series, psds)]
+
+
+def _batch_spectrograms(channels, segments, format='power', nproc=1,
+                        **fftparams):
+    """Calculate spectrograms for many channels in batches
+
+    Channels that share FFT parameters, sample rate, and data spans are
+    processed together by `~gwsumm.data.welch.batch_welch`, with the
+    batches distributed over ``nproc`` processes, and the results stored in
+    `globalv.SPECTROGRAMS` for each channel.
+    Channels that cannot be batched are ignored, to be handled one at a time
+    by `_get_spectrogram`.
+    """
+    # group data by everything that determines the FFT layout
+    groups = OrderedDict()
+    for channel in channels:
+        params = _resolve_fftparams(channel, format=format, **fftparams)
+        key = make_globalv_key(channel, params)
+        params = params.dict()
+        if not _can_batch(params):
+            continue
+        globalv.SPECTROGRAMS.setdefault(key, SpectrogramStore())
+        new = segments - globalv.SPECTROGRAMS[key].segments
+        if not abs(new):
+            continue
+        stride = params['stride']
+        overlap = params.get('overlap', 0)
+        for ts in get_timeseries(channel, new, query=False):
+            if abs(ts.span) < stride + overlap:
+                continue
+            d = size_for_spectrogram(ts.duration.to('s').value, stride,
+                                     params['fftlength'], overlap)
+            ts = ts.crop(ts.span[0], ts.span[0] + d, copy=False)
+            if _density_unit(ts) is None:  # leave for _get_spectrogram
+                continue
+            gkey = (tuple(sorted((k, str(v)) for k, v in params.items())),
+                    ts.span, ts.size, ts.sample_rate.value)
+            groups.setdefault(gkey, []).append((channel, key, params, ts))
+
+    # with a single process, only batch groups of several channels
+    groups = [members for members in groups.values() if
+              len(members) > 1 or nproc > 1]
+    if not groups:
+        return
+    vprint("    Calculating spectrograms for %d channels in %d batches"
+           % (sum(map(len, groups)), len(groups)))
+    batches = [([m[3] for m in members], members[0][2]) for
+               members in groups]
+    for members, specgrams in zip(
+            groups, _welch_spectrograms(batches, nproc=nproc)):
+        for (channel, key, params, _), specgram in zip(members, specgrams):
+            _store_spectrogram(specgram, channel, key,
+                               _get_frequency_response(channel),
+                               params['method'])
+        vprint('.')
+    vprint('\n')
 
 
 @use_segmentlist
@@ -286,6 +426,11 @@ def get_spectrograms(channels, segments, config=None, cache=None, query=True,
                             nproc=nproc, frametype=frametype,
                             datafind_error=datafind_error, nds=nds,
                             return_=False)
+
+        # calculate spectrograms for like-sampled channels in batches
+        _batch_spectrograms(qchannels, segments, format=format, nproc=nproc,
+                            **fftparams)
+
     # loop over channels and generate spectrograms
     out = OrderedDict()
     for channel in channels:
@@ -369,9 +514,11 @@ def _get_spectrum(channel, segments, config=None, cache=None, query=True,
     """
     channel = get_channel(channel)
     if isinstance(segments, DataQualityFlag):
-        name = ','.join([channel.ndsname, segments.name])
+        state = segments.name
+        name = ','.join([channel.ndsname, state])
         segments = segments.active
     else:
+        state = None
         name = channel.ndsname
     name += ',%s' % format
     cmin = '%s.min' % name
@@ -388,29 +535,24 @@ def _get_spectrum(channel, segments, config=None, cache=None, query=True,
             if 'stride' not in fftparams and 'fftlength' in fftparams:
                 fftparams.setdefault('stride', fftparams['fftlength'])
 
-            speclist = get_spectrogram(channel, segments, config=config,
-                                       cache=cache, query=query, nds=nds,
-                                       format=format, **fftparams)
-            try:
-                specgram = speclist.join(gap='ignore')
-            except ValueError as e:
-                if 'units do not match' in str(e):
-                    warnings.warn(str(e))
-                    for spec in speclist[1:]:
-                        spec.unit = speclist[0].unit
-                    specgram = speclist.join(gap='ignore')
-                else:
-                    raise
-            try:
-                globalv.SPECTRUM[name] = specgram.percentile(50)
-            except (ValueError, IndexError):
-                globalv.SPECTRUM[name] = FrequencySeries(
-                    [], channel=channel, f0=0, df=1, unit=units.Unit(''))
-                globalv.SPECTRUM[cmin] = globalv.SPECTRUM[name]
-                globalv.SPECTRUM[cmax] = globalv.SPECTRUM[name]
+            if format in ['rayleigh']:
+                _spectrum_from_spectrogram(
+                    channel, segments, name, config=config, cache=cache,
+                    query=query, nds=nds, format=format, **fftparams)
             else:
-                globalv.SPECTRUM[cmin] = specgram.percentile(5)
-                globalv.SPECTRUM[cmax] = specgram.percentile(95)
+                sketch = get_spectrum_sketch(
+                    channel, segments, state=state, config=config,
+                    cache=cache, query=query, nds=nds, **fftparams)
+                if sketch.count:
+                    spectra = [sketch.percentile(p) for p in (50, 5, 95)]
+                    if format in ['amplitude', 'asd']:
+                        spectra = [s ** (1/2.) for s in spectra]
+                else:
+                    spectra = [FrequencySeries(
+                        [], channel=channel, f0=0, df=1,
+                        unit=units.Unit(''))] * 3
+                (globalv.SPECTRUM[name], globalv.SPECTRUM[cmin],
+                 globalv.SPECTRUM[cmax]) = spectra
 
     if not return_:
         return
@@ -425,3 +567,88 @@ def _get_spectrum(channel, segments, config=None, cache=None, query=True,
     if which == 'max':
         return globalv.SPECTRUM[cmax]
     raise ValueError("Unrecognised value for `which`: %r" % which)
+
+
+def _spectrum_from_spectrogram(channel, segments, name, format='power',
+                               **kwargs):
+    """Calculate spectral percentiles by joining all spectrogram data
+
+    This is only used for formats that can't be calculated from a
+    `~gwsumm.data.sketch.SpectrumSketch`.
+    """
+    cmin = '%s.min' % name
+    cmax = '%s.max' % name
+    speclist = get_spectrogram(channel, segments, format=format, **kwargs)
+    try:
+        specgram = speclist.join(gap='ignore')
+    except ValueError as e:
+        if 'units do not match' in str(e):
+            warnings.warn(str(e))
+            for spec in speclist[1:]:
+                spec.unit = speclist[0].unit
+            specgram = speclist.join(gap='ignore')
+        else:
+            raise
+    try:
+        globalv.SPECTRUM[name] = specgram.percentile(50)
+    except (ValueError, IndexError):
+        globalv.SPECTRUM[name] = FrequencySeries(
+            [], channel=channel, f0=0, df=1, unit=units.Unit(''))
+        globalv.SPECTRUM[cmin] = globalv.SPECTRUM[name]
+        globalv.SPECTRUM[cmax] = globalv.SPECTRUM[name]
+    else:
+        globalv.SPECTRUM[cmin] = specgram.percentile(5)
+        globalv.SPECTRUM[cmax] = specgram.percentile(95)
+
+
+def get_spectrum_sketch(channel, segments, state=None, config=None,
+                        cache=None, query=True, nds=None, frametype=None,
+                        nproc=1, datafind_error='raise', **fftparams):
+    """Get a `~gwsumm.data.sketch.SpectrumSketch` of a channel's spectrogram
+
+    The sketch is updated with spectrogram data for any of the given
+    segments that it doesn't yet cover, so that percentiles can be estimated
+    without joining all spectrogram data in memory.
+
+    Parameters
+    ----------
+    channel : `str`, `~gwpy.detector.Channel`
+        the channel to sketch
+
+    segments : `~gwpy.segments.SegmentList`
+        the segments for which to sketch the spectrogram
+
+    state : `str`, optional
+        the name of the state that defines the segments, used to key the
+        sketch in `globalv.SPECTRUM_SKETCHES`
+
+    **fftparams
+        other keyword arguments are passed to `get_spectrogram`
+
+    Returns
+    -------
+    sketch : `~gwsumm.data.sketch.SpectrumSketch`
+        the sketch of the spectrogram over the given segments
+    """
+    channel = get_channel(channel)
+    key = make_globalv_key(channel, _resolve_fftparams(channel, **fftparams))
+    if state is not None:
+        key = '%s,%s' % (key, state)
+
+    # a sketch that covers other times (e.g. if the state segments have
+    # changed) cannot be corrected, so start again
+    sketch = globalv.SPECTRUM_SKETCHES.get(key)
+    if sketch is None or abs(sketch.segments - segments):
+        sketch = globalv.SPECTRUM_SKETCHES[key] = SpectrumSketch()
+
+    new = segments - sketch.segments
+    if abs(new):
+        get_spectrogram(channel, new, config=config, cache=cache, query=query,
+                        nds=nds, frametype=frametype, nproc=nproc,
+                        datafind_error=datafind_error, return_=False,
+                        **fftparams)
+        sgkey = key if state is None else key.rsplit(',', 1)[0]
+        for specgram in globalv.SPECTROGRAMS.get(
+                sgkey, SpectrogramStore()).crop_segments(new):
+            sketch.update(specgram)
+    return sketch
@@ -23,6 +23,8 @@ import os
 import re
 import operator
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from threading import RLock
 from time import sleep
 from functools import reduce
 from math import (floor, ceil)
@@ -30,6 +32,9 @@ from urllib.parse import urlparse
 from collections import OrderedDict
 from configparser import (NoSectionError, NoOptionError)
 
+import numpy
+from scipy import signal
+
 from astropy import units
 
 import gwdatafind
@@ -37,19 +42,23 @@ import gwdatafind
 from gwpy.io import nds2 as io_nds2
 from gwpy.io.cache import (file_segment, cache_segments)
 from gwpy.io.gwf import data_segments
-from gwpy.segments import (Segment, SegmentList)
+from gwpy.segments import (Segment, SegmentList, SegmentListDict)
+from gwpy.signal.filter_design import parse_filter
 from gwpy.timeseries import (TimeSeriesList, TimeSeriesDict,
                              StateVector, StateVectorList, StateVectorDict)
 from gwpy.timeseries.io.gwf import get_default_gwf_api
-from gwpy.utils.mp import multiprocess_with_queues
 
-from .. import globalv
+from .. import (globalv, mode)
+from ..store import (TimeSeriesStore, StateVectorStore, SpanCache)
 from ..utils import vprint
 from ..config import GWSummConfigParser
 from ..channels import (get_channel, update_missing_channel_params,
                         split_combination as split_channel_combination,
                         update_channel_params)
-from .utils import (use_configparser, use_segmentlist, make_globalv_key)
+from . import ndspool
+from .frameindex import (get_frame_index, complete_segment)
+from .utils import (use_configparser, use_segmentlist, make_globalv_key,
+                    cast_for_storage)
 from .mathutils import get_with_math
 
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
@@ -86,6 +95,9 @@ FRAMETYPE_REGEX = {
         r'SenseMonitor_CAL_[A-Z][0-9]_M\Z'),
 }
 
+# lock guarding updates to `globalv.DATA` from concurrent readers
+DATA_LOCK = RLock()
+
 # list of GWF frametypes that contain only ADC channels
 #     allows big memory/time savings when reading with frameCPP
 try:
@@ -141,6 +153,14 @@ def sieve_cache(cache, ifo=None, tag=None, segment=None):
     return type(cache)(filter(_sieve, cache))
 
 
+# in-process caches of frame and NDS2 availability lookups, so that the same
+# query made for different tabs and states is only sent to the server once
+FRAME_CACHE = SpanCache(lambda result, start, end: (
+    sieve_cache(result[0], segment=Segment(start, end)), result[1]))
+NDS_AVAILABILITY_CACHE = SpanCache(
+    lambda result, start, end: result & SegmentList([Segment(start, end)]))
+
+
 @use_configparser
 def find_frames(ifo, frametype, gpsstart, gpsend, config=GWSummConfigParser(),
                 urltype='file', gaps='warn', onerror='raise'):
@@ -162,7 +182,10 @@ def find_frames(ifo, frametype, gpsstart, gpsend, config=GWSummConfigParser(),
 
     config : `~ConfigParser.ConfigParser`, optional
         configuration with `[datafind]` section containing `server`
-        specification, otherwise taken from the environment
+        specification, otherwise taken from the environment; if the
+        `[datafind]` section also contains a `frame-index` path, files
+        are found using a local `~gwsumm.data.frameindex.FrameIndex`,
+        with the datafind server only queried for times not already indexed
 
     urltype : `str`, optional
         what type of file paths to return, default: `file`
@@ -212,32 +235,64 @@ def find_frames(ifo, frametype, gpsstart, gpsend, config=GWSummConfigParser(),
     except ValueError:
         match = None
 
-    def _query():
-        return gwdatafind.find_urls(ifo[0].upper(), frametype, gpsstart,
-                                    gpsend, urltype=urltype, on_gaps=gaps,
+    def _query(start, end):
+        return gwdatafind.find_urls(ifo[0].upper(), frametype, start,
+                                    end, urltype=urltype, on_gaps=gaps,
                                     match=match, host=host, port=port)
-    try:
-        cache = _query()
-    except RuntimeError as e:
-        sleep(1)
+
+    def _find(start, end):
         try:
-            cache = _query()
-        except RuntimeError:
-            if 'Invalid GPS times' in str(e):
-                e.args = ('%s: %d ... %s' % (str(e), gpsstart, gpsend),)
-            if onerror in ['ignore', None]:
-                pass
-            elif onerror in ['warn']:
-                warnings.warn('Caught %s: %s'
-                              % (type(e).__name__, str(e)))
-            else:
-                raise
-            cache = []
+            return _query(start, end)
+        except RuntimeError as e:
+            sleep(1)
+            try:
+                return _query(start, end)
+            except RuntimeError:
+                if 'Invalid GPS times' in str(e):
+                    e.args = ('%s: %d ... %s' % (str(e), start, end),)
+                if onerror in ['ignore', None]:
+                    pass
+                elif onerror in ['warn']:
+                    warnings.warn('Caught %s: %s'
+                                  % (type(e).__name__, str(e)))
+                else:
+                    raise
+                return None
 
     # XXX: if querying for day of LLO frame type change, do both
-    if (ifo[0].upper() == 'L' and frametype in ['C', 'R', 'M', 'T'] and
-            gpsstart < LLOCHANGE < gpsend):
-        start = len(cache) and cache[-1].segment[1] or gpsstart
+    llochange = (ifo == 'L' and frametype in ['C', 'R', 'M', 'T'] and
+                 gpsstart < LLOCHANGE < gpsend)
+
+    # use local frame index, if configured (the index only records files
+    # that exist, so its answers are returned as they are)
+    try:
+        index = get_frame_index(config.get('datafind', 'frame-index'))
+    except (NoOptionError, NoSectionError):
+        index = None
+    if (index is not None and match is None and urltype == 'file' and
+            not llochange):
+        index.refresh(ifo, frametype)
+        cache, missing = index.find(ifo, frametype, gpsstart, gpsend)
+        if abs(missing):
+            for seg in missing:
+                found = _find(int(floor(seg[0])), int(ceil(seg[1])))
+                if found is None:  # query failed, don't record coverage
+                    continue
+                found = list(map(_urlpath, found))
+                index.add_files(ifo, frametype, found)
+                # only record coverage up to the latest file found, so
+                # that files written after the query are found next time
+                seg = complete_segment(seg, found)
+                if seg is not None:
+                    index.add_coverage(ifo, frametype, seg)
+            cache = index.find(ifo, frametype, gpsstart, gpsend)[0]
+        vprint(' %d found.\n' % len(cache))
+        return cache
+
+    cache = _find(gpsstart, gpsend) or []
+
+    if llochange:
+        start = len(cache) and file_segment(cache[-1])[1] or gpsstart
         if start < gpsend:
             cache.extend(gwdatafind.find_urls(
                 ifo[0].upper(), 'L1_%s' % frametype, start, gpsend,
@@ -272,7 +327,18 @@ def find_frames(ifo, frametype, gpsstart, gpsend, config=GWSummConfigParser(),
 
 def find_best_frames(ifo, frametype, start, end, **kwargs):
     """Find frames for the given type, replacing with a better type if needed
+
+    The results are cached for the rest of the process, so that a repeat
+    request for a span contained in one already queried is answered from
+    memory.
     """
+    key = (ifo, frametype) + tuple(sorted(
+        (k, v) for k, v in kwargs.items() if k != 'config'))
+    try:
+        return FRAME_CACHE.get(key, start, end)
+    except KeyError:
+        pass
+
     # find cache for this frametype
     cache = find_frames(ifo, frametype, start, end, **kwargs)
 
@@ -294,9 +360,62 @@ def find_best_frames(ifo, frametype, start, end, **kwargs):
         else:
             vprint("    No extra coverage with frametype %s\n" % f2)
 
+    # only remember successful queries
+    if cache:
+        FRAME_CACHE.add(key, start, end, (list(cache), frametype))
     return cache, frametype
 
 
+def get_nds_availability(channels, start, end, connection, host=None,
+                         port=None):
+    """Query an NDS2 server for data availability, with caching
+
+    Availability for each channel is cached for the rest of the process, so
+    that only channels not already queried over a containing span are
+    sent to the server.
+
+    Parameters
+    ----------
+    channels : `list` of `~gwpy.detector.Channel`
+        the channels to query
+
+    start : `int`
+        GPS start time of query
+
+    end : `int`
+        GPS end time of query
+
+    connection : `nds2.connection`
+        open NDS2 connection to use for query
+
+    host : `str`, optional
+        name of NDS2 server, used to key the cache
+
+    port : `int`, optional
+        port number of NDS2 server, used to key the cache
+
+    Returns
+    -------
+    segdict : `~gwpy.segments.SegmentListDict`
+        dict of ``(channel, SegmentList)`` pairs
+    """
+    out = SegmentListDict()
+    query = []
+    for channel in channels:
+        try:
+            out[channel] = NDS_AVAILABILITY_CACHE.get(
+                (host, port, str(channel)), start, end)
+        except KeyError:
+            query.append(channel)
+    if query:
+        avail = io_nds2.get_availability(query, start, end,
+                                         connection=connection)
+        for channel, segs in avail.items():
+            out[channel] = NDS_AVAILABILITY_CACHE.add(
+                (host, port, str(channel)), start, end, segs)
+    return out
+
+
 def find_frame_type(channel):
     """Find the frametype associated with the given channel
 
@@ -431,15 +550,20 @@ def get_timeseries_dict(channels, segments, config=GWSummConfigParser(),
         based on other arguments and the environment
 
     nproc : `int`, optional
-        number of parallel cores to use for file reading, default: ``1``
+        number of parallel cores to use for file reading, default: ``1``,
+        channels from different frametypes are read concurrently on up
+        to ``nproc`` threads
 
     frametype : `str`, optional`
         the frametype of the target channels, if not given, this will be
         guessed based on the channel name(s)
 
-    statevector : `bool`, optional
+    statevector : `bool`, `list`, optional
         whether you want to load `~gwpy.timeseries.StateVector` rather than
-        `~gwpy.timeseries.TimeSeries` data
+        `~gwpy.timeseries.TimeSeries` data, or a list of those ``channels``
+        that should be loaded as `~gwpy.timeseries.StateVector`; in the
+        latter case all channels are read in a single pass, and split
+        into the relevant types when stored
 
     datafind_error : `str`, optional
         what to do in the event of a datafind error, one of
@@ -452,6 +576,11 @@ def get_timeseries_dict(channels, segments, config=GWSummConfigParser(),
         whether you actually want anything returned to you, or you are just
         calling this function to load data for use later
 
+    dtype : `type`, `dict`, optional
+        the data type to which to cast the data, or a `dict` of
+        ``(channel name, dtype)`` pairs; the ``dtype`` attribute of a
+        channel, if set, takes precedence
+
     **ioargs
         all other keyword arguments are passed to the relevant data
         reading method (either `~gwpy.timeseries.TimeSeriesDict.read` or
@@ -480,12 +609,29 @@ def get_timeseries_dict(channels, segments, config=GWSummConfigParser(),
                     frametypes[id_].append(channel)
                 else:
                     frametypes[id_] = [channel]
-        for ftype, channellist in frametypes.items():
-            _get_timeseries_dict(channellist, segments, config=config,
-                                 cache=cache, query=query, nds=nds,
-                                 nproc=nproc, frametype=ftype[1],
-                                 statevector=statevector, return_=False,
-                                 datafind_error=datafind_error, **ioargs)
+
+        def _get(item):
+            ftype, channellist = item
+            return _get_timeseries_dict(
+                channellist, segments, config=config, cache=cache,
+                query=query, nds=nds, nproc=nthreads, frametype=ftype[1],
+                statevector=statevector, return_=False,
+                datafind_error=datafind_error, **ioargs)
+
+        # read each group on its own thread, sharing the processes between
+        # them for the file reading
+        nworkers = max(min(int(nproc), len(frametypes)), 1)
+        nthreads = max(int(nproc) // nworkers, 1)
+        if nworkers == 1:
+            list(map(_get, frametypes.items()))
+        else:
+            vprint("    Reading %d data groups over %d threads\n"
+                   % (len(frametypes), nworkers))
+            with ThreadPoolExecutor(max_workers=nworkers) as executor:
+                # calling result() re-raises any exceptions
+                for future in [executor.submit(_get, item) for
+                               item in frametypes.items()]:
+                    future.result()
     if not return_:
         return
     else:
@@ -510,10 +656,11 @@ def _get_timeseries_dict(channels, segments, config=None,
     channels = list(map(get_channel, channels))
 
     # set classes
-    if statevector:
+    svnames = _statevector_names(channels, statevector)
+    if channels and svnames.issuperset(c.ndsname for c in channels):
         ListClass = StateVectorList
         DictClass = StateVectorDict
-    else:
+    else:  # mixed requests are read as TimeSeries, and converted later
         ListClass = TimeSeriesList
         DictClass = TimeSeriesDict
 
@@ -523,10 +670,11 @@ def _get_timeseries_dict(channels, segments, config=None,
 
     # read segments from global memory
     keys = dict((c.ndsname, make_globalv_key(c)) for c in channels)
-    havesegs = reduce(operator.and_,
-                      (globalv.DATA.get(keys[channel.ndsname],
-                                        ListClass()).segments
-                       for channel in channels))
+    with DATA_LOCK:
+        havesegs = reduce(operator.and_,
+                          (globalv.DATA.get(keys[channel.ndsname],
+                                            ListClass()).segments
+                           for channel in channels))
     new = segments - havesegs
 
     # read channel information
@@ -545,6 +693,9 @@ def _get_timeseries_dict(channels, segments, config=None,
             pass
         if channel.dtype is not None:
             dtype_[name] = channel.dtype
+        elif isinstance(dtype, dict):
+            if dtype.get(name, None) is not None:
+                dtype_[name] = dtype[name]
         elif dtype is not None:
             dtype_[name] = dtype
 
@@ -559,29 +710,42 @@ def _get_timeseries_dict(channels, segments, config=None,
     if cache is not None:
         query &= len(cache) > 0
     if query:
-        for channel in channels:
-            globalv.DATA.setdefault(keys[channel.ndsname], ListClass())
+        with DATA_LOCK:
+            for channel in channels:
+                if channel.ndsname in svnames:
+                    globalv.DATA.setdefault(keys[channel.ndsname],
+                                            StateVectorStore())
+                else:
+                    globalv.DATA.setdefault(keys[channel.ndsname],
+                                            TimeSeriesStore())
 
         ifo = channels[0].ifo
 
-        # open NDS connection
+        # configure NDS connections (taken from the pool as needed)
         if nds:
             if config.has_option('nds', 'host'):
-                host = config.get('nds', 'host')
-                port = config.getint('nds', 'port')
-                ndsconnection = io_nds2.connect(host, port)
+                ndsserver = {
+                    'host': config.get('nds', 'host'),
+                    'port': config.getint('nds', 'port'),
+                    'protocol': config.get('nds', 'protocol', fallback=None),
+                }
+                ndschunk = config.getint('nds', 'chunk-duration',
+                                         fallback=None)
             else:
-                ndsconnection = None
+                ndsserver = None
             frametype = source = 'nds'
             ndstype = channels[0].type
 
             # get NDS channel segments
-            if ndsconnection is not None and ndsconnection.get_protocol() > 1:
-                span = list(map(int, new.extent()))
-                avail = io_nds2.get_availability(
-                    channels, *span, connection=ndsconnection
-                )
-                new &= avail.intersection(avail.keys())
+            if ndsserver is not None:
+                with ndspool.POOL.connection(**ndsserver) as ndsconnection:
+                    if ndsconnection.get_protocol() > 1:
+                        span = list(map(int, new.extent()))
+                        avail = get_nds_availability(
+                            channels, *span, connection=ndsconnection,
+                            host=ndsserver['host'], port=ndsserver['port'],
+                        )
+                        new &= avail.intersection(avail.keys())
 
         # or find frame type and check cache
         else:
@@ -623,20 +787,30 @@ def _get_timeseries_dict(channels, segments, config=None,
         # check whether each channel exists for all new times already
         qchannels = []
         for channel in channels:
-            oldsegs = globalv.DATA.get(keys[channel.ndsname],
-                                       ListClass()).segments
+            with DATA_LOCK:
+                oldsegs = globalv.DATA.get(keys[channel.ndsname],
+                                           ListClass()).segments
             if abs(new - oldsegs) != 0 and nds:
                 qchannels.append(channel.ndsname)
             elif abs(new - oldsegs) != 0:
                 qchannels.append(str(channel))
 
+        # split long segments into chunks, to limit memory usage
+        chunk = get_read_chunk_duration(config)
+        if chunk:
+            new = chunk_segments(new, chunk)
+
         # loop through segments, recording data for each
         if len(new):
             vprint("    Fetching data (from %s) for %d channels [%s]:\n"
                    % (source, len(qchannels),
                       nds and ndstype or frametype or ''))
         vstr = "        [{0[0]}, {0[1]})"
-        for segment in new:
+        carry = {}
+        for i, segment in enumerate(new):
+            # does the next chunk carry on from this one?
+            final = (i + 1 == len(new) or new[i + 1][0] != segment[1] or
+                     abs(new[i + 1]) < 1)
             # force reading integer-precision segments
             segment = type(segment)(int(segment[0]), int(segment[1]))
             if abs(segment) < 1:
@@ -648,9 +822,15 @@ def _get_timeseries_dict(channels, segments, config=None,
                 if abs(segment) < 60:
                     continue
 
-            if nds:  # fetch
+            if nds and ndsserver is not None:  # fetch from pool
+                tsd = ndspool.fetch(qchannels, segment[0], segment[1],
+                                    chunk=ndschunk, nproc=nproc,
+                                    series_class=DictClass, type=ndstype,
+                                    verbose=vstr.format(segment),
+                                    **dict(ndsserver, **ioargs))
+            elif nds:  # fetch
                 tsd = DictClass.fetch(qchannels, segment[0], segment[1],
-                                      connection=ndsconnection, type=ndstype,
+                                      type=ndstype,
                                       verbose=vstr.format(segment), **ioargs)
             else:  # read
                 # NOTE: this sieve explicitly casts our segment to
@@ -664,60 +844,70 @@ def _get_timeseries_dict(channels, segments, config=None,
 
             vprint("        post-processing...\n")
 
-            # apply type casting (copy=False means same type just returns)
+            # apply type casting (copy=False means same type just returns),
+            # and split state-vectors from a mixed read, so that they
+            # are resampled bit-wise
             for chan, ts in tsd.items():
-                tsd[chan] = ts.astype(dtype_.get(chan, ts.dtype),
-                                      casting='unsafe', copy=False)
-
-            # apply resampling
-            tsd = resample_timeseries_dict(tsd, nproc=1, **resample)
-
-            # post-process
-            for c, data in tsd.items():
-                channel = get_channel(c)
-                key = keys[channel.ndsname]
-                if (key in globalv.DATA and
-                        data.span in globalv.DATA[key].segments):
-                    continue
-                if data.unit is None:
-                    data.unit = 'undef'
-                for i, seg in enumerate(globalv.DATA[key].segments):
-                    if seg in data.span:
-                        # new data completely covers existing segment
-                        # (and more), so just remove the old stuff
-                        globalv.DATA[key].pop(i)
-                        break
-                    elif seg.intersects(data.span):
-                        # new data extends existing segment, so only keep
-                        # the really new stuff
-                        data = data.crop(*(data.span - seg))
-                        break
-
-                # filter
-                try:
-                    filt = filter_[str(channel)]
-                except KeyError:
-                    pass
-                else:
-                    data = filter_timeseries(data, filt)
-
-                if isinstance(data, StateVector) or ':GRD-' in str(channel):
-                    data.override_unit(units.dimensionless_unscaled)
-                    if hasattr(channel, 'bits'):
-                        data.bits = channel.bits
-                elif data.unit is None:
-                    data.override_unit(channel.unit)
-
-                # update channel type for trends
-                if data.channel.type is None and (
-                        data.channel.trend is not None):
-                    if data.dt.to('s').value == 1:
-                        data.channel.type = 's-trend'
-                    elif data.dt.to('s').value == 60:
-                        data.channel.type = 'm-trend'
-
-                # append and coalesce
-                add_timeseries(data, key=key, coalesce=True)
+                ts = ts.astype(dtype_.get(chan, ts.dtype),
+                               casting='unsafe', copy=False)
+                if (get_channel(chan).ndsname in svnames and
+                        not isinstance(ts, StateVector)):
+                    ts = ts.view(StateVector)
+                tsd[chan] = ts
+
+            # apply resampling (carrying data between contiguous chunks)
+            tsd = resample_timeseries_chunk(tsd, carry, final=final,
+                                            nproc=nproc, **resample)
+
+            # post-process (holding the lock, other threads may be
+            # reading into the same global memory)
+            with DATA_LOCK:
+                for c, data in tsd.items():
+                    channel = get_channel(c)
+                    key = keys[channel.ndsname]
+                    if (key in globalv.DATA and
+                            data.span in globalv.DATA[key].segments):
+                        continue
+                    if data.unit is None:
+                        data.unit = 'undef'
+                    for i, seg in enumerate(globalv.DATA[key].segments):
+                        if seg in data.span:
+                            # new data completely covers existing segment
+                            # (and more), so just remove the old stuff
+                            globalv.DATA[key].pop(i)
+                            break
+                        elif seg.intersects(data.span):
+                            # new data extends existing segment, so only keep
+                            # the really new stuff
+                            data = data.crop(*(data.span - seg))
+                            break
+
+                    # filter
+                    try:
+                        filt = filter_[str(channel)]
+                    except KeyError:
+                        pass
+                    else:
+                        data = filter_timeseries(data, filt, key=key)
+
+                    if (isinstance(data, StateVector) or
+                            ':GRD-' in str(channel)):
+                        data.override_unit(units.dimensionless_unscaled)
+                        if hasattr(channel, 'bits'):
+                            data.bits = channel.bits
+                    elif data.unit is None:
+                        data.override_unit(channel.unit)
+
+                    # update channel type for trends
+                    if data.channel.type is None and (
+                            data.channel.trend is not None):
+                        if data.dt.to('s').value == 1:
+                            data.channel.type = 's-trend'
+                        elif data.dt.to('s').value == 60:
+                            data.channel.type = 'm-trend'
+
+                    # append and coalesce
+                    add_timeseries(data, key=key, coalesce=True)
 
     # rebuilt global channel list with new parameters
     update_channel_params()
@@ -728,28 +918,87 @@ def _get_timeseries_dict(channels, segments, config=None,
     return locate_data(channels, segments, list_class=ListClass)
 
 
+def get_read_chunk_duration(config):
+    """Return the maximum duration (seconds) of a single data read
+
+    This is taken from the ``[general] chunk-duration`` option in the
+    configuration, and defaults to one hour in month and year modes,
+    otherwise segments are read in full.
+
+    Returns
+    -------
+    duration : `int` or `None`
+        the duration of a single chunk, or `None` to not split segments
+    """
+    try:
+        return config.getint('general', 'chunk-duration') or None
+    except (NoSectionError, NoOptionError):
+        pass
+    if mode.get_mode() >= mode.Mode.month:
+        return 3600
+    return None
+
+
+def chunk_segments(segments, duration):
+    """Split segments into chunks no longer than a given duration
+
+    Chunk boundaries are aligned to integer multiples of ``duration``
+    in GPS time, so that, for ``duration`` a multiple of 60, each chunk
+    can be read from minute-trend data.
+
+    Parameters
+    ----------
+    segments : `~gwpy.segments.SegmentList`
+        the segments to split
+
+    duration : `int`
+        the maximum duration of a chunk
+
+    Returns
+    -------
+    chunks : `~gwpy.segments.SegmentList`
+        the (uncoalesced) list of chunks
+    """
+    out = type(segments)()
+    for seg in segments:
+        start = seg[0]
+        while start < seg[1]:
+            end = min((floor(start / duration) + 1) * duration, seg[1])
+            out.append(type(seg)(start, end))
+            start = end
+    return out
+
+
+def _statevector_names(channels, statevector):
+    """Return the names of those channels to be stored as `StateVector`
+
+    ``statevector`` can be a `bool`, applying to all ``channels``, or a
+    collection of those channels that should be treated as state-vectors.
+    """
+    if isinstance(statevector, (list, tuple, set, frozenset)):
+        return set(get_channel(c).ndsname for c in statevector)
+    if statevector:
+        return set(c.ndsname for c in channels)
+    return set()
+
+
 def locate_data(channels, segments, list_class=TimeSeriesList):
     """Find and return available (already loaded) data
+
+    The returned series are views of the data in global memory, wherever
+    possible.
     """
     keys = dict((c.ndsname, make_globalv_key(c)) for c in channels)
 
     # return correct data
     out = OrderedDict()
     for channel in channels:
-        data = list_class()
-        if keys[channel.ndsname] not in globalv.DATA:
+        try:
+            stored = globalv.DATA[keys[channel.ndsname]]
+        except KeyError:
             out[channel.ndsname] = list_class()
         else:
-            for ts in globalv.DATA[keys[channel.ndsname]]:
-                for seg in segments:
-                    if abs(seg) == 0 or abs(seg) < ts.dt.value:
-                        continue
-                    if ts.span.intersects(seg):
-                        common = map(float, ts.span & seg)
-                        cropped = ts.crop(*common, copy=False)
-                        if cropped.size:
-                            data.append(cropped)
-        out[channel.ndsname] = data.coalesce()
+            out[channel.ndsname] = stored.crop_segments(segments)
     return out
 
 
@@ -838,7 +1087,8 @@ def add_timeseries(timeseries, key=None, coalesce=True):
         `~gwpy.timeseries.TimeSeries.name` of the series
 
     coalesce : `bool`, optional
-        coalesce contiguous series after adding, defaults to `True`
+        merge the new series with contiguous neighbours after adding,
+        defaults to `True`
     """
     if timeseries.channel is not None:
         # transfer parameters from timeseries.channel to the globalv channel
@@ -846,24 +1096,179 @@ def add_timeseries(timeseries, key=None, coalesce=True):
     if key is None:
         key = timeseries.name or timeseries.channel.ndsname
     if isinstance(timeseries, StateVector):
-        globalv.DATA.setdefault(key, StateVectorList())
+        globalv.DATA.setdefault(key, StateVectorStore())
     else:
-        globalv.DATA.setdefault(key, TimeSeriesList())
-    globalv.DATA[key].append(timeseries)
-    if coalesce:
-        globalv.DATA[key].coalesce()
+        globalv.DATA.setdefault(key, TimeSeriesStore())
+    timeseries = cast_for_storage(timeseries)
+    globalv.DATA[key].add(timeseries, coalesce=coalesce)
+
+
+# -- trend pyramids ----------------------------------------------------------
+
+#: durations (seconds) of the downsampled trend products in daily archives
+PYRAMID_LEVELS = (60, 600, 3600)
+
+#: statistics computed for each trend product
+PYRAMID_STATISTICS = ('mean', 'min', 'max')
+
+
+def downsample_timeseries(timeseries, duration, statistic='mean',
+                          origin=0):
+    """Compute a trend of a `TimeSeries` over fixed-duration bins
+
+    Bins are aligned to integer multiples of ``duration`` after the
+    ``origin`` GPS time, so that trends of contiguous data can be joined.
+    Partial bins at either end of the data are included, and are computed
+    from those samples they contain.
+
+    Parameters
+    ----------
+    timeseries : `~gwpy.timeseries.TimeSeries`
+        the data to downsample
+
+    duration : `int`
+        the duration (seconds) of each bin, must be an integer multiple
+        of the sample period of ``timeseries``
+
+    statistic : `str`, optional
+        the statistic to compute in each bin, one of ``'mean'``,
+        ``'min'``, or ``'max'``
+
+    origin : `float`, optional
+        the GPS time to which to align the bins
+
+    Returns
+    -------
+    trend : `~gwpy.timeseries.TimeSeries`, `None`
+        the trend, or `None` if the data are empty, or cannot be divided
+        evenly into bins
+    """
+    dt = timeseries.dt.to('s').value
+    nbin = duration / dt
+    if nbin <= 1 or not nbin.is_integer() or not timeseries.size:
+        return None
+    nbin = int(nbin)
+    t0 = timeseries.t0.value - origin
+    start = floor(t0 / duration) * duration
+    values = timeseries.value
+    # number of samples before the first bin boundary, and up to the
+    # end of the last full bin
+    head = min(int(round((ceil(t0 / duration) * duration - t0) / dt)),
+               values.size)
+    nfull = (values.size - head) // nbin
+    tail = head + nfull * nbin
+    func = getattr(numpy, 'nan%s' % statistic)
+    pieces = []
+    with warnings.catch_warnings():  # all-NaN bins
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if head:
+            pieces.append([func(values[:head])])
+        if nfull:
+            pieces.append(func(values[head:tail].reshape(nfull, nbin),
+                               axis=1))
+        if tail < values.size:
+            pieces.append([func(values[tail:])])
+    trend = type(timeseries)(numpy.concatenate(pieces), t0=start + origin,
+                             dt=duration, name=timeseries.name,
+                             channel=timeseries.channel)
+    trend.override_unit(timeseries.unit)
+    return trend
+
+
+def pyramid_key(key, statistic):
+    """Returns the globalv key for a trend read from a trend pyramid
+
+    The ``'mean'``, ``'min'``, and ``'max'`` trends of a channel are
+    stored alongside, not in place of, the original data.
+    """
+    return '%s.%s' % (key, statistic)
+
+
+# cache of FIR filter designs for resampling, keyed by
+# (input rate, output rate, number of taps, window)
+FIR_CACHE = dict()
+
+# order of the FIR anti-aliasing filter for resampling
+RESAMPLE_FIR_ORDER = 60
+
+
+def design_resample_fir(inrate, outrate, n=RESAMPLE_FIR_ORDER,
+                        window='hamming'):
+    """Return the FIR anti-aliasing filter for an integer downsampling
+
+    Designs are cached, so that each is only computed once per process.
+
+    Parameters
+    ----------
+    inrate : `float`
+        the sampling rate of the input data
+
+    outrate : `float`
+        the target sampling rate
+
+    n : `int`, optional
+        the number of taps in the filter (minus one)
+
+    window : `str`, optional
+        the window to use in the filter design
+
+    Returns
+    -------
+    b : `numpy.ndarray`
+        the FIR filter coefficients
+    """
+    key = (float(inrate), float(outrate), int(n), window)
+    try:
+        return FIR_CACHE[key]
+    except KeyError:
+        factor = key[0] / key[1]
+        return FIR_CACHE.setdefault(
+            key, signal.firwin(n + 1, 1. / factor, window=window))
+
+
+def _resample_batch(series, rate, window='hamming'):
+    """Resample a number of like-sampled series in one 2-D operation
+
+    This replicates `~gwpy.timeseries.TimeSeries.resample` with
+    ``ftype='fir'``, but applies the (cached) filter design to all
+    inputs at once.
+    """
+    inrate = series[0].sample_rate.value
+    factor = inrate / rate
+    stack = numpy.stack([ts.value for ts in series])
+    if factor.is_integer():
+        b = design_resample_fir(inrate, rate, window=window)
+        out = signal.filtfilt(b, [1.], stack, axis=-1)[:, ::int(factor)]
+    else:
+        nsamp = int(stack.shape[-1] * series[0].dx.value * rate)
+        out = signal.resample(stack, nsamp, window=window, axis=-1)
+    out = numpy.ascontiguousarray(out)
+    resampled = []
+    for ts, row in zip(series, out):
+        new = row.view(type(ts))
+        new.__metadata_finalize__(ts)
+        new._unit = ts.unit
+        new.sample_rate = rate
+        resampled.append(new)
+    return resampled
 
 
 def resample_timeseries_dict(tsd, nproc=1, **sampling_dict):
     """Resample a `TimeSeriesDict`
 
+    Series with the same input and output sampling rates, and the same
+    size and type, are resampled together as a single 2-D array, using
+    cached FIR filter designs (see `design_resample_fir`).
+    `~gwpy.timeseries.StateVector` series are not filtered, but are
+    resampled bit-wise using `~gwpy.timeseries.StateVector.resample`.
+
     Parameters
     ----------
     tsd : `~gwpy.timeseries.TimeSeriesDict`
         the input dict to resample
 
     nproc : `int`, optional
-        the number of parallel processes to use
+        the number of parallel threads to use
 
     **sampling_dict
         ``<name>=<sampling frequency>`` pairs defining new
@@ -875,31 +1280,196 @@ def resample_timeseries_dict(tsd, nproc=1, **sampling_dict):
         a new dict with the keys from ``tsd`` and resampled values, if
         that key was included in ``sampling_dict``, or the original value
     """
-    # define resample function (must take single argument)
-    def _resample(args):
-        ts, fs = args
+    out = dict(tsd.items())
+
+    # group timeseries with new sampling frequencies
+    groups = OrderedDict()
+    for name, ts in tsd.items():
+        fs = sampling_dict.get(name)
         if fs and units.Quantity(fs, "Hz") == ts.sample_rate:
             warnings.warn(
                 "requested resample rate for {0} matches native rate ({1}), "
                 "please update configuration".format(ts.name, ts.sample_rate),
                 UserWarning,
             )
+        elif fs and isinstance(ts, StateVector):
+            # filtering would destroy the bitmask
+            out[name] = ts.resample(fs)
         elif fs:
-            return ts.resample(fs, ftype='fir', window='hamming')
-        return ts
-
-    # group timeseries with new sampling frequencies
-    inputs = ((ts, sampling_dict.get(name)) for name, ts in tsd.items())
+            key = (type(ts), ts.sample_rate.value, float(fs), ts.shape,
+                   ts.dtype)
+            groups.setdefault(key, []).append(name)
+
+    # split groups into (at most) nproc batches
+    nproc = max(int(nproc), 1)
+    batches = []
+    for key, names in groups.items():
+        size = int(ceil(len(names) / float(nproc)))
+        for i in range(0, len(names), size):
+            batches.append((key[2], names[i:i+size]))
 
     # apply resampling
-    resampled = multiprocess_with_queues(nproc, _resample, inputs)
+    def _resample(batch):
+        rate, names = batch
+        return names, _resample_batch([tsd[name] for name in names], rate)
+
+    if nproc == 1 or len(batches) < 2:
+        results = map(_resample, batches)
+    else:
+        with ThreadPoolExecutor(max_workers=nproc) as executor:
+            results = list(executor.map(_resample, batches))
 
     # map back to original dict keys
-    return dict(zip(list(tsd), resampled))
+    for names, resampled in results:
+        out.update(zip(names, resampled))
+    return out
+
+
+def resample_timeseries_chunk(tsd, carry, final=True, nproc=1,
+                              **sampling_dict):
+    """Resample one of a sequence of contiguous chunks of data
 
+    The FIR filter used for integer downsampling spoils the first and last
+    `RESAMPLE_FIR_ORDER` samples of its input, so resampling each chunk on
+    its own would leave transients at every chunk boundary. Instead, each
+    series is joined to the end of the previous chunk, stored in ``carry``,
+    and (unless ``final``) the end of each output series is held back for
+    the next chunk, so that the output matches resampling all of the data
+    at once.
 
-def filter_timeseries(ts, filt):
+    Parameters
+    ----------
+    tsd : `~gwpy.timeseries.TimeSeriesDict`
+        the input dict to resample
+
+    carry : `dict`
+        the unused data from the previous chunk, keyed by name, this is
+        updated in place
+
+    final : `bool`, optional
+        `True` if the next chunk does not follow on from this one, so that
+        all of the data are returned
+
+    nproc : `int`, optional
+        the number of parallel threads to use
+
+    **sampling_dict
+        ``<name>=<sampling frequency>`` pairs defining new
+        sampling frequencies for keys of ``tsd``
+
+    Returns
+    -------
+    resampled : `dict`
+        a new dict of resampled data, see `resample_timeseries_dict`,
+        series whose data are all held back are left out
+    """
+    joined = OrderedDict()
+    crop = {}
+    for name, ts in tsd.items():
+        tail, nskip = carry.pop(name, (None, 0))
+        fs = sampling_dict.get(name)
+        factor = fs and ts.sample_rate.value / float(fs)
+        if (not fs or isinstance(ts, StateVector) or factor <= 1 or
+                not factor.is_integer()):
+            joined[name] = ts
+            continue
+        factor = int(factor)
+        if (tail is None or tail.sample_rate != ts.sample_rate or
+                abs(tail.span[1] - ts.span[0]) >= ts.dt.value / 2.):
+            tail, nskip = None, 0
+        if tail is not None:
+            ts = tail.append(ts, inplace=False)
+        # hold back data too short to filter until the next chunk
+        if not final and ts.size <= 3 * (RESAMPLE_FIR_ORDER + 1):
+            carry[name] = (ts, nskip)
+            continue
+        joined[name] = ts
+        # hold back enough samples to cover the filter transient, keeping
+        # the output samples on the same grid as for the full data
+        pad = int(ceil(RESAMPLE_FIR_ORDER / float(factor))) * factor
+        end = ts.size if final else max(
+            (ts.size - pad) // factor * factor, nskip)
+        if not final:
+            start = max(end - pad, 0)
+            carry[name] = (ts[start:], end - start)
+        crop[name] = (nskip // factor, -(-end // factor))
+
+    out = resample_timeseries_dict(joined, nproc=nproc, **sampling_dict)
+    for name, (start, end) in crop.items():
+        if end > start:
+            out[name] = out[name][start:end]
+        else:  # all held back for the next chunk
+            out.pop(name)
+    return out
+
+
+# cache of second-order sections for channel filters, keyed by
+# (channel key, sample rate)
+FILTER_SOS = dict()
+
+# final filter conditions for each channel, as
+# (sample rate, GPS end time, zf) tuples, keyed by channel key
+FILTER_STATE = dict()
+
+
+def get_filter_sos(key, sample_rate, filt):
+    """Return the second-order sections for the given filter
+
+    Each conversion is cached, so is only performed once per channel
+    and sample rate.
+
+    Parameters
+    ----------
+    key : `str`
+        the unique key for this channel
+
+    sample_rate : `float`
+        the sample rate of the data to filter
+
+    filt : `tuple`
+        the digital ZPK filter definition
+
+    Returns
+    -------
+    sos : `numpy.ndarray`
+        the ``(n, 6)`` array of second-order sections
+    """
+    cachekey = (key, float(sample_rate))
+    try:
+        return FILTER_SOS[cachekey]
+    except KeyError:
+        form, zpk = parse_filter(filt, sample_rate=sample_rate)
+        if form == 'zpk':
+            sos = signal.zpk2sos(*zpk)
+        else:
+            sos = signal.tf2sos(*zpk)
+        return FILTER_SOS.setdefault(cachekey, sos)
+
+
+def get_filter_state(key, ts, nsections):
+    """Return the initial filter conditions for this `TimeSeries`
+
+    The state saved for ``key`` is only used if it was recorded at the
+    same sample rate, and at the start time of ``ts``, otherwise the
+    filter starts from rest (zero state).
+    """
+    zi = numpy.zeros((nsections, 2))
+    try:
+        rate, end, zf = FILTER_STATE[key]
+    except KeyError:
+        return zi
+    if (rate == ts.sample_rate.value and zf.shape == zi.shape and
+            abs(end - ts.t0.value) < ts.dt.value / 2.):
+        return zf
+    return zi
+
+
+def filter_timeseries(ts, filt, key=None):
     """Filter a `TimeSeris` using a function or a ZPK definition.
+
+    If ``key`` is given, ZPK filters are applied using cached second-order
+    sections, and the filter state is carried between contiguous calls
+    for the same ``key`` (see `FILTER_STATE`).
     """
     # filter with function
     if callable(filt):
@@ -913,5 +1483,16 @@ def filter_timeseries(ts, filt):
                 raise
 
     # filter with gain
-    else:
+    elif key is None:
         return ts.filter(*filt)
+
+    # filter with state
+    rate = ts.sample_rate.value
+    sos = get_filter_sos(key, rate, filt)
+    zi = get_filter_state(key, ts, sos.shape[0])
+    out, zf = signal.sosfilt(sos, ts.value, zi=zi)
+    FILTER_STATE[key] = (rate, ts.span[1], zf)
+    new = out.view(type(ts))
+    new.__metadata_finalize__(ts)
+    new._unit = ts.unit
+    return new
@@ -22,10 +22,14 @@
 from collections import OrderedDict
 from functools import wraps
 
+import numpy
+
 from ligo.segments import segmentlist as LigoSegmentList
 
 from gwpy.segments import (DataQualityFlag, SegmentList, Segment)
+from gwpy.timeseries import StateVector
 
+from .. import globalv
 from ..channels import get_channel
 from ..config import GWSummConfigParser
 
@@ -168,3 +172,59 @@ def make_globalv_key(channels, fftparams=None):
     if fftparams is not None:
         parts.append(fftparams)
     return ';'.join(map(str, parts))
+
+
+# -- storage data types -------------------------------------------------------
+
+def get_storage_dtype(channel=None):
+    """Return the data type in which to store data for a channel
+
+    This is the ``storage_dtype`` attribute of the channel (set via the
+    ``storage-dtype`` channel option), if given, otherwise the global
+    default (`gwsumm.globalv.STORAGE_DTYPE`).
+
+    Returns
+    -------
+    dtype : `numpy.dtype` or `None`
+        the storage type, or `None` to store data as given (lossless)
+    """
+    dtype = None
+    if channel is not None:
+        dtype = getattr(get_channel(channel), 'storage_dtype', None)
+    if dtype is None:
+        dtype = globalv.STORAGE_DTYPE
+    if dtype is None or str(dtype).lower() == 'lossless':
+        return None
+    return numpy.dtype(dtype)
+
+
+def cast_for_storage(data, channel=None):
+    """Cast a data series to its storage type
+
+    Only floating-point (and complex) data are cast, integer data and
+    `~gwpy.timeseries.StateVector` series are always stored as given.
+    Complex data are cast to the complex type matching the precision of
+    the storage type.
+
+    Parameters
+    ----------
+    data : `~gwpy.types.Array`
+        the data to cast
+
+    channel : `str`, `~gwpy.detector.Channel`, optional
+        the channel whose options to use, defaults to ``data.channel``
+
+    Returns
+    -------
+    data : `~gwpy.types.Array`
+        the cast data, or the input if no cast is required
+    """
+    if channel is None:
+        channel = data.channel
+    dtype = get_storage_dtype(channel)
+    if (dtype is None or isinstance(data, StateVector) or
+            data.dtype.kind not in 'fc'):
+        return data
+    if data.dtype.kind == 'c' and dtype.kind == 'f':
+        dtype = numpy.result_type(dtype, numpy.complex64)
+    return data.astype(dtype, copy=False)
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Batched Welch spectrograms, and a shared-memory pool to run them
+
+Each 'job' is a set of equal-length arrays (e.g. one segment of data for
+several channels) that are processed with the same FFT parameters.
+When run in parallel with `map_welch`, the input and output arrays for each
+job are passed to the worker processes in shared memory (memory-mapped
+files, in ``/dev/shm`` where available), rather than being pickled.
+"""
+
+import mmap
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from gwpy.signal.window import recommended_overlap
+
+from . import fft
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+#: Welch averaging methods that can be calculated in a batch
+BATCH_METHODS = {
+    'welch': 'mean',
+    'median': 'median',
+    'scipy-welch': 'mean',
+    'scipy-median': 'median',
+}
+
+#: maximum size (bytes) of the data array for a single batched FFT
+BATCH_BUFFER_SIZE = 2 ** 26
+
+#: directory in which to create shared memory blocks, `None` to use the
+#: system temporary directory
+SHARED_MEMORY_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+# -- kernel -------------------------------------------------------------------
+
+def chunk_starts(size, nstride, noverlap):
+    """Return the index of the first sample of each spectrogram chunk
+
+    This matches the chunking of `gwpy.timeseries.TimeSeries.spectrogram`:
+    each time bin is calculated from ``nstride + noverlap`` samples, with
+    the first and last chunks pinned to the edges of the data.
+    """
+    nfft = nstride + noverlap
+    starts = []
+    x = 0
+    step = nstride - int(noverlap // 2.)  # the first step is smaller
+    while x + nstride <= size:
+        if x + nfft >= size:
+            x = size - nfft  # pin to the end of the series
+        starts.append(x)
+        x += step
+        step = nstride
+    return numpy.asarray(starts, dtype=int)
+
+
+def welch_layout(size, fs, stride, fftlength, overlap=None, window=None):
+    """Normalise FFT parameters for a batched Welch spectrogram
+
+    Returns
+    -------
+    starts : `numpy.ndarray`
+        the index of the first sample of each time bin
+
+    nfft : `int`
+        the number of samples in each FFT
+
+    noverlap : `int`
+        the number of samples of overlap between FFTs
+
+    window : `numpy.ndarray`
+        the window array
+    """
+    nstride = int(stride * fs)
+    nfft = int(fftlength * fs)
+    if overlap is None and isinstance(window, str):
+        noverlap = recommended_overlap(window, nfft)
+    elif overlap is None:
+        noverlap = 0
+    else:
+        noverlap = int(overlap * fs)
+    if window is None:  # scipy default
+        window = 'hann'
+    if isinstance(window, (str, tuple)):
+        window = fft.get_window(window, nfft)
+
+    if nfft > nstride:
+        raise ValueError("fftlength cannot be greater than stride")
+    if noverlap >= nfft:
+        raise ValueError("overlap must be less than fftlength")
+    return chunk_starts(size, nstride, noverlap), nfft, noverlap, window
+
+
+def output_shape(nseries, size, fs, stride, fftlength, overlap=None,
+                 window=None, **kwargs):
+    """Return the shape of the `batch_welch` output for the given inputs
+    """
+    starts, nfft = welch_layout(size, fs, stride, fftlength,
+                                overlap=overlap, window=window)[:2]
+    return nseries, starts.size, nfft // 2 + 1
+
+
+def output_dtype(dtype):
+    """Return the dtype of the `batch_welch` output for the given input
+    """
+    return numpy.finfo(numpy.result_type(dtype, numpy.float32)).dtype
+
+
+def batch_welch(data, fs, stride, fftlength, overlap=None, window=None,
+                average='mean', out=None):
+    """Calculate Welch spectrograms for a set of equal-length arrays
+
+    The PSDs for all arrays are calculated with a single call to `welch`
+    for each block of time bins.
+
+    Parameters
+    ----------
+    data : `list` of `numpy.ndarray`, `numpy.ndarray`
+        the input data, one array (or row) per series
+
+    fs : `float`
+        the sample rate of the data
+
+    stride : `float`
+        the duration (seconds) of each time bin
+
+    fftlength : `float`
+        the duration (seconds) of each FFT
+
+    overlap : `float`, optional
+        the overlap (seconds) between FFTs
+
+    window : `str`, `numpy.ndarray`, optional
+        the window function to apply
+
+    average : `str`, optional
+        the averaging method, either ``'mean'`` or ``'median'``
+
+    out : `numpy.ndarray`, optional
+        the array into which to write the PSDs
+
+    Returns
+    -------
+    freqs : `numpy.ndarray`
+        the frequency array of each spectrogram
+
+    psds : `numpy.ndarray`
+        a 3-D array of PSDs with shape ``(nseries, ntimes, nfreqs)``
+    """
+    nseries = len(data)
+    starts, nfft, noverlap, window = welch_layout(
+        len(data[0]), fs, stride, fftlength, overlap=overlap, window=window)
+    offsets = numpy.arange(int(stride * fs) + noverlap)
+
+    # calculate PSDs for blocks of time bins, limiting memory usage
+    itemsize = max(d.dtype.itemsize for d in data)
+    nblock = max(1, BATCH_BUFFER_SIZE // (nseries * offsets.size * itemsize))
+    freqs = numpy.fft.rfftfreq(nfft, 1. / fs)
+    for i in range(0, starts.size, nblock):
+        idx = starts[i:i+nblock, None] + offsets
+        stack = numpy.stack([d[idx] for d in data])
+        psd = welch(stack, fs, window, noverlap=noverlap, average=average)
+        if out is None:
+            out = numpy.empty((nseries, starts.size, freqs.size),
+                              dtype=psd.dtype)
+        out[:, i:i+nblock] = psd
+    return freqs, out
+
+
+def welch(data, fs, window, noverlap=0, average='mean'):
+    """Estimate the PSD of data along the last axis using Welch's method
+
+    This reproduces :func:`scipy.signal.welch` (with the default constant
+    detrend and density scaling), but uses the active
+    `~gwsumm.data.fft.FFTBackend`, and cached median bias factors.
+
+    Parameters
+    ----------
+    data : `numpy.ndarray`
+        the input data, of any shape
+
+    fs : `float`
+        the sample rate of the data
+
+    window : `numpy.ndarray`
+        the window array, whose length sets the FFT length
+
+    noverlap : `int`, optional
+        the number of samples of overlap between FFTs
+
+    average : `str`, optional
+        the averaging method, either ``'mean'`` or ``'median'``
+
+    Returns
+    -------
+    psd : `numpy.ndarray`
+        the one-sided PSD, with the same leading dimensions as ``data``
+    """
+    nfft = window.size
+    step = nfft - noverlap
+    nseg = (data.shape[-1] - noverlap) // step
+    idx = numpy.arange(nseg)[:, None] * step + numpy.arange(nfft)
+    dtype = output_dtype(data.dtype)
+    segs = data[..., idx].astype(dtype, copy=False)
+    segs -= segs.mean(axis=-1, keepdims=True)
+    segs *= window.astype(dtype, copy=False)
+    spec = fft.get_backend().rfft(segs, axis=-1)
+    psd = spec.real ** 2 + spec.imag ** 2
+    psd *= 1. / (fs * (window * window).sum())
+    if nfft % 2:
+        psd[..., 1:] *= 2
+    else:
+        psd[..., 1:-1] *= 2
+    if average == 'median':
+        return numpy.median(psd, axis=-2) / fft.median_bias(nseg)
+    if average == 'mean':
+        return psd.mean(axis=-2)
+    raise ValueError("unknown average method %r, choose 'mean' or "
+                     "'median'" % average)
+
+
+# -- shared-memory pool -------------------------------------------------------
+
+class _SharedBlock(object):
+    """A block of memory shared between processes via a memory-mapped file
+
+    Parameters
+    ----------
+    size : `int`
+        the size (bytes) of the block
+
+    name : `str`, optional
+        the path of an existing block to attach to, otherwise a new
+        block is created
+    """
+    def __init__(self, size, name=None):
+        if name is None:
+            fd, name = tempfile.mkstemp(prefix='gwsumm-welch-',
+                                        dir=SHARED_MEMORY_DIR)
+            os.ftruncate(fd, size)
+        else:
+            fd = os.open(name, os.O_RDWR)
+        try:
+            self.buf = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.name = name
+
+    def close(self):
+        """Unmap this block from memory
+        """
+        self.buf.close()
+
+    def unlink(self):
+        """Remove the file backing this block
+        """
+        os.remove(self.name)
+
+
+def _attach(name, shape, dtype):
+    """Attach to a shared memory block as a `numpy.ndarray`
+    """
+    size = max(int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize, 1)
+    shm = _SharedBlock(size, name=name)
+    return shm, numpy.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _run_job(inbuf, outbuf, fs, kwargs):
+    """Run `batch_welch` in a worker process
+
+    ``inbuf`` and ``outbuf`` are ``(name, shape, dtype)`` tuples that
+    describe the shared memory blocks for the input and output arrays.
+    """
+    inshm, data = _attach(*inbuf)
+    outshm, out = _attach(*outbuf)
+    try:
+        return batch_welch(data, fs, out=out, **kwargs)[0]
+    finally:
+        del data, out
+        inshm.close()
+        outshm.close()
+
+
+class _SharedJob(object):
+    """Shared memory blocks for one `map_welch` job
+    """
+    def __init__(self, data, fs, kwargs):
+        size = len(data[0])
+        dtype = numpy.result_type(*data)
+        self.inshm = _SharedBlock(max(len(data) * size * dtype.itemsize, 1))
+        self.inbuf = (self.inshm.name, (len(data), size), dtype)
+        inarr = numpy.ndarray(self.inbuf[1], dtype=dtype,
+                              buffer=self.inshm.buf)
+        for i, row in enumerate(data):
+            inarr[i] = row
+        del inarr
+
+        shape = output_shape(len(data), size, fs, **kwargs)
+        odtype = output_dtype(dtype)
+        self.outshm = _SharedBlock(
+            max(int(numpy.prod(shape)) * odtype.itemsize, 1))
+        self.outbuf = (self.outshm.name, shape, odtype)
+
+    def result(self):
+        """Return a copy of the output array
+        """
+        return numpy.ndarray(self.outbuf[1], dtype=self.outbuf[2],
+                             buffer=self.outshm.buf).copy()
+
+    def close(self):
+        """Release the shared memory blocks
+        """
+        for shm in (self.inshm, self.outshm):
+            shm.close()
+            shm.unlink()
+
+
+def map_welch(jobs, nproc=1):
+    """Calculate a number of batched Welch spectrograms
+
+    If ``nproc > 1``, jobs are distributed over a pool of processes,
+    with at most ``2 * nproc`` jobs (and their shared memory blocks) in
+    flight at any time.
+
+    Parameters
+    ----------
+    jobs : `iterable` of `tuple`
+        ``(data, fs, kwargs)`` for each job, passed to `batch_welch`
+
+    nproc : `int`, optional
+        the number of processes to use
+
+    Yields
+    ------
+    freqs, psds : `numpy.ndarray`
+        the output of `batch_welch` for each job, in order
+    """
+    jobs = list(jobs)
+    if nproc <= 1 or len(jobs) < 2:
+        for data, fs, kwargs in jobs:
+            yield batch_welch(data, fs, **kwargs)
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=min(nproc, len(jobs))) as executor:
+        try:
+            for data, fs, kwargs in jobs:
+                if len(pending) >= 2 * nproc:
+                    yield _collect(*pending.popleft())
+                job = _SharedJob(data, fs, kwargs)
+                pending.append((job, executor.submit(
+                    _run_job, job.inbuf, job.outbuf, fs, kwargs)))
+            while pending:
+                yield _collect(*pending.popleft())
+        finally:
+            for job, future in pending:
+                future.cancel()
+                try:
+                    future.result()
+                except Exception:
+                    pass
+                job.close()
+
+
+def _collect(job, future):
+    """Wait for a job to finish, and return its output
+    """
+    try:
+        return future.result(), job.result()
+    finally:
+        job.close()
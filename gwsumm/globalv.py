@@ -26,16 +26,23 @@ from gwpy.time import to_gps
 from gwpy.segments import DataQualityDict
 from gwpy.detector import ChannelList
 
+from .store import MemoryStore
+
 CHANNELS = ChannelList()
 STATES = {}
 
-DATA = {}
-SPECTROGRAMS = {}
+DATA = MemoryStore('timeseries')
+SPECTROGRAMS = MemoryStore('spectrogram')
 SPECTRUM = {}
-COHERENCE_COMPONENTS = {}
+SPECTRUM_SKETCHES = {}
+COHERENCE_COMPONENTS = MemoryStore('coherence-components')
 COHERENCE_SPECTRUM = {}
 SEGMENTS = DataQualityDict()
-TRIGGERS = {}
+SEGMENT_QUERIES = {}  # times queried for each flag, known or not
+TRIGGERS = MemoryStore('triggers')
+
+# type in which to store data (None means as given)
+STORAGE_DTYPE = None
 
 VERBOSE = False
 PROFILE = False
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Plan data access for a complete `~gwsumm.tabs.TabList`
+
+Each `~gwsumm.tabs.DataTab` reads the data it needs when it is processed,
+meaning the same data can be requested many times by different tabs, and
+different states. The `DataPlan` walks every tab, state, and plot up-front,
+and builds a single deduplicated set of requests, so that each data source
+is accessed only once, before any tabs are processed.
+
+Segments for every flag (from state definitions, segment plots, and
+time-volume plots) are fetched first, in a single query over the full span
+of the job, so that finalising the states of each tab is served from memory.
+"""
+
+from collections import OrderedDict
+
+from gwpy.segments import (Segment, SegmentList)
+
+from .config import GWSummConfigParser
+from .data import (get_timeseries_dict, get_spectrograms,
+                   get_coherence_spectrograms)
+from .segments import get_segments
+from .state import (ALLSTATE, get_state)
+from .tabs import get_tab
+from .triggers import get_triggers
+from .utils import (re_flagdiv, vprint)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+REQUEST_TYPES = [
+    'segments',
+    'timeseries',
+    'statevector',
+    'spectrogram',
+    'rayleigh-spectrogram',
+    'coherence-spectrogram',
+    'triggers',
+]
+
+
+class DataPlan(object):
+    """A deduplicated set of data requests for many tabs
+
+    Each request is stored as a ``(item, segments)`` pair for a given
+    request type, where the ``item`` is a channel, a flag, a pair of
+    channels (for coherence), or an ``(etg, channel)`` pair (for triggers),
+    and the segments are the union of all segments requested for that item
+    by any tab or state.
+    """
+    def __init__(self):
+        self.requests = OrderedDict((type_, OrderedDict()) for
+                                    type_ in REQUEST_TYPES)
+        self.fftparams = {}
+
+    def __len__(self):
+        return sum(map(len, self.requests.values()))
+
+    def add(self, type_, item, segments):
+        """Add a request for the given item over some segments
+
+        Parameters
+        ----------
+        type_ : `str`
+            the type of data request, one of `REQUEST_TYPES`
+
+        item : `object`
+            the channel, flag, or other identifier for the data
+
+        segments : `~gwpy.segments.SegmentList`
+            the segments for which the data are required
+        """
+        known = self.requests[type_].setdefault(item, SegmentList())
+        known.extend(segments)
+        known.coalesce()
+
+    def add_tab(self, tab, config=GWSummConfigParser()):
+        """Add all of the data requests for a `~gwsumm.tabs.DataTab`
+
+        The states for the tab should have been finalised before calling
+        this method.
+        """
+        errors = getattr(tab, 'error', {})
+        states = [(state, False) for state in tab.states if
+                  not errors.get(state, None)]
+        if any(p.all_data and p.new for p in tab.plots):
+            states.append((get_state(ALLSTATE), True))
+
+        for state, all_data in states:
+            requests = tab.get_data_requests(state, all_data=all_data,
+                                             config=config)
+            self.fftparams = requests['fftparams']
+            active = state.active
+            specsegs = requests['specsegs']
+            for flag in requests['segments']:
+                self.add('segments', flag, active)
+            for type_ in ('timeseries', 'statevector'):
+                for channel in requests[type_]:
+                    self.add(type_, channel, active)
+            for type_ in ('spectrogram', 'rayleigh-spectrogram'):
+                for channel in requests[type_]:
+                    self.add(type_, channel, specsegs)
+            csg = requests['coherence-spectrogram']
+            for pair in zip(csg[0::2], csg[1::2]):
+                self.add('coherence-spectrogram', pair, specsegs)
+            # tabs with their own trigger cache read triggers themselves
+            if getattr(tab, 'cache', None) is None:
+                for etg, channel in requests['triggers']:
+                    self.add('triggers', (etg, channel), active)
+
+    def add_flags(self, tab):
+        """Add segment requests for every flag used by a `~gwsumm.tabs.DataTab`
+
+        This includes the flags in each state definition (except for states
+        read from a file, defined by a channel threshold, or using their own
+        segment database URL), and those used by segment and time-volume
+        plots, with compound flags split into their components. Flags are
+        requested over the full span of the tab (and state), and this
+        method does not require the states to be finalised.
+        """
+        span = SegmentList([Segment(tab.start, tab.end)])
+        flags = set()
+        for state in tab.states:
+            if (not state.definition or state.filename or state.url or
+                    state.MATH_DEFINITION.search(str(state.definition))):
+                continue
+            for flag in re_flagdiv.split(str(state.definition))[::2]:
+                if flag:
+                    self.add('segments', flag, span | state.known)
+        flags.update(tab.get_flags('segments', new=False))
+        flags.update(tab.get_flags('timeseries', type='time-volume',
+                                   new=False))
+        flags.update(tab.get_flags('spectrogram', type='strain-time-volume',
+                                   new=False))
+        for flag in flags:
+            self.add('segments', flag, span)
+
+    @classmethod
+    def from_tablist(cls, tablist, config=GWSummConfigParser(),
+                     **stateargs):
+        """Build a `DataPlan` for all of the `DataTabs <DataTab>` in a list
+
+        Parameters
+        ----------
+        tablist : `~gwsumm.tabs.TabList`
+            the list of tabs to plan
+
+        config : `~gwsumm.config.GWSummConfigParser`
+            the configuration for this analysis
+
+        **stateargs
+            other keyword arguments passed to
+            :meth:`~gwsumm.tabs.DataTab.finalize_states`
+
+        Returns
+        -------
+        plan : `DataPlan`
+            the complete plan of data requests for all tabs
+        """
+        DataTab = get_tab('data')
+        plan = cls()
+        tabs = [tab for tab in tablist if
+                isinstance(tab, DataTab) and not tab.ismeta]
+        # query segments for all flags at once, before finalising states
+        for tab in tabs:
+            plan.add_flags(tab)
+        plan.fetch_segments(
+            config=config, segmentcache=stateargs.get('segmentcache', None),
+            segdb_error=stateargs.get('segdb_error', 'raise'))
+        for tab in tabs:
+            tab.finalize_states(config=config, **stateargs)
+            plan.add_tab(tab, config=config)
+        return plan
+
+    def group(self, *types):
+        """Group the requests of the given type(s) by their segments
+
+        Returns
+        -------
+        groups : `list` of `tuple`
+            a `list` of ``(segments, items)`` pairs
+        """
+        groups = OrderedDict()
+        for type_ in types:
+            for item, segments in self.requests[type_].items():
+                key = tuple(map(tuple, segments))
+                groups.setdefault(key, (segments, []))[1].append(item)
+        return list(groups.values())
+
+    def fetch_segments(self, config=GWSummConfigParser(), segmentcache=None,
+                       segdb_error='raise'):
+        """Fetch the segments for all flags in this plan
+
+        All flags are queried together over the union of the segments
+        requested for any of them, so that the segment database receives
+        a single (concurrent) query for all flags, rather than one query
+        for each tab and state.
+        """
+        requests = self.requests['segments']
+        if not requests:
+            return
+        segments = SegmentList()
+        for segs in requests.values():
+            segments.extend(segs)
+        segments.coalesce()
+        vprint("    %d data-quality flags identified for segments\n"
+               % len(requests))
+        get_segments(list(requests), segments, config=config,
+                     segdb_error=segdb_error, cache=segmentcache,
+                     return_=False)
+
+    def execute(self, config=GWSummConfigParser(), nds=None, nproc=1,
+                datacache=None, trigcache=None, segmentcache=None,
+                segdb_error='raise', datafind_error='raise'):
+        """Read all of the data in this plan
+
+        All data are stored in the containers of the `gwsumm.globalv`
+        module, so that subsequent requests from individual tabs are
+        served from memory.
+        """
+        self.fetch_segments(config=config, segmentcache=segmentcache,
+                            segdb_error=segdb_error)
+
+        # read time-series and state-vectors together, so that each
+        # frame file is only read once; channels requested as both are
+        # read as time-series
+        timeseries = self.requests['timeseries']
+        statevectors = self.requests['statevector']
+        for segments, channels in self.group('timeseries', 'statevector'):
+            channels = list(OrderedDict.fromkeys(channels))
+            svchannels = [c for c in channels if
+                          c in statevectors and c not in timeseries]
+            vprint("    %d channels identified for TimeSeries/StateVector\n"
+                   % len(channels))
+            get_timeseries_dict(
+                channels, segments, config=config, nds=nds, nproc=nproc,
+                cache=datacache, datafind_error=datafind_error,
+                return_=False, statevector=svchannels,
+                dtype=dict((str(c), 'uint32') for c in svchannels))
+
+        for segments, channels in self.group('spectrogram'):
+            vprint("    %d channels identified for Spectrogram\n"
+                   % len(channels))
+            get_spectrograms(channels, segments, config=config, nds=nds,
+                             nproc=nproc, return_=False, cache=datacache,
+                             datafind_error=datafind_error, **self.fftparams)
+
+        for segments, channels in self.group('rayleigh-spectrogram'):
+            fp2 = self.fftparams.copy()
+            fp2['method'] = fp2['format'] = 'rayleigh'
+            get_spectrograms(channels, segments, config=config,
+                             return_=False, nproc=nproc, **fp2)
+
+        for segments, pairs in self.group('coherence-spectrogram'):
+            vprint("    %d channel pairs identified for Coherence "
+                   "Spectrogram\n" % len(pairs))
+            fp2 = self.fftparams.copy()
+            fp2['method'] = 'welch'
+            get_coherence_spectrograms(
+                [c for pair in pairs for c in pair], segments, config=config,
+                nds=nds, nproc=nproc, return_=False, cache=datacache,
+                datafind_error=datafind_error, **fp2)
+
+        for segments, triggers in self.group('triggers'):
+            for etg, channel in triggers:
+                get_triggers(channel, etg, segments, config=config,
+                             cache=trigcache, nproc=nproc, return_=False)
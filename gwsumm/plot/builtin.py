@@ -25,6 +25,7 @@ from itertools import cycle
 
 import numpy
 
+from matplotlib import rcParams
 from matplotlib.colors import LogNorm
 
 from astropy.units import Quantity
@@ -38,11 +39,12 @@ from ..mode import (Mode, get_mode)
 from ..utils import re_cchar
 from ..data import (get_timeseries, get_spectrogram,
                     get_coherence_spectrogram, get_spectrum,
-                    get_coherence_spectrum)
+                    get_coherence_spectrum, make_globalv_key, pyramid_key,
+                    PYRAMID_STATISTICS)
 from ..state import ALLSTATE
 from .registry import (get_plot, register_plot)
 from .mixins import DataLabelSvgMixin
-from .utils import usetex_tex
+from .utils import (usetex_tex, decimate_for_display)
 
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
 
@@ -50,6 +52,31 @@ DataPlot = get_plot('data')
 GREEN = (0.2, 0.8, 0.2)
 
 
+def _log_safe(series):
+    """Returns a copy of a series with zeros replaced for log scales
+
+    The input is returned if it contains no zeros.
+    """
+    zeros = series.value == 0
+    if zeros.any():
+        series = series.copy()
+        series.value[zeros] = 1e-100
+    return series
+
+
+def _decimate_method(channel):
+    """Returns the display decimation method for a channel in a group
+
+    Minimum and maximum trends are reduced by their extremes, everything
+    else (including RMS trends) by the mean.
+    """
+    name = str(channel)
+    for method in ('min', 'max'):
+        if name.endswith(('.%s' % method, '-%s' % method)):
+            return method
+    return 'mean'
+
+
 class TimeSeriesDataPlot(DataLabelSvgMixin, DataPlot):
     """DataPlot of some `TimeSeries` data.
     """
@@ -156,6 +183,9 @@ class TimeSeriesDataPlot(DataLabelSvgMixin, DataPlot):
         plotargs = self.parse_plot_kwargs()
         legendargs = self.parse_legend_kwargs()
 
+        # get display resolution
+        pixelwidth = self._get_pixel_width(ax)
+
         # add data
         channels, groups = list(zip(*self.get_channel_groups()))
         for clist, pargs in list(zip(groups, plotargs)):
@@ -164,17 +194,50 @@ class TimeSeriesDataPlot(DataLabelSvgMixin, DataPlot):
             data = [get_timeseries(c, valid, query=False)
                     for c in clist]
 
+            # use archived trends where they resolve the plot, or where
+            # the full data weren't read (see `~gwsumm.archive`), and only
+            # plot the full data where no trends were archived
+            trends = None
+            if len(clist) == 1:
+                trends = self._get_trends(clist[0], valid)
+            if trends and len(trends[0]) and (
+                    not abs(data[0].segments & valid) or
+                    pixelwidth and trends[0][0].dt.value <= pixelwidth):
+                data[0] = get_timeseries(clist[0], valid - trends[0].segments,
+                                         query=False)
+            else:
+                trends = None
+
+            # reduce data to the display resolution
             if len(clist) > 1:
                 data = [tsl.join(gap='pad', pad=numpy.nan) for tsl in data]
+            if len(clist) > 1 and pixelwidth:
+                data = [decimate_for_display(ts, pixelwidth,
+                                             method=_decimate_method(c))
+                        for ts, c in zip(data, clist)]
+            elif pixelwidth:
+                data[0] = type(data[0])(*(
+                    decimate_for_display(ts, pixelwidth) for ts in data[0]))
+            if trends and pixelwidth:
+                trends = [[decimate_for_display(ts, pixelwidth, method=method)
+                           for ts in tsl] for tsl, method in
+                          zip(trends, PYRAMID_STATISTICS)]
+            # double-check log scales (without modifying the data
+            # in place, they may be shared with other plots)
+            if self.logy and len(clist) > 1:
+                data = list(map(_log_safe, data))
+            elif self.logy:
+                data[0] = type(data[0])(*map(_log_safe, data[0]))
+            if self.logy and trends:
+                trends = [list(map(_log_safe, tsl)) for tsl in trends]
             flatdata = [ts for tsl in data for ts in tsl]
+            if trends:
+                flatdata.extend(trends[0])
             # validate parameters
             for ts in flatdata:
                 # double-check empty
                 if ts.x0 is None:
                     ts.epoch = self.start
-                # double-check log scales
-                if self.logy:
-                    ts.value[ts.value == 0] = 1e-100
             # set label
             try:
                 label = pargs.pop('label')
@@ -192,7 +255,10 @@ class TimeSeriesDataPlot(DataLabelSvgMixin, DataPlot):
 
             # plot groups or single TimeSeries
             if len(clist) > 1:
-                data[1].name = None  # force no labels for shades
+                # force no labels for shades (on views, to not rename
+                # cached data)
+                data[1:] = [ts.view() for ts in data[1:]]
+                data[1].name = None
                 data[2].name = None
                 ax.plot_mmm(*data, label=label, **pargs)
             elif len(flatdata) == 0:
@@ -200,6 +266,12 @@ class TimeSeriesDataPlot(DataLabelSvgMixin, DataPlot):
                                            name=label),
                         label=label, **pargs)
             else:
+                # shade between archived min and max trends
+                for ts, low, high in zip(*(trends or ())):
+                    line = ax.plot_mmm(ts, low, high, label=label,
+                                       **pargs)[0]
+                    label = None
+                    pargs['color'] = line.get_color()
                 for ts in data[0]:
                     line, = ax.plot(ts, label=label, **pargs)
                     label = None
@@ -218,6 +290,47 @@ class TimeSeriesDataPlot(DataLabelSvgMixin, DataPlot):
 
         return self.finalize(outputfile=outputfile)
 
+    def _get_pixel_width(self, ax):
+        """Returns the width (in seconds) of a single display pixel
+
+        Returns `None` if the resolution cannot be determined, or if
+        decimation is disabled via the ``no-decimate`` plot option.
+        """
+        if self.pargs.get('no-decimate', False):
+            return None
+        try:
+            xmin, xmax = map(float, self.pargs.get('xlim', ax.get_xlim()))
+        except (TypeError, ValueError):
+            xmin, xmax = ax.get_xlim()
+        npix = ax.get_window_extent().width
+        if not npix:
+            return None
+        # scale to the resolution of the saved figure
+        dpi = rcParams['savefig.dpi']
+        if dpi != 'figure':
+            npix *= float(dpi) / ax.figure.dpi
+        return (xmax - xmin) / npix
+
+    @staticmethod
+    def _get_trends(channel, segments):
+        """Returns the archived mean, min, and max trends for a channel
+
+        These are only available when trends have been read from a trend
+        pyramid (see `gwsumm.archive.read_data_archive`), otherwise `None`
+        is returned.
+        """
+        key = make_globalv_key(channel)
+        trends = []
+        for stat in PYRAMID_STATISTICS:
+            stored = globalv.DATA.get(pyramid_key(key, stat))
+            if not stored:
+                return None
+            # include partial bins at the edges of each segment
+            dt = stored[0].dt.value
+            trends.append(stored.crop_segments(SegmentList(
+                seg.protract(dt) for seg in segments).coalesce()))
+        return trends
+
     def _get_data_segments(self, channel):
         """Get data segments for this plot
         """
@@ -1023,6 +1136,8 @@ def undo_demodulation(spec, channel, limits=None):
                 return spec
         high = Quantity(high, 'Hz')
         if high < spec.f0:
+            # don't flip the data held in global memory
+            spec = spec.copy()
             if spec.ndim > 1:  # Spectrogram
                 spec.value[:] = numpy.fliplr(spec.value)
             else:  # FrequencySeries
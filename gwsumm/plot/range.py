@@ -21,20 +21,19 @@
 
 import re
 from math import pi
-from heapq import nlargest
-from itertools import combinations
 
 import numpy
 
 from matplotlib.ticker import MaxNLocator
 
-from gwpy.segments import (Segment, SegmentList)
+from gwpy.segments import SegmentList
 from gwpy.timeseries import TimeSeries
 
 from .registry import (get_plot, register_plot)
 from .utils import (hash, usetex_tex)
 from ..data import (get_range_channel, get_range, get_timeseries)
-from ..segments import get_segments
+from ..segments import (get_segments, segments_to_array, coincident_array,
+                        livetime)
 from ..channels import split as split_channels
 
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
@@ -170,15 +169,9 @@ class SimpleTimeVolumeDataPlot(get_plot('segments')):
         # override range units
         range.override_unit('Mpc')
 
-        # use float, not LIGOTimeGPS for speed
-        segments = type(segments)([type(s)(float(s[0]), float(s[1])) for
-                                  s in segments])
-
-        def livetime_(t):
-            return float(abs(SegmentList([Segment(t, t+dx)]) & segments))
-
-        livetime = numpy.vectorize(livetime_, otypes=[float])
-        ts[:] = livetime(ts.times.value) * ts.unit
+        # get livetime in each bin
+        times = ts.times.value
+        ts[:] = livetime(segments, times, times + dx) * ts.unit
         return (4/3. * pi * ts * range ** 3).to('Mpc^3 kyr')
 
     def combined_time_volume(self, allsegments, allranges):
@@ -191,17 +184,14 @@ class SimpleTimeVolumeDataPlot(get_plot('segments')):
                 x0=allranges[0].x0, dx=allranges[0].dx)
 
         # get coincident observing segments
-        pairs = list(combinations(allsegments, 2))
-        coincident = SegmentList()
-        for pair in pairs:
-            coincident.extend(pair[0] & pair[1])
-        coincident = coincident.coalesce()
-
-        # get effective network range
-        values = [r.value for r in allranges]
-        values = [min(nlargest(2, x)) for x in zip(*values)]
+        coincident = coincident_array(
+            [segments_to_array(segs) for segs in allsegments], n=2)
+
+        # get effective network range (the second-largest range)
         size = min([r.size for r in allranges])
-        combined_range[:size] = values * combined_range.unit
+        values = numpy.sort(
+            numpy.stack([r.value[:size] for r in allranges]), axis=0)
+        combined_range[:size] = values[-2] * combined_range.unit
 
         # compute time-volume
         return self.calculate_time_volume(coincident, combined_range)
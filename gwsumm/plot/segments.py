@@ -20,7 +20,7 @@
 """
 
 import bisect
-from itertools import (cycle, combinations)
+from itertools import cycle
 from numbers import Number
 from collections import OrderedDict
 from configparser import NoOptionError
@@ -47,7 +47,8 @@ from ..mode import (Mode, get_mode)
 from ..utils import (re_quote, get_odc_bitmask, re_flagdiv, safe_eval)
 from ..channels import (get_channel, re_channel)
 from ..data import get_timeseries
-from ..segments import (get_segments, format_padding)
+from ..segments import (get_segments, format_padding, segments_to_array,
+                        array_to_segments, coincident_array, livetime)
 from ..state import ALLSTATE
 from .core import (BarPlot, PiePlot, format_label)
 from .registry import (get_plot, register_plot)
@@ -518,6 +519,12 @@ class StateVectorDataPlot(TimeSeriesDataPlot):
 register_plot(StateVectorDataPlot)
 
 
+def span_livetime(segments, span):
+    """Return the livetime (seconds) of a segment list within a span
+    """
+    return float(livetime(segments, [float(span[0])], [float(span[1])])[0])
+
+
 class DutyDataPlot(SegmentDataPlot):
     """`DataPlot` of the duty-factor for a `SegmentList`
     """
@@ -606,20 +613,18 @@ class DutyDataPlot(SegmentDataPlot):
             normalized = 100.
         else:
             normalized = float(normalized)
-        if not bins:
+        if bins is None or not len(bins):
             bins = self.get_bins()
+        bins = numpy.asarray(bins, dtype=float)
         if isinstance(segments, DataQualityFlag):
-            segments = segments.known & segments.active
-        duty = numpy.zeros(len(bins))
-        mean = numpy.zeros(len(bins))
-        for i in range(len(bins)):
-            bin = SegmentList([Segment(self.start + float(sum(bins[:i])),
-                                       self.start + float(sum(bins[:i+1])))])
-            d = float(abs(segments & bin))
-            if normalized:
-                d *= normalized / bins[i]
-            duty[i] = d
-            mean[i] = duty[:i+1].mean()
+            segments = coincident_array([segments_to_array(segments.known),
+                                         segments_to_array(segments.active)])
+        # calculate livetime between consecutive bin edges
+        edges = float(self.start) + numpy.concatenate(([0], bins.cumsum()))
+        duty = livetime(segments, edges[:-1], edges[1:])
+        if normalized:
+            duty *= normalized / bins
+        mean = duty.cumsum() / numpy.arange(1, duty.size + 1)
         if cumulative:
             duty = duty.cumsum()
         return duty, mean
@@ -1023,8 +1028,8 @@ class SegmentPiePlot(PiePlot, SegmentDataPlot):
             else:
                 valid = SegmentList([self.span])
             segs = get_segments(flag, validity=valid, query=False,
-                                padding=self.padding).coalesce()
-            data.append(float(abs(segs.active)))
+                                padding=self.padding)
+            data.append(span_livetime(segs.active, self.span))
         if future:
             total = sum(data)
             alltime = abs(self.span)
@@ -1152,22 +1157,19 @@ class NetworkDutyPiePlot(SegmentPiePlot):
         networkflags = []
         colors = []
         labels = []
-        exclude = DataQualityFlag()
+        # count the active interferometers in a single sweep, the segments
+        # for each flag are restricted to the validity, so 'exactly i
+        # interferometers' is when i + 1 of these lists are active
+        arrays = [segments_to_array(valid)] + [
+            segments_to_array(get_segments(
+                f, validity=valid, query=False, padding=self.padding).active)
+            for f in flags.values()]
         for i in list(range(len(flags)+1))[::-1]:
             name = self.NETWORK_NAME[i]
             flag = '%s:%s' % (network, name)
-            networksegs = DataQualityFlag(flag, known=valid)
-            for ifoset in combinations(flags, i):
-                if not ifoset:
-                    compound = '!%s' % '!'.join(list(flags.values()))
-                else:
-                    compound = '&'.join(flags[ifo] for ifo in ifoset)
-                segs = get_segments(compound, validity=valid, query=False,
-                                    padding=self.padding).coalesce()
-                networksegs += segs
-            globalv.SEGMENTS[flag] = networksegs.copy()
-            globalv.SEGMENTS[flag].active -= exclude.active
-            exclude = networksegs
+            active = coincident_array(arrays, n=i+1, nmax=i+1)
+            globalv.SEGMENTS[flag] = DataQualityFlag(
+                flag, known=valid, active=array_to_segments(active))
             networkflags.append(flag)
             labels.append('%s interferometer' % name.title())
             colors.append(self.NETWORK_COLOR.get(name))
@@ -1245,15 +1247,16 @@ class SegmentBarPlot(BarPlot, SegmentDataPlot):
             else:
                 valid = SegmentList([self.span])
             segs = get_segments(flag, validity=valid, query=False,
-                                padding=self.padding).coalesce()
-            livetime = float(abs(segs.active))
+                                padding=self.padding)
+            active = span_livetime(segs.active, self.span)
             if scale == 'percent':
                 try:
-                    data.append(100 * livetime / float(abs(segs.known)))
+                    data.append(100 * active /
+                                span_livetime(segs.known, self.span))
                 except ZeroDivisionError:
                     data.append(0)
             elif isinstance(scale, (float, int)):
-                data.append(livetime / scale)
+                data.append(active / scale)
 
         if sort:
             data, labels = list(zip(*sorted(
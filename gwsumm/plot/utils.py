@@ -22,6 +22,9 @@
 import hashlib
 import itertools
 import re
+from collections import OrderedDict
+
+import numpy
 
 from matplotlib import rcParams
 
@@ -180,3 +183,104 @@ def hash(string, num=6):
     80c897
     """
     return hashlib.md5(string.encode("utf-8")).hexdigest()[:num]
+
+
+# -- display decimation -------------------------------------------------------
+
+# cache of decimated series, keyed by (channel, span, pixel width, method),
+# holding at most DECIMATE_CACHE_SIZE series (least-recently used are
+# discarded first)
+DECIMATE_CACHE = OrderedDict()
+DECIMATE_CACHE_SIZE = 256
+
+
+def decimate_for_display(series, pixelwidth, method='m4', minsamples=8):
+    """Reduce a series to the samples required to draw it on screen
+
+    With ``method='m4'`` the first, last, minimum and maximum samples in
+    each pixel are kept, so that the rendered line (including any spikes)
+    is indistinguishable from that of the full series. The ``'min'``,
+    ``'max'``, and ``'mean'`` methods return a regular series with one
+    sample per pixel, for use with shaded min/max envelopes.
+
+    Results are cached by channel, span, and pixel width, so that the
+    same data shown on several plots are only reduced once. At most
+    `DECIMATE_CACHE_SIZE` results are kept.
+
+    Parameters
+    ----------
+    series : `~gwpy.timeseries.TimeSeries`
+        the data to decimate
+
+    pixelwidth : `float`
+        the width of one display pixel, in seconds
+
+    method : `str`, optional
+        the decimation method, one of ``'m4'`` (default), ``'min'``,
+        ``'max'``, or ``'mean'``
+
+    minsamples : `int`, optional
+        the minimum number of samples per pixel for which to decimate,
+        series with fewer samples per pixel are returned as given
+
+    Returns
+    -------
+    decimated : `~gwpy.timeseries.TimeSeries`
+        the decimated series, or the input if no decimation is needed
+    """
+    try:
+        dx = series.dx.value
+    except AttributeError:  # irregular series
+        return series
+    nbin = int(pixelwidth / dx)
+    if nbin < minsamples or series.size <= nbin:
+        return series
+    key = (str(series.channel or series.name), tuple(series.span),
+           series.size, float(pixelwidth), method)
+    try:
+        DECIMATE_CACHE.move_to_end(key)
+    except KeyError:
+        pass
+    else:
+        return DECIMATE_CACHE[key]
+
+    values = series.value
+    x0 = series.x0.value
+    if method == 'm4':
+        nfull = series.size // nbin * nbin
+        blocks = values[:nfull].reshape(-1, nbin)
+        if blocks.dtype.kind in 'fc':
+            nans = numpy.isnan(blocks)
+            low = numpy.where(nans, numpy.inf, blocks).argmin(axis=1)
+            high = numpy.where(nans, -numpy.inf, blocks).argmax(axis=1)
+        else:
+            low = blocks.argmin(axis=1)
+            high = blocks.argmax(axis=1)
+        starts = numpy.arange(0, nfull, nbin)
+        idx = numpy.stack((starts, starts + low, starts + high,
+                           starts + nbin - 1), axis=1)
+        idx.sort(axis=1)
+        idx = numpy.concatenate((idx.ravel(),
+                                 numpy.arange(nfull, series.size)))
+        out = type(series)(values[idx], times=x0 + idx * dx)
+    else:
+        starts = numpy.arange(0, series.size, nbin)
+        if method == 'mean':
+            valid = ~numpy.isnan(values)
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                reduced = (numpy.add.reduceat(numpy.where(valid, values, 0),
+                                              starts) /
+                           numpy.add.reduceat(valid, starts))
+        elif method in ('min', 'max'):
+            ufunc = numpy.fmin if method == 'min' else numpy.fmax
+            reduced = ufunc.reduceat(values, starts)
+        else:
+            raise ValueError("Cannot decimate with method=%r" % method)
+        out = type(series)(reduced, x0=x0, dx=dx * nbin)
+    out.name = series.name
+    out.channel = series.channel
+    out.override_unit(series.unit)
+    DECIMATE_CACHE[key] = out
+    while len(DECIMATE_CACHE) > DECIMATE_CACHE_SIZE:
+        DECIMATE_CACHE.popitem(last=False)
+    return out
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Persistent on-disk cache of segments from the segment database
+
+The `SegmentCache` stores the ``known`` and ``active`` segments for each
+flag as ``(N, 2)`` arrays in a ``.npz`` file in a cache directory, so that
+repeated jobs (e.g. consecutive runs in day mode, or separate jobs in a DAG)
+only query the segment database for times that are not already known.
+
+Each update reads the current file, merges the new segments, and
+atomically replaces the file, while holding an exclusive lock (via
+`fcntl.flock`) on a separate lock file, so the cache can be shared by any
+number of processes on the same host.
+"""
+
+import fcntl
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+
+import numpy
+
+from .segments import (segments_to_array, coalesce_array, union_array,
+                       difference_array)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+re_unsafe = re.compile(r'[^\w\-.]')
+
+CACHES = {}
+
+
+def get_segment_cache(path):
+    """Return the `SegmentCache` for the given directory
+
+    Each cache is only created once per process.
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    try:
+        return CACHES[path]
+    except KeyError:
+        CACHES[path] = SegmentCache(path)
+        return CACHES[path]
+
+
+class SegmentCache(object):
+    """A directory of ``known`` and ``active`` segment arrays for each flag
+
+    Parameters
+    ----------
+    directory : `str`
+        the path of the cache directory, created if required
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, flag):
+        """Return the path of the cache file for a flag
+        """
+        return os.path.join(self.directory,
+                            '%s.npz' % re_unsafe.sub('-', str(flag)))
+
+    @contextmanager
+    def lock(self, flag, exclusive=True):
+        """Context manager to hold a lock on the cache file for a flag
+        """
+        with open(self.path(flag) + '.lock', 'a') as lockf:
+            fcntl.flock(lockf, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockf, fcntl.LOCK_UN)
+
+    def _read(self, flag):
+        empty = numpy.zeros((0, 2))
+        try:
+            with numpy.load(self.path(flag)) as npz:
+                return npz['known'], npz['active']
+        except (IOError, OSError, KeyError, ValueError):  # missing or corrupt
+            return empty, empty
+
+    def read(self, flag):
+        """Read the cached segments for a flag
+
+        Returns
+        -------
+        known, active : `numpy.ndarray`
+            ``(N, 2)`` arrays of the known and active segments, these are
+            empty if nothing is cached for this flag
+        """
+        with self.lock(flag, exclusive=False):
+            return self._read(flag)
+
+    def update(self, flag, known, active):
+        """Add newly-queried segments for a flag to the cache
+
+        The new segments replace anything cached for the newly ``known``
+        times.
+
+        Parameters
+        ----------
+        flag : `str`
+            the name of the flag
+
+        known : `~gwpy.segments.SegmentList`, `numpy.ndarray`
+            the new known segments
+
+        active : `~gwpy.segments.SegmentList`, `numpy.ndarray`
+            the new active segments
+        """
+        known = segments_to_array(known)
+        active = segments_to_array(active)
+        if not known.size:
+            return
+        path = self.path(flag)
+        with self.lock(flag):
+            oldknown, oldactive = self._read(flag)
+            known_ = union_array(coalesce_array(oldknown), known)
+            active_ = union_array(
+                difference_array(coalesce_array(oldactive), known), active)
+            # write to a temporary file first, so that the cache file is
+            # always complete
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    numpy.savez(f, known=known_, active=active_)
+                os.replace(tmp, path)
+            except Exception:
+                os.remove(tmp)
+                raise
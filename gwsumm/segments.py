@@ -31,6 +31,8 @@ from configparser import (
     NoOptionError,
 )
 
+import numpy
+
 from astropy.io.registry import IORegistryError
 
 from gwpy.segments import (DataQualityFlag, DataQualityDict,
@@ -84,6 +86,9 @@ def get_segments(flag, validity=None, config=ConfigParser(), cache=None,
           not given
         - ``url`` (the remote hostname for the segment database) if
           the ``url`` keyword is not given
+        - ``cache-dir`` (a local directory in which to cache segments
+          from the segment database, see `gwsumm.segcache`), so that only
+          times not already known are queried
 
     cache : :class:`glue.lal.Cache`, optional
         a cache of files from which to read segments, otherwise segments
@@ -141,20 +146,11 @@ def get_segments(flag, validity=None, config=ConfigParser(), cache=None,
 
     # check validity
     if validity is None:
-        start = config.get(DEFAULTSECT, 'gps-start-time')
-        end = config.get(DEFAULTSECT, 'gps-end-time')
-        span = SegmentList([Segment(start, end)])
+        start = config.getfloat(DEFAULTSECT, 'gps-start-time')
+        end = config.getfloat(DEFAULTSECT, 'gps-end-time')
+        validity = SegmentList([Segment(start, end)])
     elif isinstance(validity, DataQualityFlag):
         validity = validity.active
-        try:
-            span = SegmentList([validity.extent()])
-        except ValueError:
-            span = SegmentList()
-    else:
-        try:
-            span = SegmentList([SegmentList(validity).extent()])
-        except ValueError:
-            span = SegmentList()
     validity = SegmentList(validity)
 
     # generate output object
@@ -164,11 +160,13 @@ def get_segments(flag, validity=None, config=ConfigParser(), cache=None,
     for f in allflags:
         globalv.SEGMENTS.setdefault(f, DataQualityFlag(f))
 
-    # read segments from global memory and get the union of needed times
+    # read segments from global memory and get the union of needed times,
+    # times already queried for a flag are not queried again, even if
+    # the flag was not known at those times
     try:
-        old = reduce(
-            operator.and_,
-            (globalv.SEGMENTS.get(f, DataQualityFlag(f)).known for f in flags))
+        old = reduce(operator.and_, (
+            globalv.SEGMENTS.get(f, DataQualityFlag(f)).known |
+            globalv.SEGMENT_QUERIES.get(f, SegmentList()) for f in allflags))
     except TypeError:
         old = SegmentList()
     newsegs = validity - old
@@ -198,8 +196,30 @@ def get_segments(flag, validity=None, config=ConfigParser(), cache=None,
                        % (len(new[f].active), f,
                           float(abs(new[f].known))/float(abs(newsegs))*100))
         else:
+            # read segments from the local segment cache, if configured
+            segcache = _get_segment_cache(config)
+            if segcache is not None:
+                needed = segments_to_array(newsegs)
+                for f in allflags:
+                    known, active = segcache.read(f)
+                    globalv.SEGMENTS[f] |= DataQualityFlag(
+                        f, known=array_to_segments(
+                            intersection_array(known, needed)),
+                        active=array_to_segments(
+                            intersection_array(active, needed)))
+            # and only query for flags that are not known for all times
+            qflags = []
+            gaps = SegmentList()
+            for f in allflags:
+                fgaps = newsegs - (globalv.SEGMENTS[f].known |
+                                   globalv.SEGMENT_QUERIES.get(
+                                       f, SegmentList()))
+                if abs(fgaps):
+                    qflags.append(f)
+                    gaps.extend(fgaps)
+            newsegs = gaps.coalesce()
             if len(newsegs) >= 10:
-                qsegs = span
+                qsegs = SegmentList([newsegs.extent()])
             else:
                 qsegs = newsegs
             # parse configuration for query
@@ -216,8 +236,8 @@ def get_segments(flag, validity=None, config=ConfigParser(), cache=None,
             else:
                 query_func = DataQualityDict.query_dqsegdb
             try:
-                new = query_func(allflags, qsegs, on_error=segdb_error,
-                                 **kwargs)
+                new = query_func(qflags, qsegs, on_error=segdb_error,
+                                 **kwargs) if qflags else DataQualityDict()
             except Exception as e:
                 # ignore error from SegDB
                 if segdb_error in ['ignore', None]:
@@ -240,42 +260,107 @@ def get_segments(flag, validity=None, config=ConfigParser(), cache=None,
                 vprint("    Downloaded %d segments for %s (%.2f%% coverage).\n"
                        % (len(new[f].active), f,
                           float(abs(new[f].known))/float(abs(newsegs))*100))
+                if segcache is not None:
+                    segcache.update(f, new[f].known, new[f].active)
         # record new segments
         globalv.SEGMENTS += new
         for f in new:
             globalv.SEGMENTS[f].description = str(new[f].description)
+            globalv.SEGMENT_QUERIES[f] = globalv.SEGMENT_QUERIES.get(
+                f, SegmentList()) | newsegs
 
     # return what was asked for
     if return_:
+        valid = segments_to_array(validity)
+        arrays = {}  # (known, active) arrays for each padded flag
         for compound in flags:
             union, intersection, exclude, notequal = split_compound_flag(
                 compound)
             if len(union + intersection) == 1:
                 out[compound].description = globalv.SEGMENTS[f].description
                 out[compound].padding = padding.get(f, (0, 0))
+            known, active = valid, valid
             for flist, op in zip([exclude, intersection, union, notequal],
-                                 [operator.sub, operator.and_, operator.or_,
-                                  not_equal]):
+                                 [_sub_arrays, _and_arrays, _or_arrays,
+                                  _not_equal_arrays]):
                 for f in flist:
-                    pad = padding.get(f, (0, 0))
-                    segs = globalv.SEGMENTS[f].copy()
-                    if isinstance(pad, (float, int)):
-                        segs = segs.pad(pad, pad)
-                    elif pad is not None:
-                        segs = segs.pad(*pad)
-                    if coalesce:
-                        segs = segs.coalesce()
-                    out[compound] = op(out[compound], segs)
-            out[compound].known &= validity
-            out[compound].active &= validity
+                    pad = _format_pad(padding.get(f, (0, 0)))
+                    try:
+                        segs = arrays[f, pad]
+                    except KeyError:
+                        segs = arrays[f, pad] = _flag_to_arrays(
+                            globalv.SEGMENTS[f], pad)
+                    known, active = op((known, active), segs)
+            known = intersection_array(known, valid)
+            active = intersection_array(active, valid)
             if coalesce:
-                out[compound].coalesce()
+                active = intersection_array(active, known)
+            out[compound].known = array_to_segments(known)
+            out[compound].active = array_to_segments(active)
         if isinstance(flag, str):
             return out[flag]
         else:
             return out
 
 
+def _get_segment_cache(config):
+    """Return the local `~gwsumm.segcache.SegmentCache`, if configured
+
+    The cache directory is given by the ``[segment-database] cache-dir``
+    option.
+    """
+    try:
+        path = config.get('segment-database', 'cache-dir')
+    except (NoSectionError, NoOptionError):
+        return None
+    from .segcache import get_segment_cache
+    return get_segment_cache(path)
+
+
+def _format_pad(pad):
+    """Format a padding parameter as a ``(start, end)`` tuple
+    """
+    if pad is None:
+        return (0, 0)
+    if isinstance(pad, (float, int)):
+        return (pad, pad)
+    return tuple(pad)
+
+
+def _flag_to_arrays(flag, pad=(0, 0)):
+    """Convert a `DataQualityFlag` into padded ``(known, active)`` arrays
+    """
+    return (pad_array(segments_to_array(flag.known), *pad),
+            pad_array(segments_to_array(flag.active), *pad))
+
+
+def _and_arrays(a, b):
+    """Intersection of two ``(known, active)`` flags, as ``a & b``
+    """
+    return intersection_array(a[0], b[0]), intersection_array(a[1], b[1])
+
+
+def _or_arrays(a, b):
+    """Union of two ``(known, active)`` flags, as ``a | b``
+    """
+    return union_array(a[0], b[0]), union_array(a[1], b[1])
+
+
+def _sub_arrays(a, b):
+    """Difference of two ``(known, active)`` flags, as ``a - b``
+    """
+    known = intersection_array(a[0], b[0])
+    return known, intersection_array(difference_array(a[1], b[1]), known)
+
+
+def _not_equal_arrays(a, b):
+    """Times when two ``(known, active)`` flags differ, see `not_equal`
+    """
+    known = intersection_array(a[0], b[0])
+    return known, intersection_array(
+        coincident_array([a[1], b[1]], n=1, nmax=1), known)
+
+
 def not_equal(a, b, f):
     diff1 = a - b
     diff2 = b - a
@@ -331,3 +416,200 @@ def format_padding(flags, padding):
         return OrderedDict((c, padding) for c in flags)
     else:
         return padding
+
+
+# -- segment arrays -----------------------------------------------------------
+#
+# Segment lists are represented internally as sorted, coalesced ``(N, 2)``
+# `float` arrays of ``[start, end)`` pairs, so that compound flags and state
+# restrictions can be evaluated with vectorised sweeps over the segment
+# boundaries, rather than with `SegmentList` arithmetic. Conversion to and
+# from `SegmentList` happens at the `DataQualityFlag` boundary.
+
+def segments_to_array(segments):
+    """Convert a list of segments into a sorted, coalesced array
+
+    Parameters
+    ----------
+    segments : `~gwpy.segments.SegmentList`, `numpy.ndarray`
+        the segments to convert
+
+    Returns
+    -------
+    array : `numpy.ndarray`
+        an ``(N, 2)`` `float` array of ``[start, end)`` pairs
+    """
+    if isinstance(segments, numpy.ndarray):
+        return coalesce_array(segments)
+    array = numpy.array([(float(s[0]), float(s[1])) for s in segments],
+                        dtype=float).reshape(-1, 2)
+    return coalesce_array(array)
+
+
+def array_to_segments(array):
+    """Convert an ``(N, 2)`` array of segments into a `SegmentList`
+
+    If all of the boundaries are integers, the segments are given as `int`,
+    matching segments read from the segment database.
+    """
+    array = numpy.asarray(array, dtype=float).reshape(-1, 2)
+    if array.size and (numpy.mod(array, 1) == 0).all():
+        array = array.astype('int64')
+    return SegmentList(Segment(a, b) for a, b in array.tolist())
+
+
+def coalesce_array(array):
+    """Sort and merge overlapping (or touching) segments in an array
+
+    Empty segments are removed.
+    """
+    array = numpy.asarray(array, dtype=float).reshape(-1, 2)
+    array = array[array[:, 1] > array[:, 0]]
+    if not array.size:
+        return array
+    array = array[numpy.argsort(array[:, 0], kind='mergesort')]
+    ends = numpy.maximum.accumulate(array[:, 1])
+    # a new segment starts where the start is after all previous ends
+    new = numpy.ones(array.shape[0], dtype=bool)
+    new[1:] = array[1:, 0] > ends[:-1]
+    first = numpy.flatnonzero(new)
+    last = numpy.append(first[1:], array.shape[0]) - 1
+    return numpy.column_stack((array[first, 0], ends[last]))
+
+
+def _sweep(arrays, weights=None):
+    """Sweep over the boundaries of a number of coalesced segment arrays
+
+    Returns
+    -------
+    times : `numpy.ndarray`
+        the sorted segment boundaries
+
+    count : `numpy.ndarray`
+        the (weighted) number of active lists just after each boundary
+    """
+    arrays = [numpy.asarray(a, dtype=float).reshape(-1, 2) for a in arrays]
+    if weights is None:
+        weights = [1] * len(arrays)
+    times = numpy.concatenate([a.T.ravel() for a in arrays] + [[]])
+    steps = numpy.concatenate(
+        [numpy.repeat([w, -w], a.shape[0]) for
+         a, w in zip(arrays, weights)] + [[]])
+    # at equal times, process ends before starts, so that touching
+    # segments do not overlap
+    order = numpy.lexsort((steps, times))
+    return times[order], numpy.cumsum(steps[order])
+
+
+def _select(times, active):
+    """Return the segments of a sweep during which ``active`` is `True`
+    """
+    # segments start where active becomes True, and end where it becomes
+    # False, zero-length segments from simultaneous boundaries are removed
+    change = numpy.diff(numpy.concatenate(([False], active)).astype(int))
+    return coalesce_array(numpy.column_stack((times[change == 1],
+                                              times[change == -1])))
+
+
+def coincident_array(arrays, n=2, nmax=None):
+    """Return the segments during which at least ``n`` lists are active
+
+    This is calculated with a single sweep over the sorted segment
+    boundaries of all lists.
+
+    Parameters
+    ----------
+    arrays : `list` of `numpy.ndarray`
+        the coalesced ``(N, 2)`` segment arrays to combine
+
+    n : `int`, optional
+        the minimum number of active lists
+
+    nmax : `int`, optional
+        the maximum number of active lists, default: no limit
+
+    Returns
+    -------
+    array : `numpy.ndarray`
+        the coalesced ``(N, 2)`` coincident segment array
+    """
+    times, count = _sweep(arrays)
+    active = count >= n
+    if nmax is not None:
+        active &= count <= nmax
+    return _select(times, active)
+
+
+def union_array(*arrays):
+    """Return the union of a number of coalesced segment arrays
+    """
+    return coincident_array(arrays, n=1)
+
+
+def intersection_array(*arrays):
+    """Return the intersection of a number of coalesced segment arrays
+    """
+    return coincident_array(arrays, n=len(arrays))
+
+
+def difference_array(a, b):
+    """Return the segments in coalesced array ``a`` that are not in ``b``
+    """
+    times, count = _sweep([a, b], weights=[1, 2])
+    return _select(times, count == 1)
+
+
+def pad_array(array, start, end):
+    """Pad each segment in an array, and coalesce the result
+
+    As for `~gwpy.segments.DataQualityFlag.pad`, a positive padding moves
+    that end of each segment forward in time.
+    """
+    array = numpy.asarray(array, dtype=float).reshape(-1, 2)
+    return coalesce_array(array + [float(start), float(end)])
+
+
+def livetime(segments, starts, ends):
+    """Calculate the livetime of a segment list in each of a set of bins
+
+    The cumulative livetime is evaluated at each bin edge from the sorted
+    segment boundaries, so the cost is linear in the number of segments
+    and bins (plus a binary search of each edge).
+
+    Parameters
+    ----------
+    segments : `~gwpy.segments.SegmentList`, `numpy.ndarray`
+        the segments (or coalesced ``(N, 2)`` array of segments) to measure
+
+    starts : `numpy.ndarray`
+        the start time of each bin
+
+    ends : `numpy.ndarray`
+        the end time of each bin
+
+    Returns
+    -------
+    livetime : `numpy.ndarray`
+        the duration of the segments within each bin
+    """
+    if not isinstance(segments, numpy.ndarray):
+        segments = segments_to_array(segments)
+    return (_cumulative_livetime(segments, ends) -
+            _cumulative_livetime(segments, starts))
+
+
+def _cumulative_livetime(array, times):
+    """Return the total duration of segments before each time
+    """
+    times = numpy.asarray(times, dtype=float)
+    if not array.size:
+        return numpy.zeros(times.shape)
+    durations = array[:, 1] - array[:, 0]
+    cumulative = numpy.concatenate(([0.], numpy.cumsum(durations)))
+    # number of segments that end at or before each time
+    idx = numpy.searchsorted(array[:, 1], times, side='right')
+    partial = numpy.zeros(times.shape)
+    inside = idx < array.shape[0]
+    partial[inside] = numpy.clip(
+        times[inside] - array[idx[inside], 0], 0, None)
+    return cumulative[idx] + partial
@@ -24,6 +24,8 @@ import re
 import operator
 from configparser import (NoOptionError, DEFAULTSECT)
 
+import numpy
+
 from astropy.time import Time
 
 from gwpy.detector import get_timezone_offset
@@ -33,7 +35,8 @@ from gwpy.time import (to_gps, from_gps)
 from .. import globalv
 from ..config import (GWSummConfigParser)
 from ..utils import re_cchar
-from ..segments import get_segments
+from ..segments import (get_segments, segments_to_array, array_to_segments,
+                        coalesce_array, intersection_array)
 from ..data import get_timeseries
 
 MATHOPS = {
@@ -319,21 +322,24 @@ class SummaryState(DataQualityFlag):
             self.active = self.known
         # restrict to given hours
         if self.hours:
-            segs_ = SegmentList()
+            days = []
             # get start day
             d = Time(float(self.start), format='gps', scale='utc').datetime
             d.replace(hour=0, minute=0, second=0, microsecond=0)
             end_ = Time(float(self.end), format='gps', scale='utc').datetime
             while d < end_:
                 # get GPS of day
-                t = to_gps(d)
-                # for each [start, end) hour pair, build a segment
-                for h0, h1 in self.hours:
-                    segs_.append(Segment(t + h0 * 3600, t + h1*3600))
+                days.append(float(to_gps(d)))
                 # increment and return
                 d += datetime.timedelta(1)
-            self.known &= segs_
-            self.active &= segs_
+            # for each [start, end) hour pair, build a segment on each day
+            hours = numpy.asarray(self.hours, dtype=float).reshape(-1, 2)
+            segs_ = coalesce_array(
+                numpy.asarray(days)[:, None, None] + hours * 3600.)
+            self.known = array_to_segments(
+                intersection_array(segments_to_array(self.known), segs_))
+            self.active = array_to_segments(
+                intersection_array(segments_to_array(self.active), segs_))
         # FIXME
         self.ready = True
         return self
@@ -0,0 +1,716 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Containers for data held in the `gwsumm.globalv` module
+
+The data lists in this module are kept sorted by start time, so that
+new data can be inserted with a binary search, merging only with their
+immediate neighbours, rather than sorting and coalescing the entire list
+each time. Each list also maintains an interval index over the spans of
+its elements, so that the data overlapping a given segment can be found
+with a binary search.
+
+The containers themselves are `MemoryStore` mappings, which can be given
+a shared `MemoryBudget`, in which case the least-recently-used entries are
+spilled to an HDF5 scratch file when the budget is exceeded, and reloaded
+transparently when next accessed.
+
+This module also provides the `SpanCache`, used to remember the results of
+lookups (e.g. datafind queries) made over a GPS span, for the duration of
+a single process.
+"""
+
+import atexit
+import os
+import re
+import tempfile
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+import numpy
+
+from astropy.table import Table
+
+from gwpy.segments import Segment
+from gwpy.table import EventTable
+from gwpy.timeseries import (TimeSeriesList, StateVectorList)
+from gwpy.spectrogram import SpectrogramList
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+
+# -- utilities ----------------------------------------------------------------
+
+def _bisect_right(items, value, key):
+    """Find the index at which to insert ``value`` to keep ``items`` sorted
+
+    ``items`` is assumed to be sorted according to ``key(item)``.
+    """
+    lo, hi = 0, len(items)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if value < key(items[mid]):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def _append(this, other):
+    """Append ``other`` to ``this``, copying ``this`` if it is a view
+    """
+    try:
+        return this.append(other)
+    except ValueError as exc:
+        if 'cannot resize this array' in str(exc):
+            return this.copy().append(other)
+        raise
+
+
+def insert_segment(segmentlist, segment):
+    """Insert a segment into a sorted, coalesced `SegmentList` in place
+
+    Only the neighbours of the new segment are merged, so the list must
+    already be sorted and coalesced.
+
+    Parameters
+    ----------
+    segmentlist : `~gwpy.segments.SegmentList`
+        the list to modify
+
+    segment : `~gwpy.segments.Segment`
+        the new segment to insert
+
+    Returns
+    -------
+    segmentlist : `~gwpy.segments.SegmentList`
+        the input list, for convenience
+    """
+    start, end = segment
+    i = _bisect_right(segmentlist, start, lambda s: s[0])
+    # merge with the previous segment if touching
+    if i and segmentlist[i-1][1] >= start:
+        i -= 1
+        start = segmentlist[i][0]
+        end = max(end, segmentlist[i][1])
+        del segmentlist[i]
+    # absorb all following segments that touch the new one
+    while i < len(segmentlist) and segmentlist[i][0] <= end:
+        end = max(end, segmentlist[i][1])
+        del segmentlist[i]
+    segmentlist.insert(i, Segment(start, end))
+    return segmentlist
+
+
+# -- series containers --------------------------------------------------------
+
+class SortedSeriesListMixin(object):
+    """Mixin for series lists that are kept sorted by start time
+
+    Lists using this mixin should only be extended via :meth:`add`
+    (or :meth:`coalesce`), otherwise the sort order cannot be guaranteed.
+    """
+    _index = None
+
+    # -- index management ---------------
+
+    def _invalidate(self):
+        self._index = None
+
+    def __setitem__(self, key, value):
+        self._invalidate()
+        return super(SortedSeriesListMixin, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._invalidate()
+        return super(SortedSeriesListMixin, self).__delitem__(key)
+
+    def __iadd__(self, other):
+        self._invalidate()
+        return super(SortedSeriesListMixin, self).__iadd__(other)
+
+    def append(self, item):
+        self._invalidate()
+        return super(SortedSeriesListMixin, self).append(item)
+
+    def extend(self, items):
+        self._invalidate()
+        return super(SortedSeriesListMixin, self).extend(items)
+
+    def insert(self, index, item):
+        self._invalidate()
+        return super(SortedSeriesListMixin, self).insert(index, item)
+
+    def pop(self, index=-1):
+        self._invalidate()
+        return super(SortedSeriesListMixin, self).pop(index)
+
+    def remove(self, item):
+        self._invalidate()
+        return super(SortedSeriesListMixin, self).remove(item)
+
+    def sort(self, *args, **kwargs):
+        self._invalidate()
+        return super(SortedSeriesListMixin, self).sort(*args, **kwargs)
+
+    def get_index(self):
+        """Return the interval index for this list
+
+        Returns
+        -------
+        starts : `numpy.ndarray`
+            the start time of each element
+
+        maxends : `numpy.ndarray`
+            the running maximum of the end time of the elements, this is
+            monotonic even if elements overlap
+        """
+        if self._index is None:
+            spans = numpy.array([tuple(map(float, x.span)) for x in self],
+                                dtype=float).reshape((len(self), 2))
+            self._index = (spans[:, 0],
+                           numpy.maximum.accumulate(spans[:, 1]))
+        return self._index
+
+    def find(self, segment):
+        """Find the indices of all elements that overlap a segment
+
+        Parameters
+        ----------
+        segment : `~gwpy.segments.Segment`
+            the ``[start, end)`` interval of interest
+
+        Returns
+        -------
+        indices : `list` of `int`
+            the (sorted) index of each element intersecting the segment
+        """
+        start, end = map(float, segment)
+        starts, maxends = self.get_index()
+        first = maxends.searchsorted(start, side='right')
+        last = starts.searchsorted(end, side='left')
+        return [i for i in range(first, last) if
+                float(self[i].span[1]) > start]
+
+    def crop_segments(self, segments, pad=False):
+        """Return views of the data in this list overlapping some segments
+
+        Parameters
+        ----------
+        segments : `~gwpy.segments.SegmentList`
+            the list of segments to extract
+
+        pad : `bool`, optional
+            extend each segment by one sample, so that the sample
+            starting before the end of the segment is included,
+            default: `False`
+
+        Returns
+        -------
+        data : `SortedSeriesListMixin`
+            a new list of the same type, containing (where possible)
+            views of the original data
+        """
+        out = type(self)()
+        for seg in segments:
+            for i in self.find(seg):
+                series = self[i]
+                dt = series.dt.value
+                if abs(seg) == 0 or abs(seg) < dt:
+                    continue
+                if pad:
+                    target = type(seg)(seg[0], seg[1] + dt)
+                else:
+                    target = seg
+                common = map(float, series.span & target)
+                cropped = series.crop(*common, copy=False)
+                if cropped.shape[0]:
+                    out.add(cropped)
+        return out
+
+    # -- insertion ----------------------
+
+    def add(self, series, coalesce=True):
+        """Insert a new series into this list, in sorted position
+
+        Parameters
+        ----------
+        series : `~gwpy.types.Series`
+            the new data to insert
+
+        coalesce : `bool`, optional
+            merge the new series with its neighbours if they are contiguous,
+            defaults to `True`
+
+        Returns
+        -------
+        series : `~gwpy.types.Series`
+            the element of this list that contains the new data
+        """
+        i = _bisect_right(self, series.span[0], lambda x: x.span[0])
+        self.insert(i, series)
+        if not coalesce:
+            return series
+        if i and self[i-1].is_contiguous(series) == 1:
+            i -= 1
+            self[i] = _append(self[i], series)
+            del self[i+1]
+        if i + 1 < len(self) and self[i].is_contiguous(self[i+1]) == 1:
+            self[i] = _append(self[i], self[i+1])
+            del self[i+1]
+        return self[i]
+
+
+class TimeSeriesStore(SortedSeriesListMixin, TimeSeriesList):
+    """Sorted `~gwpy.timeseries.TimeSeriesList` for global storage
+    """
+    pass
+
+
+class StateVectorStore(SortedSeriesListMixin, StateVectorList):
+    """Sorted `~gwpy.timeseries.StateVectorList` for global storage
+    """
+    pass
+
+
+class SpectrogramStore(SortedSeriesListMixin, SpectrogramList):
+    """Sorted `~gwpy.spectrogram.SpectrogramList` for global storage
+    """
+    pass
+
+
+# -- lookup caching -----------------------------------------------------------
+
+class SpanCache(object):
+    """In-memory cache of lookups made over GPS ``[start, end)`` spans
+
+    Results are stored against a key and the span of the lookup. A new
+    lookup for a span contained within a cached span is answered by
+    sieving the cached result, rather than repeating the lookup.
+
+    Parameters
+    ----------
+    sieve : `callable`
+        function with signature ``sieve(result, start, end)`` that returns
+        the part of a cached ``result`` relevant to a new (smaller) span
+    """
+    def __init__(self, sieve):
+        self.sieve = sieve
+        self._data = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, start, end):
+        """Return the cached result for a lookup
+
+        Raises
+        ------
+        KeyError
+            if no lookup for this key has been cached over a span
+            containing ``[start, end)``
+        """
+        for span, result in self._data.get(key, []):
+            if span[0] <= start and end <= span[1]:
+                self.hits += 1
+                return self.sieve(result, start, end)
+        self.misses += 1
+        raise KeyError((key, start, end))
+
+    def add(self, key, start, end, result):
+        """Record the result of a new lookup
+        """
+        self._data.setdefault(key, []).append((Segment(start, end), result))
+        return result
+
+    def clear(self):
+        """Empty this cache
+        """
+        self._data.clear()
+
+
+# -- memory management --------------------------------------------------------
+
+SIZE_UNITS = {
+    '': 1,
+    'K': 1024,
+    'M': 1024 ** 2,
+    'G': 1024 ** 3,
+    'T': 1024 ** 4,
+}
+
+re_size = re.compile(r'\A\s*(?P<value>[0-9.]+)\s*(?P<unit>[KMGT]?)(i?B)?\s*\Z',
+                     re.I)
+
+
+def parse_size(size):
+    """Parse a memory size into a number of bytes
+
+    Parameters
+    ----------
+    size : `str`, `int`
+        the size to parse, e.g. ``'16G'``, ``'512MB'``, or a number of bytes
+
+    Returns
+    -------
+    nbytes : `int`
+        the number of bytes
+
+    Raises
+    ------
+    ValueError
+        if the input cannot be parsed
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = re_size.match(str(size))
+    if match is None:
+        raise ValueError("Cannot parse memory size %r" % size)
+    return int(float(match.group('value')) *
+               SIZE_UNITS[match.group('unit').upper()])
+
+
+def format_size(nbytes):
+    """Format a number of bytes as a human-readable string
+    """
+    for unit in ('', 'K', 'M', 'G'):
+        if abs(nbytes) < 1024:
+            break
+        nbytes /= 1024.
+    else:
+        unit = 'T'
+    return '%.1f %sB' % (nbytes, unit)
+
+
+def _nbytes(value):
+    """Return the (approximate) number of bytes held by a stored object
+    """
+    if isinstance(value, Table):
+        return sum(col.nbytes for col in value.columns.values())
+    if isinstance(value, list):
+        return sum(getattr(x, 'nbytes', 0) for x in value)
+    return getattr(value, 'nbytes', 0)
+
+
+class MemoryBudget(object):
+    """A memory limit shared by a number of `MemoryStore` containers
+
+    Whenever the total size of all entries exceeds the limit, the
+    least-recently-used entries are spilled to an HDF5 scratch file.
+
+    Parameters
+    ----------
+    limit : `int`, `str`, optional
+        the memory limit, either a number of bytes or a string
+        like ``'16G'``, default: `None` (no limit)
+
+    scratch_dir : `str`, optional
+        the directory in which to create the scratch file, defaults to
+        the system temporary directory
+    """
+    def __init__(self, limit=None, scratch_dir=None):
+        self.limit = limit
+        self.scratch_dir = scratch_dir
+        self.used = 0
+        self._usage = OrderedDict()
+        self._stores = {}
+        self._last = None
+        self._scratch = None
+        self._count = 0
+
+    @property
+    def limit(self):
+        """The memory limit (bytes), or `None`
+        """
+        return self._limit
+
+    @limit.setter
+    def limit(self, limit):
+        if limit is not None:
+            limit = parse_size(limit)
+        self._limit = limit
+
+    @property
+    def scratch(self):
+        """The path of the HDF5 scratch file for spilled data
+        """
+        if self._scratch is None:
+            from h5py import File
+            fd, self._scratch = tempfile.mkstemp(
+                prefix='gwsumm-spill-', suffix='.h5', dir=self.scratch_dir)
+            os.close(fd)
+            File(self._scratch, 'w').close()
+            atexit.register(self.cleanup)
+        return self._scratch
+
+    def cleanup(self):
+        """Remove the scratch file
+        """
+        if self._scratch is not None and os.path.isfile(self._scratch):
+            os.remove(self._scratch)
+        self._scratch = None
+
+    def new_path(self, prefix):
+        """Return a new unique path in the scratch file
+        """
+        self._count += 1
+        return '%s/%d' % (prefix, self._count)
+
+    def _ident(self, store, key):
+        # key entries on the id of their container, rather than the
+        # container itself, so that no container comparisons are needed
+        sid = id(store)
+        if sid not in self._stores:
+            self._stores[sid] = weakref.ref(
+                store, lambda ref, sid=sid: self._forget(sid))
+        return (sid, key)
+
+    def _forget(self, sid):
+        # stop tracking all entries of a container that no longer exists
+        self._stores.pop(sid, None)
+        for ident in [i for i in self._usage if i[0] == sid]:
+            self.used -= self._usage.pop(ident)
+        if self._last is not None and self._last[0] == sid:
+            self._last = None
+
+    def _store(self, ident):
+        ref = self._stores.get(ident[0])
+        return None if ref is None else ref()
+
+    def _measure(self, ident):
+        store = self._store(ident)
+        old = self._usage.pop(ident, 0)
+        if store is None or ident[1] not in store._data:
+            new = 0
+        else:
+            new = self._usage[ident] = _nbytes(store._data[ident[1]])
+        self.used += new - old
+
+    def touch(self, store, key):
+        """Mark an entry as most-recently used, and enforce the limit
+
+        The previously used entry is measured again at the same time,
+        since entries are typically modified in place just after they
+        are accessed.
+        """
+        if self.limit is None:
+            return
+        ident = self._ident(store, key)
+        if self._last is not None and self._last != ident:
+            self._measure(self._last)
+        self._measure(ident)
+        self._last = ident
+        self.enforce()
+
+    def discard(self, store, key):
+        """Stop tracking an entry, after it has been removed or spilled
+        """
+        ident = (id(store), key)
+        self.used -= self._usage.pop(ident, 0)
+        if ident == self._last:
+            self._last = None
+
+    def enforce(self):
+        """Spill least-recently-used entries until within the limit
+
+        The most recently used entry is never spilled.
+        """
+        if self.limit is None:
+            return
+        for ident in list(self._usage)[:-1]:
+            if self.used <= self.limit:
+                break
+            store = self._store(ident)
+            if store is None or ident[1] not in store._data:
+                self._measure(ident)
+            elif store.spill(ident[1]):
+                self.discard(store, ident[1])
+
+
+BUDGET = MemoryBudget()
+
+
+def set_memory_limit(limit, scratch_dir=None):
+    """Set the memory limit for the default `MemoryBudget`
+
+    Parameters
+    ----------
+    limit : `int`, `str`
+        the memory limit, either a number of bytes or a string
+        like ``'16G'``
+
+    scratch_dir : `str`, optional
+        the directory in which to create the scratch file
+    """
+    BUDGET.limit = limit
+    if scratch_dir is not None:
+        BUDGET.scratch_dir = scratch_dir
+    return BUDGET
+
+
+class MemoryStore(MutableMapping):
+    """A `dict`-like container for global data, with a memory budget
+
+    Hits (entries found in memory), misses (entries not in memory), and the
+    total number of bytes spilled to disk are recorded for each container.
+
+    Parameters
+    ----------
+    name : `str`, optional
+        the name of this container, used to group data in the scratch file
+
+    budget : `MemoryBudget`, optional
+        the memory budget to use, defaults to the shared `BUDGET`
+    """
+    __hash__ = object.__hash__
+
+    def __init__(self, name=None, budget=None):
+        self.name = name
+        self._budget = budget
+        self._data = OrderedDict()
+        self._spilled = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.spilled = 0
+
+    @property
+    def budget(self):
+        """The `MemoryBudget` for this container
+        """
+        if self._budget is None:
+            return BUDGET
+        return self._budget
+
+    @property
+    def stats(self):
+        """The hit, miss, and spill counters for this container
+        """
+        return OrderedDict([('hits', self.hits), ('misses', self.misses),
+                            ('spilled', self.spilled)])
+
+    # -- mapping methods ----------------
+
+    def __getitem__(self, key):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            if key not in self._spilled:
+                raise
+            value = self._data[key] = self.reload(key)
+        else:
+            self.hits += 1
+        self.budget.touch(self, key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._spilled.pop(key, None)
+        self._data[key] = value
+        self.budget.touch(self, key)
+
+    def __delitem__(self, key):
+        if key in self._data:
+            del self._data[key]
+            self.budget.discard(self, key)
+        else:
+            del self._spilled[key]
+
+    def __contains__(self, key):
+        return key in self._data or key in self._spilled
+
+    def __iter__(self):
+        return iter(list(self._data) + list(self._spilled))
+
+    def __len__(self):
+        return len(self._data) + len(self._spilled)
+
+    def __repr__(self):
+        return '<%s(%r, %d entries, %d spilled)>' % (
+            type(self).__name__, self.name, len(self), len(self._spilled))
+
+    # -- spilling -----------------------
+
+    def spill(self, key):
+        """Write an entry to the scratch file and remove it from memory
+
+        Returns
+        -------
+        spilled : `bool`
+            `True` if the entry was spilled, otherwise `False` (for
+            unsupported or empty entries)
+        """
+        from h5py import File
+        value = self._data[key]
+        if not len(value) or not isinstance(
+                value, (SortedSeriesListMixin, Table)):
+            return False
+        path = self.budget.new_path(self.name or 'data')
+        with File(self.budget.scratch, 'a') as h5f:
+            group = h5f.create_group(path)
+            group.attrs['type'] = type(value).__name__
+            if isinstance(value, Table):
+                from .archive import archive_table
+                archive_table(value, 'table', group)
+            else:
+                for i, series in enumerate(value):
+                    series.write(group, path='%08d' % i, format='hdf5')
+        self.spilled += _nbytes(value)
+        del self._data[key]
+        self._spilled[key] = path
+        return True
+
+    def reload(self, key):
+        """Read a spilled entry back from the scratch file
+
+        The entry is not re-inserted into this container.
+        """
+        from h5py import File
+        from .channels import get_channel
+        path = self._spilled.pop(key)
+        with File(self.budget.scratch, 'a') as h5f:
+            group = h5f[path]
+            type_ = group.attrs['type']
+            if isinstance(type_, bytes):
+                type_ = type_.decode('utf-8')
+            if type_ in SPILL_TYPES:
+                out = SPILL_TYPES[type_]()
+                for name in sorted(group):
+                    series = out.EntryClass.read(group[name], format='hdf5')
+                    if series.channel is not None:
+                        series.channel = get_channel(series.channel)
+                    if hasattr(series.channel, 'bits') and (
+                            isinstance(out, StateVectorStore)):
+                        series.bits = series.channel.bits
+                    out.append(series)
+            else:
+                from .archive import segments_from_array
+                out = EventTable.read(group['table'], format='hdf5')
+                try:
+                    out.meta['segments'] = segments_from_array(
+                        out.meta['segments'])
+                except KeyError:
+                    pass
+            del h5f[path]
+        return out
+
+
+SPILL_TYPES = dict((cls.__name__, cls) for cls in (
+    TimeSeriesStore,
+    StateVectorStore,
+    SpectrogramStore,
+))
@@ -32,6 +32,7 @@ from configparser import (
     NoSectionError,
 )
 from copy import copy
+from collections import OrderedDict
 from io import StringIO
 from datetime import timedelta
 
@@ -414,69 +415,40 @@ class DataTab(ProcessedTab, ParentTab):
             if p.outputfile in globalv.WRITTEN_PLOTS:
                 p.new = False
 
+        requests = self.get_data_requests(state, all_data=all_data,
+                                          config=config)
+        fftparams = requests['fftparams']
+        specsegs = requests['specsegs']
+
         # --------------------------------------------------------------------
         # process time-series
 
-        # find channels that need a TimeSeries
-        tschannels = self.get_channels('timeseries',
-                                       all_data=all_data, read=True)
+        # read time-series and state-vector channels in a single pass,
+        # channels requested as both are read as time-series
+        tschannels = requests['timeseries']
+        tsnames = set(map(str, tschannels))
+        svchannels = [c for c in requests['statevector'] if
+                      str(c) not in tsnames]
         if len(tschannels):
             vprint("    %d channels identified for TimeSeries\n"
                    % len(tschannels))
-            get_timeseries_dict(tschannels, state, config=config, nds=nds,
-                                nproc=nproc, cache=datacache,
-                                datafind_error=datafind_error, return_=False)
-            vprint("    All time-series data loaded\n")
-
-        # find channels that need a StateVector
-        svchannels = set(self.get_channels('statevector', all_data=all_data,
-                                           read=True))
-        odcchannels = self.get_channels('odc', all_data=all_data, read=True)
-        svchannels.update(odcchannels)
-        svchannels = list(svchannels)
         if len(svchannels):
             vprint("    %d channels identified as StateVectors\n"
-                   % (len(svchannels) - len(odcchannels)))
-            get_timeseries_dict(svchannels, state, config=config, nds=nds,
-                                nproc=nproc, statevector=True,
-                                cache=datacache, return_=False,
-                                datafind_error=datafind_error, dtype='uint32')
-            vprint("    All state-vector data loaded\n")
+                   % len(svchannels))
+        if len(tschannels) + len(svchannels):
+            get_timeseries_dict(
+                tschannels + svchannels, state, config=config, nds=nds,
+                nproc=nproc, statevector=svchannels, cache=datacache,
+                datafind_error=datafind_error, return_=False,
+                dtype=dict((str(c), 'uint32') for c in svchannels))
+            vprint("    All time-series and state-vector data loaded\n")
 
         # --------------------------------------------------------------------
         # process spectrograms
 
-        # find FFT parameters
-        try:
-            fftparams = dict(config.nditems('fft'))
-        except NoSectionError:
-            fftparams = {}
-        for key, val in fftparams.items():
-            try:
-                fftparams[key] = eval(val)
-            except (NameError, SyntaxError):
-                pass
-
-        sgchannels = self.get_channels('spectrogram', 'spectrum',
-                                       all_data=all_data, read=True)
-        raychannels = self.get_channels('rayleigh-spectrogram',
-                                        'rayleigh-spectrum',
-                                        all_data=all_data, read=True)
-        # for coherence spectrograms, we need all pairs of channels,
-        # not just the unique ones
-        csgchannels = self.get_channels('coherence-spectrogram',
-                                        all_data=all_data, read=True,
-                                        unique=False, state=state)
-
-        # pad spectrogram segments to include final time bin
-        specsegs = SegmentList(state.active)
-        specchannels = set.union(sgchannels, raychannels, csgchannels)
-        if specchannels and specsegs and specsegs[-1][1] == self.end:
-            stride = max(filter(
-                lambda x: x is not None,
-                (get_fftparams(c, **fftparams).stride for c in specchannels),
-            ))
-            specsegs[-1] = Segment(specsegs[-1][0], self.end+stride)
+        sgchannels = requests['spectrogram']
+        raychannels = requests['rayleigh-spectrogram']
+        csgchannels = requests['coherence-spectrogram']
 
         if len(sgchannels):
             vprint("    %d channels identified for Spectrogram\n"
@@ -494,10 +466,6 @@ class DataTab(ProcessedTab, ParentTab):
                              return_=False, nproc=nproc, **fp2)
 
         if len(csgchannels):
-            if (len(csgchannels) % 2 != 0):
-                raise ValueError("Error processing coherence spectrograms: "
-                                 "you must supply exactly 2 channels for "
-                                 "each spectrogram.")
             vprint("    %d channel pairs identified for Coherence "
                    "Spectrogram\n" % (len(csgchannels)/2))
             fp2 = fftparams.copy()
@@ -524,12 +492,7 @@ class DataTab(ProcessedTab, ParentTab):
         # --------------------------------------------------------------------
         # process segments
 
-        # find flags that need a DataQualityFlag
-        dqflags = set(self.get_flags('segments', all_data=all_data))
-        dqflags.update(self.get_flags('timeseries', all_data=all_data,
-                                      type='time-volume'))
-        dqflags.update(self.get_flags('spectrogram', all_data=all_data,
-                                      type='strain-time-volume'))
+        dqflags = requests['segments']
         if len(dqflags):
             vprint("    %d data-quality flags identified for segments\n"
                    % len(dqflags))
@@ -539,11 +502,7 @@ class DataTab(ProcessedTab, ParentTab):
         # --------------------------------------------------------------------
         # process triggers
 
-        for etg, channel in self.get_triggers('triggers',
-                                              'trigger-timeseries',
-                                              'trigger-rate',
-                                              'trigger-histogram',
-                                              all_data=all_data):
+        for etg, channel in requests['triggers']:
             get_triggers(channel, etg, state.active, config=config,
                          cache=trigcache, nproc=nproc, return_=False)
 
@@ -583,6 +542,104 @@ class DataTab(ProcessedTab, ParentTab):
 
         vprint('Done.\n')
 
+    def get_data_requests(self, state, all_data=False,
+                          config=GWSummConfigParser()):
+        """Return the data required to process this tab in a given state
+
+        This is used by :meth:`~DataTab.process_state` to load data, and
+        by the `~gwsumm.plan.DataPlan` to read data for many tabs in bulk
+        ahead of time.
+
+        Parameters
+        ----------
+        state : `~gwsumm.state.SummaryState`
+            the state to process
+
+        all_data : `bool`, optional
+            if `True` only return data for 'all-data' plots, otherwise
+            only for plots restricted to individual states
+
+        config : `ConfigParser`, optional
+            configuration for this analysis, used to find the FFT
+            parameters for spectrograms
+
+        Returns
+        -------
+        requests : `dict`
+            a `dict` of (type, request) pairs, each request being a `list`
+            of channels (or flags, or ``(etg, channel)`` pairs), along with
+            the ``'fftparams'`` used for spectrograms, and the ``'specsegs'``
+            over which to generate them
+        """
+        requests = OrderedDict()
+
+        # find channels that need a TimeSeries
+        requests['timeseries'] = list(self.get_channels(
+            'timeseries', all_data=all_data, read=True))
+
+        # find channels that need a StateVector
+        svchannels = set(self.get_channels('statevector', all_data=all_data,
+                                           read=True))
+        svchannels.update(self.get_channels('odc', all_data=all_data,
+                                            read=True))
+        requests['statevector'] = list(svchannels)
+
+        # find FFT parameters
+        try:
+            fftparams = dict(config.nditems('fft'))
+        except NoSectionError:
+            fftparams = {}
+        for key, val in fftparams.items():
+            try:
+                fftparams[key] = eval(val)
+            except (NameError, SyntaxError):
+                pass
+        requests['fftparams'] = fftparams
+
+        sgchannels = self.get_channels('spectrogram', 'spectrum',
+                                       all_data=all_data, read=True)
+        raychannels = self.get_channels('rayleigh-spectrogram',
+                                        'rayleigh-spectrum',
+                                        all_data=all_data, read=True)
+        # for coherence spectrograms, we need all pairs of channels,
+        # not just the unique ones
+        csgchannels = self.get_channels('coherence-spectrogram',
+                                        all_data=all_data, read=True,
+                                        unique=False, state=state)
+        if len(csgchannels) % 2 != 0:
+            raise ValueError("Error processing coherence spectrograms: "
+                             "you must supply exactly 2 channels for "
+                             "each spectrogram.")
+        requests['spectrogram'] = sgchannels
+        requests['rayleigh-spectrogram'] = raychannels
+        requests['coherence-spectrogram'] = csgchannels
+
+        # pad spectrogram segments to include final time bin
+        specsegs = SegmentList(state.active)
+        specchannels = set.union(sgchannels, raychannels, csgchannels)
+        if specchannels and specsegs and specsegs[-1][1] == self.end:
+            stride = max(filter(
+                lambda x: x is not None,
+                (get_fftparams(c, **fftparams).stride for c in specchannels),
+            ))
+            specsegs[-1] = Segment(specsegs[-1][0], self.end+stride)
+        requests['specsegs'] = specsegs
+
+        # find flags that need a DataQualityFlag
+        dqflags = set(self.get_flags('segments', all_data=all_data))
+        dqflags.update(self.get_flags('timeseries', all_data=all_data,
+                                      type='time-volume'))
+        dqflags.update(self.get_flags('spectrogram', all_data=all_data,
+                                      type='strain-time-volume'))
+        requests['segments'] = dqflags
+
+        # find triggers
+        requests['triggers'] = self.get_triggers(
+            'triggers', 'trigger-timeseries', 'trigger-rate',
+            'trigger-histogram', all_data=all_data)
+
+        return requests
+
     # -------------------------------------------------------------------------
     # HTML operations
 
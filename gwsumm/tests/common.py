@@ -19,7 +19,13 @@
 """Compatibility module
 """
 
+import json
+import threading
 from functools import wraps
+from http.server import (BaseHTTPRequestHandler, HTTPServer)
+from urllib.parse import (urlparse, parse_qs)
+
+import pytest
 
 from gwsumm import globalv
 
@@ -36,3 +42,54 @@ def empty_globalv_CHANNELS(f):
         finally:
             globalv.CHANNELS = _channels
     return wrapped_f
+
+
+# -- test fixtures ------------------------------------------------------------
+
+class DQSegDBHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for a DQSegDB server
+
+    Each flag is known over the whole request (up to ``now``, if set), and
+    active for the first half of that.
+    """
+    requests = []
+    now = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        if len(parts) == 3:  # query versions
+            out = {'version': [1]}
+        else:
+            self.requests.append(self.path)
+            query = parse_qs(url.query)
+            start, end = float(query['s'][0]), float(query['e'][0])
+            if self.now is not None:
+                end = max(start, min(end, self.now))
+            out = {'ifo': parts[1], 'name': parts[2],
+                   'version': int(parts[3]), 'known': [[start, end]],
+                   'active': [[start, (start + end) / 2.]]}
+        body = json.dumps(out).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def dqsegdb():
+    server = HTTPServer(('127.0.0.1', 0), DQSegDBHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    DQSegDBHandler.requests = []
+    DQSegDBHandler.now = None
+    try:
+        yield 'http://127.0.0.1:%d' % server.server_port
+    finally:
+        server.shutdown()
+        server.server_close()
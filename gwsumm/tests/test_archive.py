@@ -35,6 +35,9 @@ from gwpy.spectrogram import Spectrogram
 from gwpy.segments import (Segment, SegmentList)
 
 from gwsumm import (archive, data, globalv, channels, triggers)
+from gwsumm.plot import get_plot
+from gwsumm.state import SummaryState
+from gwsumm.tabs import get_tab
 
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
 
@@ -51,6 +54,7 @@ def empty_globalv():
     globalv.SPECTROGRAMS = type(globalv.SPECTROGRAMS)()
     globalv.SEGMENTS = type(globalv.SEGMENTS)()
     globalv.TRIGGERS = type(globalv.TRIGGERS)()
+    globalv.SPECTRUM_SKETCHES = {}
 
 
 def create(data, **metadata):
@@ -72,12 +76,16 @@ def test_write_archive(delete=True):
     data.add_timeseries(create([1, 2, 3, 2, 1],
                                series_class=StateVector,
                                channel='X1:TEST-STATE_VECTOR'))
-    data.add_spectrogram(create([[1, 2, 3], [3, 2, 1], [1, 2, 3]],
-                                series_class=Spectrogram,
-                                channel='X1:TEST-SPECTROGRAM'))
+    spec = create([[1, 2, 3], [3, 2, 1], [1, 2, 3]],
+                  series_class=Spectrogram, channel='X1:TEST-SPECTROGRAM')
+    data.add_spectrogram(spec)
+    sketch = data.SpectrumSketch()
+    sketch.update(spec)
+    globalv.SPECTRUM_SKETCHES['X1:TEST-SPECTROGRAM'] = sketch
     t = EventTable(random.random((100, 5)), names=['time', 'a', 'b', 'c', 'd'])
     t.meta['segments'] = SegmentList([Segment(0, 100)])
     triggers.add_triggers(t, 'X1:TEST-TABLE,testing')
+    data.FILTER_STATE['X1:TEST-CHANNEL'] = (1., 110., random.random((2, 2)))
     fname = tempfile.mktemp(suffix='.h5', prefix='gwsumm-tests-')
     try:
         archive.write_data_archive(fname)
@@ -91,6 +99,7 @@ def test_write_archive(delete=True):
 def test_read_archive():
     fname = test_write_archive(delete=False)
     empty_globalv()
+    zf = data.FILTER_STATE.pop('X1:TEST-CHANNEL')[2]
     try:
         archive.read_data_archive(fname)
     finally:
@@ -101,6 +110,10 @@ def test_read_archive():
     nptest.assert_array_equal(ts.value, TEST_DATA.value)
     for attr in ['epoch', 'unit', 'sample_rate', 'channel', 'name']:
         assert getattr(ts, attr) == getattr(TEST_DATA, attr)
+    # check filter state
+    rate, end, zf2 = data.FILTER_STATE.pop('X1:TEST-CHANNEL')
+    assert (rate, end) == (1., 110.)
+    nptest.assert_array_equal(zf2, zf)
     # check trend series
     ts = data.get_timeseries('X1:TEST-TREND.mean,m-trend', [(0, 300)],
                              query=False).join()
@@ -109,6 +122,11 @@ def test_read_archive():
     # check triggers
     t = triggers.get_triggers('X1:TEST-TABLE', 'testing', [(0, 100)])
     assert len(t) == 100
+    # check spectrum sketch
+    sketch = globalv.SPECTRUM_SKETCHES['X1:TEST-SPECTROGRAM']
+    assert sketch.count == 3
+    nptest.assert_allclose(sketch.percentile(50).value, [1, 2, 3],
+                           rtol=.03)
 
 
 def test_archive_load_table():
@@ -131,3 +149,98 @@ def test_archive_load_table():
     finally:
         if os.path.exists(fname):
             os.remove(fname)
+
+
+def test_archive_pyramid(tmpdir):
+    empty_globalv()
+    values = random.random(7200)
+    values[4000] = 10.
+    data.add_timeseries(create(values, sample_rate=1, epoch=0,
+                               channel='X1:TEST-PYRAMID', name='TEST'))
+    fname = str(tmpdir.join('archive.h5'))
+    archive.write_data_archive(fname, pyramid=True)
+    with h5py.File(fname, 'r') as h5file:
+        assert sorted(h5file['pyramid']) == ['3600', '60', '600']
+
+    # read trends at the coarsest resolution that meets the requirement,
+    # alongside the full data
+    empty_globalv()
+    archive.read_data_archive(fname, resolution=1000)
+    ts, = globalv.DATA['X1:TEST-PYRAMID']
+    nptest.assert_array_equal(ts.value, values)
+    mean, = globalv.DATA[data.pyramid_key('X1:TEST-PYRAMID', 'mean')]
+    assert mean.dt.value == 600
+    nptest.assert_allclose(mean.value, values.reshape(12, 600).mean(axis=1))
+    high, = globalv.DATA[data.pyramid_key('X1:TEST-PYRAMID', 'max')]
+    assert high.value[6] == 10.
+
+    # or the full data
+    empty_globalv()
+    archive.read_data_archive(fname)
+    ts, = globalv.DATA['X1:TEST-PYRAMID']
+    nptest.assert_array_equal(ts.value, values)
+    assert data.pyramid_key('X1:TEST-PYRAMID', 'max') not in globalv.DATA
+
+    # or only the trends
+    empty_globalv()
+    archive.read_data_archive(fname, resolution=1000,
+                              trends_only={'X1:TEST-PYRAMID'})
+    assert 'X1:TEST-PYRAMID' not in globalv.DATA
+    mean, = globalv.DATA[data.pyramid_key('X1:TEST-PYRAMID', 'mean')]
+    assert mean.dt.value == 600
+    empty_globalv()
+
+
+def test_archive_pyramid_day_boundary(tmpdir):
+    # daily archives span UTC days, which don't start on GPS multiples
+    # of the trend durations
+    day = 1167264018  # 2017-01-01 00:00:00 UTC
+    fnames = []
+    for i in range(2):
+        empty_globalv()
+        data.add_timeseries(create(
+            random.random(86400), sample_rate=1, epoch=day + i * 86400,
+            channel='X1:TEST-PYRAMID_DAY', name='TEST'))
+        fnames.append(str(tmpdir.join('archive-%d.h5' % i)))
+        archive.write_data_archive(fnames[-1], pyramid=True)
+
+    # bins are aligned to the start of each day, so trends from
+    # consecutive archives join without duplicate bins
+    empty_globalv()
+    for fname in fnames:
+        archive.read_data_archive(fname, resolution=3600)
+    trends = globalv.DATA[data.pyramid_key('X1:TEST-PYRAMID_DAY', 'mean')]
+    assert trends.segments == SegmentList([Segment(day, day + 172800)])
+    assert sum(trend.size for trend in trends) == 48
+    empty_globalv()
+
+
+def test_add_trend():
+    empty_globalv()
+    a = TimeSeries([1., 2., 3.], t0=0, dt=60, name='TEST')
+    b = TimeSeries([4., 5., 6.], t0=120, dt=60, name='TEST')
+    archive._add_trend(a, 'X1:TEST-TREND.mean')
+    # the overlapping bin is dropped
+    archive._add_trend(b, 'X1:TEST-TREND.mean')
+    stored = globalv.DATA['X1:TEST-TREND.mean']
+    assert stored.segments == SegmentList([Segment(0, 300)])
+    nptest.assert_array_equal(stored.join().value, [1., 2., 3., 5., 6.])
+    # and wholly overlapping trends are ignored
+    archive._add_trend(b[:1], 'X1:TEST-TREND.mean')
+    assert sum(ts.size for ts in stored) == 5
+    empty_globalv()
+
+
+def test_find_trend_channels():
+    state = SummaryState('test', known=[(0, 100)], active=[(0, 100)],
+                         definition='X1:TEST-STATE>1')
+    tab = get_tab('data')('Test', states=[state], span=(0, 100),
+                          mode='gps')
+    for type_, chans in [
+            ('timeseries', ['X1:TEST-A', 'X1:TEST-B', 'X1:TEST-STATE']),
+            ('timeseries', ['X1:TEST-C.mean', 'X1:TEST-C.min',
+                            'X1:TEST-C.max']),
+            ('spectrum', ['X1:TEST-B']),
+    ]:
+        tab.plots.append(get_plot(type_)(chans, 0, 100, state=state))
+    assert archive.find_trend_channels([tab]) == {'X1:TEST-A'}
@@ -24,23 +24,28 @@ import os.path
 import operator
 import tempfile
 import shutil
+import threading
 from collections import OrderedDict
+from configparser import ConfigParser
 from urllib.request import urlopen
 
 import pytest
 
-from numpy import (arange, testing as nptest)
+from numpy import (arange, random, testing as nptest)
 
 from lal.utils import CacheEntry
 
 from glue.lal import Cache
 
-from gwpy.timeseries import TimeSeries
+from gwpy import astro
+from gwpy.frequencyseries import FrequencySeries
+from gwpy.timeseries import (TimeSeries, TimeSeriesDict, StateVector)
 from gwpy.detector import Channel
 from gwpy.segments import (Segment, SegmentList)
+from gwpy.spectrogram import Spectrogram
 
 from gwsumm import (data, globalv)
-from gwsumm.data import (utils, mathutils)
+from gwsumm.data import (utils, mathutils, frameindex, welch)
 
 from .common import empty_globalv_CHANNELS
 
@@ -249,3 +254,476 @@ class TestData(object):
             ('H1:LOSC-STRAIN', 'L1:LOSC-STRAIN'), LOSC_SEGMENTS, cache=cache,
             stride=4, fftlength=2, overlap=1, nproc=1,
         )
+
+
+# -- frame index --------------------------------------------------------------
+
+def _touch_frames(root, epoch, *starts):
+    epochdir = os.path.join(root, 'X-X1_TEST-%s' % epoch)
+    if not os.path.isdir(epochdir):
+        os.makedirs(epochdir)
+    paths = []
+    for start in starts:
+        paths.append(os.path.join(epochdir, 'X-X1_TEST-%d-64.gwf' % start))
+        open(paths[-1], 'w').close()
+    return paths
+
+
+def test_frame_index(tmpdir):
+    root = str(tmpdir.mkdir('X1_TEST'))
+    index = frameindex.FrameIndex(str(tmpdir.join('index.sqlite')))
+    try:
+        # seed index with files found elsewhere (e.g. by datafind)
+        seed = _touch_frames(root, 10000, 1000000000, 1000000064)
+        index.add_files('X', 'X1_TEST', seed)
+        index.add_coverage('X', 'X1_TEST', (1000000000, 1000000128))
+
+        # write new files in a new epoch directory, and refresh
+        new = _touch_frames(root, 10001, 1000100000)
+        assert index.refresh('X', 'X1_TEST') == 1
+
+        # find files
+        paths, missing = index.find('X', 'X1_TEST', 1000000000, 1000100032)
+        assert paths == seed + new
+        assert not abs(missing)
+
+        paths, missing = index.find('X', 'X1_TEST', 999999000, 1000000100)
+        assert paths == seed
+        assert missing == SegmentList([Segment(999999000, 1000000000)])
+    finally:
+        index.close()
+
+
+def test_frame_index_threads(tmpdir):
+    root = str(tmpdir.mkdir('X1_TEST'))
+    index = frameindex.FrameIndex(str(tmpdir.join('index.sqlite')))
+    errors = []
+
+    def _add(epoch):
+        try:
+            paths = _touch_frames(root, epoch, epoch * 100000)
+            index.add_files('X', 'X1_TEST', paths)
+            index.add_coverage('X', 'X1_TEST',
+                               (epoch * 100000, epoch * 100000 + 64))
+        except Exception as exc:
+            errors.append(exc)
+
+    # use the same index from a number of threads
+    threads = [threading.Thread(target=_add, args=(10000 + i,)) for
+               i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert not errors
+        paths, missing = index.find('X', 'X1_TEST', 1000000000, 1000300064)
+        assert len(paths) == 4
+        assert len(missing) == 3
+    finally:
+        index.close()
+
+
+def test_find_frames_index(tmpdir, monkeypatch):
+    root = str(tmpdir.mkdir('X1_TEST'))
+    found = _touch_frames(root, 10000, 1000000000, 1000000064)
+    queries = []
+
+    def find_urls(ifo, frametype, start, end, **kwargs):
+        queries.append((start, end))
+        return ['file://localhost%s' % path for path in found]
+
+    monkeypatch.setattr(data.timeseries.gwdatafind, 'find_urls', find_urls)
+    monkeypatch.setattr(globalv, 'NOW', 1000000200)
+    config = ConfigParser()
+    config.add_section('datafind')
+    config.set('datafind', 'frame-index', str(tmpdir.join('index.sqlite')))
+
+    # first call queries datafind
+    cache = data.find_frames('X1', 'X1_TEST', 1000000000, 1000000128,
+                             config=config)
+    assert cache == found
+    assert queries == [(1000000000, 1000000128)]
+
+    # second call is answered from the index (including new files),
+    # without checking each file on disk
+    def _stat(path):
+        raise AssertionError("checked %s on disk" % path)
+
+    found.extend(_touch_frames(root, 10000, 1000000128))
+    with monkeypatch.context() as mpatch:
+        mpatch.setattr(os.path, 'exists', _stat)
+        mpatch.setattr(os.path, 'isfile', _stat)
+        cache = data.find_frames('X1', 'X1_TEST', 1000000000, 1000000192,
+                                 config=config)
+    assert cache == found
+    assert len(queries) == 1
+
+    # coverage is only recorded up to the latest file found, so recent
+    # spans are queried again until their files are written
+    for i in range(2):
+        cache = data.find_frames('X1', 'X1_TEST', 1000000000, 1000000256,
+                                 config=config)
+        assert cache == found
+        assert queries[-1] == (1000000192, 1000000200)
+        assert len(queries) == 2 + i
+    index = frameindex.get_frame_index(str(tmpdir.join('index.sqlite')))
+    assert index.coverage('X', 'X1_TEST') == SegmentList([
+        Segment(1000000000, 1000000192)])
+
+
+def test_find_best_frames_cached(monkeypatch):
+    files = ['/data/X-X1_TEST-%d-64.gwf' % t for t in range(0, 640, 64)]
+    queries = []
+
+    def find_frames(ifo, frametype, start, end, **kwargs):
+        queries.append((start, end))
+        return list(files)
+
+    monkeypatch.setattr(data.timeseries, 'find_frames', find_frames)
+    data.timeseries.FRAME_CACHE.clear()
+    cache, _ = data.find_best_frames('X1', 'X1_TEST', 0, 640, gaps='ignore')
+    assert cache == files
+    # contained span is answered from memory
+    cache, _ = data.find_best_frames('X1', 'X1_TEST', 100, 200, gaps='ignore')
+    assert cache == files[1:4]
+    assert len(queries) == 1
+    # different options are a new query
+    data.find_best_frames('X1', 'X1_TEST', 100, 200, gaps='raise')
+    assert len(queries) == 2
+    data.timeseries.FRAME_CACHE.clear()
+
+
+@empty_globalv_CHANNELS
+def test_get_timeseries_dict_mixed(tmpdir):
+    globalv.DATA = type(globalv.DATA)()
+    tsd = TimeSeriesDict()
+    for name in ('X1:TEST-MIXED_A', 'X1:TEST-MIXED_B'):
+        tsd[name] = TimeSeries(arange(16.), sample_rate=1, epoch=0,
+                               channel=name, name=name)
+    gwf = str(tmpdir.join('X-X1_TEST-0-16.gwf'))
+    tsd.write(gwf)
+
+    # read both channels in a single pass, with one as a StateVector,
+    # which should be resampled bit-wise
+    data.get_channel('X1:TEST-MIXED_B').resample = 0.5
+    out = data.get_timeseries_dict(
+        list(tsd), [(0, 16)], cache=[gwf], nds=False,
+        statevector=['X1:TEST-MIXED_B'],
+        dtype={'X1:TEST-MIXED_B': 'uint32'})
+    a, = out['X1:TEST-MIXED_A']
+    b, = out['X1:TEST-MIXED_B']
+    assert not isinstance(a, StateVector)
+    assert isinstance(b, StateVector)
+    assert b.dtype == 'uint32'
+    nptest.assert_array_equal(a.value, arange(16.))
+    assert b.sample_rate.value == 0.5
+    nptest.assert_array_equal(b.value, arange(0, 16, 2))
+    globalv.DATA = type(globalv.DATA)()
+
+
+@empty_globalv_CHANNELS
+def test_get_timeseries_dict_threaded(tmpdir, monkeypatch):
+    globalv.DATA = type(globalv.DATA)()
+    caches = {}
+    for ftype in ('X1_A', 'X1_B'):
+        name = 'X1:TEST-%s' % ftype
+        data.get_channel(name).frametype = ftype
+        tsd = TimeSeriesDict()
+        tsd[name] = TimeSeries(arange(16.), sample_rate=1, epoch=0,
+                               channel=name, name=name)
+        caches[ftype] = [str(tmpdir.join('X-%s-0-16.gwf' % ftype))]
+        tsd.write(caches[ftype][0])
+
+    # record which frametypes were queried, and whether the queries
+    # overlapped (each waits for the other, if run serially the barrier
+    # times out)
+    queried = []
+    overlapped = []
+    barrier = threading.Barrier(2, timeout=5)
+
+    def find_best_frames(ifo, frametype, start, end, **kwargs):
+        queried.append(frametype)
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        else:
+            overlapped.append(frametype)
+        return caches[frametype], frametype
+
+    monkeypatch.setattr(data.timeseries, 'find_best_frames',
+                        find_best_frames)
+    out = data.get_timeseries_dict(['X1:TEST-X1_A', 'X1:TEST-X1_B'],
+                                   [(0, 16)], nds=False, nproc=2)
+    assert sorted(queried) == ['X1_A', 'X1_B']
+    assert sorted(overlapped) == ['X1_A', 'X1_B']
+    assert sorted(out) == ['X1:TEST-X1_A', 'X1:TEST-X1_B']
+    for name in out:
+        nptest.assert_array_equal(out[name][0].value, arange(16.))
+    globalv.DATA = type(globalv.DATA)()
+
+
+def test_resample_timeseries_dict():
+    tsd = TimeSeriesDict()
+    for i in range(4):
+        name = 'X1:TEST-RESAMPLE_%d' % i
+        tsd[name] = TimeSeries(random.randn(4096), sample_rate=256,
+                               epoch=10, name=name, unit='m')
+    rates = {'X1:TEST-RESAMPLE_0': 64, 'X1:TEST-RESAMPLE_1': 64,
+             'X1:TEST-RESAMPLE_2': 100}
+    out = data.resample_timeseries_dict(tsd, nproc=2, **rates)
+    assert set(out) == set(tsd)
+    assert out['X1:TEST-RESAMPLE_3'] is tsd['X1:TEST-RESAMPLE_3']
+    for name, rate in rates.items():
+        expected = tsd[name].resample(rate, ftype='fir', window='hamming')
+        assert out[name].sample_rate == expected.sample_rate
+        assert out[name].x0 == expected.x0
+        assert out[name].unit == expected.unit
+        nptest.assert_allclose(out[name].value, expected.value)
+
+    # state vectors are downsampled bit-wise
+    sv = StateVector([3, 3, 1, 3, 2, 2, 3, 3], dtype='uint32',
+                     sample_rate=4, epoch=10, name='X1:TEST-RESAMPLE_SV')
+    out = data.resample_timeseries_dict({sv.name: sv}, **{sv.name: 2})
+    assert isinstance(out[sv.name], StateVector)
+    assert out[sv.name].sample_rate.value == 2
+    nptest.assert_array_equal(out[sv.name].value, [3, 1, 2, 3])
+
+    # filter design is cached
+    assert data.design_resample_fir(256, 64) is data.design_resample_fir(
+        256., 64.)
+
+
+def test_filter_timeseries():
+    ts = TimeSeries(random.randn(1024), sample_rate=64, epoch=0,
+                    name='X1:TEST-FILTER', unit='m')
+    zpk = ([], [0.5, 0.5], 0.25)
+    full = data.filter_timeseries(ts, zpk)
+    data.FILTER_STATE.pop('X1:TEST-FILTER', None)
+    try:
+        # filtering contiguous chunks matches filtering all at once
+        a = data.filter_timeseries(ts[:512], zpk, key='X1:TEST-FILTER')
+        b = data.filter_timeseries(ts[512:], zpk, key='X1:TEST-FILTER')
+        nptest.assert_allclose(a.append(b, inplace=False).value, full.value)
+        assert b.unit == ts.unit and b.t0 == ts[512:].t0
+        assert data.FILTER_STATE['X1:TEST-FILTER'][1] == ts.span[1]
+
+        # but non-contiguous data start from rest
+        c = data.filter_timeseries(ts[256:512], zpk, key='X1:TEST-FILTER')
+        nptest.assert_allclose(c.value,
+                               data.filter_timeseries(ts[256:512], zpk).value)
+    finally:
+        data.FILTER_STATE.pop('X1:TEST-FILTER', None)
+
+
+def test_chunk_segments():
+    segs = SegmentList([Segment(30, 150), Segment(200, 210)])
+    assert data.chunk_segments(segs, 60) == SegmentList([
+        Segment(30, 60), Segment(60, 120), Segment(120, 150),
+        Segment(200, 210)])
+
+
+def test_get_timeseries_dict_chunked(tmpdir):
+    globalv.DATA = type(globalv.DATA)()
+    name = 'X1:TEST-CHUNKED'
+    tsd = TimeSeriesDict()
+    tsd[name] = TimeSeries(arange(16.), sample_rate=1, epoch=0,
+                           channel=name, name=name)
+    gwf = str(tmpdir.join('X-X1_TEST-0-16.gwf'))
+    tsd.write(gwf)
+    config = ConfigParser()
+    config.add_section('general')
+    config.set('general', 'chunk-duration', '4')
+    out = data.get_timeseries_dict([name], [(1, 15)], config=config,
+                                   cache=[gwf], nds=False)
+    # chunks are stored as a single contiguous series
+    ts, = out[name]
+    assert ts.span == (1, 15)
+    nptest.assert_array_equal(ts.value, arange(1., 15.))
+    globalv.DATA = type(globalv.DATA)()
+
+
+@empty_globalv_CHANNELS
+def test_get_timeseries_dict_chunked_resample(tmpdir):
+    name = 'X1:TEST-CHUNKED_RESAMPLE'
+    tsd = TimeSeriesDict()
+    tsd[name] = TimeSeries(random.randn(64 * 64), sample_rate=64, epoch=0,
+                           channel=name, name=name)
+    gwf = str(tmpdir.join('X-X1_TEST-0-64.gwf'))
+    tsd.write(gwf)
+    data.get_channel(name).resample = 16
+    config = ConfigParser()
+    config.add_section('general')
+
+    # read all at once, then in chunks
+    out = []
+    for chunk in ('0', '16'):
+        globalv.DATA = type(globalv.DATA)()
+        config.set('general', 'chunk-duration', chunk)
+        ts, = data.get_timeseries_dict([name], [(0, 64)], config=config,
+                                       cache=[gwf], nds=False)[name]
+        out.append(ts)
+    full, chunked = out
+
+    # resampling chunks leaves no transients at the chunk boundaries
+    assert chunked.span == full.span == (0, 64)
+    assert chunked.sample_rate.value == 16
+    nptest.assert_allclose(chunked.value, full.value, atol=1e-12)
+    globalv.DATA = type(globalv.DATA)()
+
+
+@empty_globalv_CHANNELS
+def test_storage_dtype(monkeypatch):
+    globalv.DATA = type(globalv.DATA)()
+    globalv.SPECTROGRAMS = type(globalv.SPECTROGRAMS)()
+    ts = TimeSeries(random.randn(16), sample_rate=1, epoch=0,
+                    channel='X1:TEST-STORAGE', name='X1:TEST-STORAGE')
+
+    # default is lossless
+    assert utils.get_storage_dtype('X1:TEST-STORAGE') is None
+    assert utils.cast_for_storage(ts) is ts
+
+    # global float32 mode
+    monkeypatch.setattr(globalv, 'STORAGE_DTYPE', 'float32')
+    data.add_timeseries(ts, key='X1:TEST-STORAGE')
+    stored, = globalv.DATA['X1:TEST-STORAGE']
+    assert stored.dtype == 'float32'
+    nptest.assert_allclose(stored.value, ts.value, rtol=1e-6)
+    spec = Spectrogram(random.randn(4, 4) + 1j, channel='X1:TEST-STORAGE')
+    data.add_spectrogram(spec, key='X1:TEST-STORAGE')
+    assert globalv.SPECTROGRAMS['X1:TEST-STORAGE'][0].dtype == 'complex64'
+
+    # integer data are never cast
+    sv = StateVector(arange(16, dtype='uint32'), channel='X1:TEST-STORAGE')
+    assert utils.cast_for_storage(sv) is sv
+
+    # per-channel option overrides the global default
+    data.get_channel('X1:TEST-STORAGE').storage_dtype = 'lossless'
+    assert utils.cast_for_storage(ts) is ts
+    globalv.DATA = type(globalv.DATA)()
+    globalv.SPECTROGRAMS = type(globalv.SPECTROGRAMS)()
+
+
+def test_downsample_timeseries():
+    ts = TimeSeries(arange(300.), sample_rate=1, epoch=30, unit='m')
+    trend = data.downsample_timeseries(ts, 60, statistic='max')
+    # bins are aligned to multiples of the duration, including partial
+    # bins at either end
+    assert trend.span == (0, 360)
+    assert trend.dt.value == 60
+    assert trend.unit == ts.unit
+    nptest.assert_array_equal(trend.value,
+                              [29., 89., 149., 209., 269., 299.])
+    # data shorter than a single bin
+    trend = data.downsample_timeseries(ts, 3600)
+    assert trend.span == (0, 3600)
+    nptest.assert_array_equal(trend.value, [149.5])
+    assert data.downsample_timeseries(ts, 1.5) is None
+    # or aligned to some other time
+    trend = data.downsample_timeseries(ts, 60, statistic='max', origin=30)
+    assert trend.span == (30, 330)
+    nptest.assert_array_equal(trend.value, [59., 119., 179., 239., 299.])
+
+
+@pytest.mark.parametrize('fftparams', [
+    {'method': 'median', 'fftlength': 2, 'overlap': 1},
+    {'method': 'welch', 'fftlength': 2, 'window': 'hamming'},
+])
+def test_get_spectrograms_batched(monkeypatch, fftparams):
+    globalv.DATA = type(globalv.DATA)()
+    globalv.SPECTROGRAMS = type(globalv.SPECTROGRAMS)()
+    names = ['X1:TEST-BATCH_%s_%d' % (fftparams['method'], i)
+             for i in range(3)]
+    tsd = OrderedDict()
+    for name in names:
+        tsd[name] = TimeSeries(random.randn(64 * 103), sample_rate=64,
+                               epoch=10, unit='m', name=name, channel=name)
+        data.add_timeseries(tsd[name], key=name)
+
+    # all channels should be processed by the batch, not one at a time
+    calls = []
+    batch_welch = welch.batch_welch
+
+    def _batch_welch(*args, **kwargs):
+        calls.append(args)
+        return batch_welch(*args, **kwargs)
+
+    monkeypatch.setattr(welch, 'batch_welch', _batch_welch)
+    out = data.get_spectrograms(names, SegmentList([Segment(10, 113)]),
+                                stride=10, **fftparams)
+    assert len(calls) == 1
+
+    for channel, name in zip(out, names):
+        specgram, = out[channel]
+        size = data.spectral.size_for_spectrogram(
+            103, 10, 2, fftparams.get('overlap', 0))
+        ts = tsd[name].crop(10, 10 + size)
+        ref = ts.spectrogram(10, **fftparams)
+        nptest.assert_allclose(specgram.value, ref.value, rtol=1e-10)
+        assert specgram.unit == ref.unit
+        assert specgram.epoch == ref.epoch
+        assert specgram.dt == ref.dt
+        assert specgram.df == ref.df
+    globalv.DATA = type(globalv.DATA)()
+    globalv.SPECTROGRAMS = type(globalv.SPECTROGRAMS)()
+
+
+def test_get_spectrum_sketch(monkeypatch):
+    monkeypatch.setattr(globalv, 'SPECTROGRAMS',
+                        type(globalv.SPECTROGRAMS)())
+    monkeypatch.setattr(globalv, 'SPECTRUM', {})
+    monkeypatch.setattr(globalv, 'SPECTRUM_SKETCHES', {})
+    name = 'X1:TEST-SKETCH'
+    fftparams = {'method': 'median', 'fftlength': 1, 'overlap': .5,
+                 'stride': 1}
+    key = utils.make_globalv_key(name, utils.get_fftparams(name, **fftparams))
+    specgram = Spectrogram(10 ** random.uniform(-2, 2, size=(2000, 3)),
+                           epoch=0, dt=1, f0=0, df=1, unit='m^2/Hz',
+                           name=name, channel=name)
+    data.add_spectrogram(specgram, key=key)
+
+    med, low, high = data.get_spectrum(name, [(0, 2000)], query=False,
+                                       **fftparams)
+    for spec, q in zip((med, low, high), (50, 5, 95)):
+        nptest.assert_allclose(spec.value, specgram.percentile(q).value,
+                               rtol=.03)
+    sketch = data.get_spectrum_sketch(name, SegmentList([Segment(0, 2000)]),
+                                      query=False, **fftparams)
+    assert sketch.count == 2000
+    assert globalv.SPECTRUM_SKETCHES[key] is sketch
+
+    # amplitude spectra are scaled from the same sketch
+    asd = data.get_spectrum(name, [(0, 2000)], query=False, format='asd',
+                            which='mean', **fftparams)
+    nptest.assert_allclose(asd.value, med.value ** .5)
+    assert sketch.count == 2000
+
+
+@pytest.mark.parametrize('rangekwargs', [
+    {'mass1': 1.4, 'mass2': 1.4},
+    {'mass1': 10, 'mass2': 10, 'fmin': 20, 'snr': 10},
+    {'energy': 1e-2},
+    {'energy': 1, 'fmin': 50, 'fmax': 1000},
+    # default or zero frequency limits
+    {'mass1': 1.4, 'mass2': 1.4, 'fmin': None, 'fmax': None},
+    {'mass1': 1.4, 'mass2': 1.4, 'fmin': 0},
+    {'energy': 1e-2, 'fmin': None, 'fmax': None},
+    {'energy': 1e-2, 'fmin': 0, 'fmax': 0},
+])
+def test_range_kernel(rangekwargs):
+    psds = random.uniform(1, 10, size=(4, 2049)) * 1e-46
+    kernel = data.range.get_range_kernel(0, .5, 2049, **rangekwargs)
+    assert data.range.get_range_kernel(0, .5, 2049, **rangekwargs) is kernel
+    if 'energy' in rangekwargs:
+        range_func = astro.burst_range
+    else:
+        range_func = astro.inspiral_range
+    nptest.assert_allclose(
+        data.range.apply_range_kernel(kernel, psds),
+        [range_func(FrequencySeries(psd, f0=0, df=.5),
+                    **rangekwargs).value for psd in psds],
+        rtol=1e-10)
+    # unsupported parameters fall back to the per-PSD calculation
+    assert data.range.get_range_kernel(0, .5, 2049, distance=1,
+                                       **rangekwargs) is None
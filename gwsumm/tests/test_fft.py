@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests for `gwsumm.data.fft`
+
+"""
+
+import pytest
+
+from numpy import (fft as npfft, median, random, testing as nptest)
+
+from scipy import signal
+
+from gwsumm.data import fft
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+
+def test_get_window():
+    win = fft.get_window('Hann', 16)
+    nptest.assert_array_equal(win, signal.get_window('hann', 16))
+    assert fft.get_window('hann', 16) is win
+    assert (16, 'hann') in fft.WINDOWS
+    assert not win.flags.writeable
+    assert fft.get_window(('kaiser', 8), 16) is not win
+
+
+def test_median_bias():
+    # bias is the ratio of the median to the mean of chi^2(2) estimates
+    x = random.exponential(size=(20000, 7))
+    nptest.assert_allclose(median(x, axis=1).mean(), fft.median_bias(7),
+                           rtol=.05)
+    assert fft.median_bias(1) == 1.
+
+
+@pytest.mark.parametrize('name', ['scipy', 'lal'])
+def test_rfft(name):
+    if name == 'lal':
+        pytest.importorskip('lal')
+    backend = fft.BACKENDS[name]()
+    x = random.randn(3, 2, 64)
+    nptest.assert_allclose(backend.rfft(x), npfft.rfft(x), atol=1e-12)
+    nptest.assert_allclose(backend.rfft(x, axis=1), npfft.rfft(x, axis=1),
+                           atol=1e-12)
+
+
+def test_set_backend(monkeypatch):
+    monkeypatch.setattr(fft, 'BACKEND', fft.BACKEND)
+    backend = fft.set_backend('scipy', workers=2)
+    assert fft.get_backend() is backend
+    assert backend.workers == 2
+    assert not backend.save_wisdom()
+    with pytest.raises(ValueError):
+        fft.set_backend('fftpack')
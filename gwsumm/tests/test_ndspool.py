@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for `gwsumm.data.ndspool`
+
+"""
+
+import pytest
+
+from numpy import (arange, testing as nptest)
+
+from gwpy.timeseries import (TimeSeries, TimeSeriesDict)
+
+from gwsumm.data import ndspool
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+
+class MockConnection(object):
+    def __init__(self, host, port, protocol):
+        self.host = host
+        self.port = port
+        self.protocol = protocol or 2
+        self.closed = False
+        self.requests = []
+
+    def get_protocol(self):
+        if self.closed:
+            raise RuntimeError("connection closed")
+        return self.protocol
+
+    def close(self):
+        self.closed = True
+
+
+class MockDict(TimeSeriesDict):
+    @classmethod
+    def fetch(cls, channels, start, end, connection=None, **kwargs):
+        if connection.closed:
+            raise RuntimeError("connection closed")
+        connection.requests.append((start, end))
+        return cls((c, TimeSeries(arange(start, end), sample_rate=1,
+                                  epoch=start, name=c)) for c in channels)
+
+
+def test_pool():
+    pool = ndspool.NDSConnectionPool(connect=MockConnection, maxsize=1)
+    with pool.connection('nds.example.com', 31200) as conn:
+        assert conn.host == 'nds.example.com'
+    # idle connection is re-used
+    with pool.connection('nds.example.com', '31200') as conn2:
+        assert conn2 is conn
+    assert (pool.opened, pool.reused) == (1, 1)
+    # but not for a different protocol
+    with pool.connection('nds.example.com', 31200, protocol=1) as conn3:
+        assert conn3 is not conn
+    # unhealthy connections are replaced
+    conn.closed = True
+    with pool.connection('nds.example.com', 31200) as conn4:
+        assert conn4 is not conn
+    assert pool.opened == 3
+    # connections are dropped on error
+    with pytest.raises(ValueError):
+        with pool.connection('nds.example.com', 31200) as conn5:
+            raise ValueError("test")
+    assert conn5.closed
+    pool.close()
+    assert conn3.closed
+
+
+def test_fetch():
+    pool = ndspool.NDSConnectionPool(connect=MockConnection)
+    data = ndspool.fetch(['X1:TEST-A', 'X1:TEST-B'], 0, 250,
+                         'nds.example.com', port=31200, pool=pool, chunk=100,
+                         nproc=2, series_class=MockDict)
+    assert isinstance(data, MockDict)
+    for name in ('X1:TEST-A', 'X1:TEST-B'):
+        assert data[name].span == (0, 250)
+        nptest.assert_array_equal(data[name].value, arange(250))
+    requests = sorted(req for idle in pool._idle.values() for
+                      conn in idle for req in conn.requests)
+    assert requests == [(0, 100), (100, 200), (200, 250)]
+    assert pool.opened <= 2
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for `gwsumm.plan`
+
+"""
+
+from gwpy.segments import (Segment, SegmentList, DataQualityDict)
+
+from gwsumm import (globalv, plan)
+from gwsumm.config import GWSummConfigParser
+from gwsumm.plot import get_plot
+from gwsumm.state import SummaryState
+from gwsumm.tabs import get_tab
+
+from .common import (DQSegDBHandler, dqsegdb)  # noqa: F401
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+
+def _state(name, *segments):
+    state = SummaryState(name, known=[(0, 100)], active=segments)
+    state.ready = True
+    return state
+
+
+def test_dataplan_add():
+    dplan = plan.DataPlan()
+    dplan.add('timeseries', 'X1:TEST', [(0, 10)])
+    dplan.add('timeseries', 'X1:TEST', [(5, 20)])
+    dplan.add('timeseries', 'X1:TEST-2', [(0, 20)])
+    assert len(dplan) == 2
+    assert dplan.requests['timeseries']['X1:TEST'] == SegmentList([
+        Segment(0, 20)])
+    groups = dplan.group('timeseries')
+    assert len(groups) == 1
+    assert groups[0][1] == ['X1:TEST', 'X1:TEST-2']
+
+
+def test_dataplan_add_tab():
+    a = _state('a', (0, 10))
+    b = _state('b', (20, 30), (40, 50))
+    tab = get_tab('data')('Test', states=[a, b], span=(0, 100),
+                          mode='gps')
+    tab.plots.append(get_plot('timeseries')(
+        ['X1:TEST'], 0, 100, state=a))
+    dplan = plan.DataPlan()
+    dplan.add_tab(tab)
+    # channel is read once, over the union of state segments
+    requests = dplan.requests['timeseries']
+    assert list(map(str, requests)) == ['X1:TEST']
+    assert list(requests.values())[0] == SegmentList([
+        Segment(0, 10), Segment(20, 30), Segment(40, 50)])
+
+
+def test_dataplan_prefetch_segments(dqsegdb, monkeypatch):  # noqa: F811
+    monkeypatch.setattr(globalv, 'SEGMENTS', DataQualityDict())
+    monkeypatch.setattr(globalv, 'SEGMENT_QUERIES', {})
+    config = GWSummConfigParser(defaults={'gps-start-time': '0',
+                                          'gps-end-time': '100'})
+    config.add_section('segment-database')
+    config.set('segment-database', 'url', dqsegdb)
+
+    a = SummaryState('a', known=[(0, 100)], definition='X1:A&X1:B')
+    b = SummaryState('b', known=[(0, 100)], definition='X1:A!X1:C')
+    tabs = []
+    for span, state in [((0, 50), a), ((50, 100), b)]:
+        tab = get_tab('data')('Test %s' % state.name, states=[state],
+                              span=span, mode='gps')
+        tab.plots.append(get_plot('segments')(
+            ['X1:D|X1:A'], span[0], span[1], state=state))
+        tabs.append(tab)
+
+    dplan = plan.DataPlan.from_tablist(tabs, config=config)
+    # each flag is queried once, over the full span
+    assert sorted(DQSegDBHandler.requests) == [
+        '/dq/X1/%s/1?s=0&e=100&include=active%%2Cknown' % flag for
+        flag in 'ABCD']
+    assert sorted(dplan.requests['segments']) == [
+        'X1:A', 'X1:B', 'X1:C', 'X1:D']
+    assert a.active == SegmentList([Segment(0, 50)])
+    assert b.active == SegmentList()
+
+    # and everything after that is served from memory
+    dplan.execute(config=config)
+    for tab in tabs:
+        tab.finalize_states(config=config)
+    assert len(DQSegDBHandler.requests) == 4
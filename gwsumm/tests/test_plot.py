@@ -31,10 +31,13 @@ from matplotlib import (rcParams, rc_context)
 
 import pytest
 
+import numpy
+
 from gwpy.detector import ChannelList
 from gwpy.plot import Plot
 from gwpy.plot.tex import HAS_TEX
-from gwpy.segments import Segment
+from gwpy.segments import (Segment, DataQualityFlag)
+from gwpy.timeseries import TimeSeries
 
 from gwsumm import plot as gwsumm_plot
 from gwsumm.channels import get_channel
@@ -86,6 +89,72 @@ def test_get_column_label(column, label):
     assert gwsumm_plot.get_column_label(column) == label
 
 
+def test_decimate_for_display():
+    data = numpy.random.randn(10000)
+    data[1234] = 100.  # spike
+    ts = TimeSeries(data, sample_rate=100, epoch=0, name='X1:TEST-DECIMATE')
+
+    # m4 keeps extrema of each pixel
+    out = gwsumm_plot.decimate_for_display(ts, 1.)
+    assert out.size == 400
+    assert out.xindex[0] == ts.xindex[0]
+    assert out.xindex[-1] == ts.xindex[-1]
+    assert out.value.max() == 100.
+    assert out.value.min() == data.min()
+    assert out.name == ts.name
+
+    # and is cached
+    assert gwsumm_plot.decimate_for_display(ts, 1.) is out
+
+    # envelopes are regular
+    low = gwsumm_plot.decimate_for_display(ts, 1., method='min')
+    high = gwsumm_plot.decimate_for_display(ts, 1., method='max')
+    assert low.dt.value == high.dt.value == 1.
+    numpy.testing.assert_array_equal(
+        low.value, data.reshape(100, 100).min(axis=1))
+    numpy.testing.assert_array_equal(
+        high.value, data.reshape(100, 100).max(axis=1))
+
+    # fine resolution is a no-op
+    assert gwsumm_plot.decimate_for_display(ts, .02) is ts
+
+
+def test_decimate_for_display_cache(monkeypatch):
+    monkeypatch.setattr(gwsumm_plot.utils, 'DECIMATE_CACHE_SIZE', 2)
+    gwsumm_plot.utils.DECIMATE_CACHE.clear()
+    ts = TimeSeries(numpy.random.randn(10000), sample_rate=100, epoch=0,
+                    name='X1:TEST-DECIMATE_CACHE')
+    first = gwsumm_plot.decimate_for_display(ts, 1.)
+    for method in ('min', 'max'):
+        gwsumm_plot.decimate_for_display(ts, 1., method=method)
+    # least-recently used results are discarded
+    assert len(gwsumm_plot.utils.DECIMATE_CACHE) == 2
+    assert gwsumm_plot.decimate_for_display(ts, 1.) is not first
+    gwsumm_plot.utils.DECIMATE_CACHE.clear()
+
+
+@pytest.mark.parametrize('channel, method', [
+    ('X1:TEST.mean', 'mean'),
+    ('X1:TEST.rms', 'mean'),
+    ('X1:TEST.min', 'min'),
+    ('X1:TEST.max', 'max'),
+    ('G1:TEST-max', 'max'),
+])
+def test_decimate_method(channel, method):
+    assert gwsumm_plot.builtin._decimate_method(channel) == method
+
+
+def test_log_safe():
+    ts = TimeSeries([0., 1., 2.], sample_rate=1, name='X1:TEST-LOG')
+    out = gwsumm_plot.builtin._log_safe(ts)
+    # zeros are replaced in a copy, not in place
+    assert out is not ts
+    assert ts.value[0] == 0.
+    assert out.value[0] == 1e-100
+    assert out.name == ts.name
+    assert gwsumm_plot.builtin._log_safe(out) is out
+
+
 # -- gwsumm.plot.core ---------------------------------------------------------
 
 class TestSummaryPlot(object):
@@ -345,3 +414,16 @@ class TestDataPlot(TestSummaryPlot):
             'grid': False,
         })
         assert ax.get_xlim() == (10, 20)
+
+
+# -- gwsumm.plot.segments -----------------------------------------------------
+
+def test_calculate_duty_factor():
+    plot = gwsumm_plot.get_plot('duty')(['X1:TEST'], 0, 40, bins=[10] * 4)
+    flag = DataQualityFlag('X1:TEST', known=[(0, 35)],
+                           active=[(5, 12), (18, 25), (30, 40)])
+    duty, mean = plot.calculate_duty_factor(flag)
+    numpy.testing.assert_array_equal(duty, [50, 40, 50, 50])
+    numpy.testing.assert_allclose(mean, [50, 45, 140 / 3., 47.5])
+    duty, mean = plot.calculate_duty_factor(flag, cumulative=True)
+    numpy.testing.assert_array_equal(duty, [5, 9, 14, 19])
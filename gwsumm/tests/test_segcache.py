@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for `gwsumm.segcache`
+
+"""
+
+from numpy import testing as nptest
+
+from gwpy.segments import (Segment, SegmentList, DataQualityDict)
+
+from gwsumm import (globalv, segcache, segments)
+from gwsumm.config import GWSummConfigParser
+
+from .common import (DQSegDBHandler, dqsegdb)  # noqa: F401
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+
+def test_segment_cache(tmpdir):
+    cache = segcache.get_segment_cache(str(tmpdir))
+    assert segcache.get_segment_cache(str(tmpdir)) is cache
+    known, active = cache.read('X1:TEST:1')
+    assert known.shape == active.shape == (0, 2)
+
+    cache.update('X1:TEST:1', [(0, 10)], [(0, 5), (8, 10)])
+    # new segments replace old ones for newly known times
+    cache.update('X1:TEST:1', SegmentList([Segment(8, 20)]),
+                 SegmentList([Segment(15, 20)]))
+    known, active = cache.read('X1:TEST:1')
+    nptest.assert_array_equal(known, [[0, 20]])
+    nptest.assert_array_equal(active, [[0, 5], [15, 20]])
+    assert tmpdir.join('X1-TEST-1.npz').check()
+
+
+def test_get_segments_cache(dqsegdb, tmpdir, monkeypatch):  # noqa: F811
+    config = GWSummConfigParser()
+    config.add_section('segment-database')
+    config.set('segment-database', 'url', dqsegdb)
+    config.set('segment-database', 'cache-dir', str(tmpdir))
+    validity = SegmentList([Segment(0, 100)])
+    url = '/dq/X1/TEST/1?s=%d&e=%d&include=active%%2Cknown'
+
+    def _run():  # each run starts with an empty memory
+        monkeypatch.setattr(globalv, 'SEGMENTS', DataQualityDict())
+        monkeypatch.setattr(globalv, 'SEGMENT_QUERIES', {})
+        return segments.get_segments('X1:TEST', validity, config=config)
+
+    DQSegDBHandler.now = 50
+    flag = _run()
+    assert DQSegDBHandler.requests == [url % (0, 100)]
+    assert flag.known == SegmentList([Segment(0, 50)])
+
+    # next run only queries for the times that were not known
+    DQSegDBHandler.now = 100
+    flag = _run()
+    assert DQSegDBHandler.requests[1:] == [url % (50, 100)]
+    assert flag.known == validity
+    assert flag.active == SegmentList([Segment(0, 25), Segment(50, 75)])
+
+    # and then doesn't query at all
+    new = _run()
+    assert (new.known, new.active) == (flag.known, flag.active)
+    assert len(DQSegDBHandler.requests) == 2
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for `gwsumm.segments`
+
+"""
+
+from numpy import testing as nptest
+
+from gwpy.segments import (Segment, SegmentList, DataQualityFlag,
+                           DataQualityDict)
+
+from gwsumm import (globalv, segments)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+SEGMENTS = SegmentList([Segment(4, 6), Segment(0, 2), Segment(1, 3),
+                        Segment(8, 8), Segment(6, 7)])
+
+
+def test_segments_to_array():
+    array = segments.segments_to_array(SEGMENTS)
+    nptest.assert_array_equal(array, [[0, 3], [4, 7]])
+    assert segments.array_to_segments(array) == SEGMENTS.coalesce()
+    assert segments.segments_to_array([]).shape == (0, 2)
+
+
+def test_coincident_array():
+    a = segments.segments_to_array([(0, 10), (20, 30)])
+    b = segments.segments_to_array([(5, 25)])
+    c = segments.segments_to_array([(10, 15), (28, 40)])
+    nptest.assert_array_equal(segments.coincident_array([a, b, c], n=1),
+                              [[0, 40]])
+    nptest.assert_array_equal(segments.coincident_array([a, b, c], n=2),
+                              [[5, 15], [20, 25], [28, 30]])
+    assert segments.coincident_array([a, b, c], n=3).shape == (0, 2)
+    # touching segments are not coincident
+    assert segments.coincident_array([a, c[:1]]).shape == (0, 2)
+
+
+def test_array_algebra():
+    a = segments.segments_to_array([(0, 10), (20, 30)])
+    b = segments.segments_to_array([(5, 25)])
+    nptest.assert_array_equal(segments.union_array(a, b), [[0, 30]])
+    nptest.assert_array_equal(segments.intersection_array(a, b),
+                              [[5, 10], [20, 25]])
+    nptest.assert_array_equal(segments.difference_array(a, b),
+                              [[0, 5], [25, 30]])
+    nptest.assert_array_equal(segments.difference_array(b, a), [[10, 20]])
+    nptest.assert_array_equal(segments.pad_array(a, -1, 6),
+                              [[-1, 16], [19, 36]])
+    nptest.assert_array_equal(segments.pad_array(a, 2, -2),
+                              [[2, 8], [22, 28]])
+
+
+def test_get_segments_compound(monkeypatch):
+    monkeypatch.setattr(globalv, 'SEGMENTS', DataQualityDict())
+    globalv.SEGMENTS['X1:A'] = DataQualityFlag(
+        'X1:A', known=[(0, 100)], active=[(0, 10), (20, 30), (50, 60)])
+    globalv.SEGMENTS['X1:B'] = DataQualityFlag(
+        'X1:B', known=[(0, 80)], active=[(5, 25), (58, 90)])
+    validity = SegmentList([Segment(0, 100)])
+    out = segments.get_segments(
+        ['X1:A&X1:B', 'X1:A|X1:B', 'X1:A!X1:B', 'X1:A!=X1:B', '!X1:B'],
+        validity, query=False, padding={'X1:A': (0, 1)})
+    a = globalv.SEGMENTS['X1:A'].pad(0, 1).coalesce()
+    b = globalv.SEGMENTS['X1:B']
+    for compound, ref in [
+            ('X1:A&X1:B', a & b),
+            ('X1:A|X1:B', a | b),
+            ('X1:A!X1:B', a - b),
+            ('X1:A!=X1:B', (a - b) | (b - a)),
+    ]:
+        assert out[compound].known == ref.known & validity
+        assert out[compound].active == ref.active & validity
+    assert out['!X1:B'].active == [(0, 5), (25, 58)]
+
+
+def test_livetime():
+    starts = [-2, 0, 2, 4, 6, 8]
+    ends = [0, 2, 4, 6, 8, 10]
+    nptest.assert_array_equal(segments.livetime(SEGMENTS, starts, ends),
+                              [0, 2, 1, 2, 1, 0])
+    nptest.assert_array_equal(segments.livetime([], starts, ends), [0] * 6)
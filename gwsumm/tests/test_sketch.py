@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests for `gwsumm.data.sketch`
+
+"""
+
+import h5py
+
+import pytest
+
+from numpy import (percentile, random, testing as nptest)
+
+from gwpy.spectrogram import Spectrogram
+from gwpy.segments import (Segment, SegmentList)
+
+from gwsumm import globalv
+from gwsumm.data import sketch
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+# half a bin in each direction
+RTOL = 10 ** (1. / sketch.RESOLUTION) - 1
+
+
+def _specgram(epoch, ntimes=100, nfreqs=5):
+    data = 10 ** random.uniform(-42, -38, size=(ntimes, nfreqs))
+    data *= 10 ** random.uniform(-3, 3, size=nfreqs)
+    return Spectrogram(data, epoch=epoch, dt=1, f0=0, df=.5, unit='m^2/Hz',
+                       name='X1:TEST', channel='X1:TEST')
+
+
+def test_percentile():
+    spec = _specgram(0)
+    spec.value[:3, 0] = 0  # zeros
+    sk = sketch.SpectrumSketch()
+    sk.update(spec[:40])
+    sk.update(spec[40:])
+    assert sk.count == 100
+    assert sk.segments == SegmentList([Segment(0, 100)])
+    for q in (0, 5, 50, 95, 100):
+        fs = sk.percentile(q)
+        ref = spec.percentile(q)
+        assert fs.unit == ref.unit
+        assert fs.df == ref.df
+        assert fs.name == ref.name
+        # compare to the nearest sample
+        lower = percentile(spec.value, q, axis=0, interpolation='lower')
+        upper = percentile(spec.value, q, axis=0, interpolation='higher')
+        assert ((fs.value >= lower * (1 - RTOL)) &
+                (fs.value <= upper * (1 + RTOL))).all()
+    assert sk.percentile(0).value[0] == 0
+
+
+def test_merge():
+    a = _specgram(0)
+    b = _specgram(100)
+    b.value[:] *= 100
+    sk1 = sketch.SpectrumSketch()
+    sk1.update(a)
+    sk2 = sketch.SpectrumSketch()
+    sk2.update(b)
+    full = sketch.SpectrumSketch()
+    full.update(a)
+    full.update(b)
+    merged = sketch.SpectrumSketch().merge(sk1).merge(sk2)
+    assert merged.count == full.count == 200
+    assert merged.segments == SegmentList([Segment(0, 200)])
+    for q in (5, 50, 95):
+        nptest.assert_array_equal(merged.percentile(q).value,
+                                  full.percentile(q).value)
+    with pytest.raises(ValueError):
+        sk1.merge(sketch.SpectrumSketch(resolution=10))
+
+
+def test_read_write(tmpdir):
+    spec = _specgram(0)
+    spec.value[:, 0] = float('nan')  # not counted in the first bin
+    sk = sketch.SpectrumSketch()
+    sk.update(spec)
+    assert sk.count == 100
+    fname = str(tmpdir.join('sketch.h5'))
+    with h5py.File(fname, 'w') as h5file:
+        sk.write(h5file, 'X1:TEST;median')
+    with h5py.File(fname, 'r') as h5file:
+        new = sketch.SpectrumSketch.read(h5file['X1:TEST;median'])
+    assert new.segments == sk.segments
+    assert new.count == 100
+    assert new.unit == sk.unit
+    assert str(new.channel) == 'X1:TEST'
+    nptest.assert_array_equal(new.percentile(50).value,
+                              sk.percentile(50).value)
+
+
+def test_add_spectrum_sketch(monkeypatch):
+    monkeypatch.setattr(globalv, 'SPECTRUM_SKETCHES', {})
+    sk1 = sketch.SpectrumSketch()
+    sk1.update(_specgram(0))
+    sk2 = sketch.SpectrumSketch()
+    sk2.update(_specgram(100))
+    assert sketch.add_spectrum_sketch(sk1, 'test') is sk1
+    # disjoint sketches are merged
+    assert sketch.add_spectrum_sketch(sk2, 'test') is sk1
+    assert sk1.count == 200
+    # overlapping sketches are not
+    sk3 = sketch.SpectrumSketch()
+    sk3.update(_specgram(50))
+    assert sketch.add_spectrum_sketch(sk3, 'test') is sk1
+    assert sk1.count == 200
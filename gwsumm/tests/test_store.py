@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for `gwsumm.store`
+
+"""
+
+import pytest
+
+from numpy import (arange, shares_memory, testing as nptest)
+
+from gwpy.segments import (Segment, SegmentList)
+from gwpy.timeseries import TimeSeries
+
+from gwsumm import store
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+
+def _series(start, end):
+    return TimeSeries(arange(start, end), epoch=start, sample_rate=1,
+                      name='X1:TEST')
+
+
+def test_timeseries_store_add():
+    tsl = store.TimeSeriesStore()
+    a = _series(0, 5)
+    assert tsl.add(a) is a
+    assert tsl[0] is a
+
+    # insert out of order, with a gap
+    tsl.add(_series(20, 25))
+    tsl.add(_series(10, 15))
+    assert tsl.segments == SegmentList([
+        Segment(0, 5), Segment(10, 15), Segment(20, 25)])
+
+    # fill a gap, merging with both neighbours
+    tsl.add(_series(15, 20))
+    assert tsl.segments == SegmentList([Segment(0, 5), Segment(10, 25)])
+    nptest.assert_array_equal(tsl[1].value, arange(10, 25))
+
+    # insert without merging
+    tsl.add(_series(5, 10), coalesce=False)
+    assert len(tsl) == 3
+    tsl.coalesce()
+    assert len(tsl) == 1
+    nptest.assert_array_equal(tsl[0].value, arange(0, 25))
+
+
+def test_timeseries_store_add_view():
+    full = _series(0, 10)
+    tsl = store.TimeSeriesStore()
+    tsl.add(full.crop(0, 5, copy=False))
+    tsl.add(full.crop(5, 10, copy=False))
+    assert len(tsl) == 1
+    nptest.assert_array_equal(tsl[0].value, full.value)
+
+
+def test_insert_segment():
+    segs = SegmentList([Segment(0, 1), Segment(4, 5), Segment(8, 9)])
+    store.insert_segment(segs, Segment(2, 3))
+    assert segs == SegmentList([
+        Segment(0, 1), Segment(2, 3), Segment(4, 5), Segment(8, 9)])
+    store.insert_segment(segs, Segment(1, 4.5))
+    assert segs == SegmentList([Segment(0, 5), Segment(8, 9)])
+    store.insert_segment(segs, Segment(-1, 10))
+    assert segs == SegmentList([Segment(-1, 10)])
+
+
+def test_timeseries_store_crop_segments():
+    tsl = store.TimeSeriesStore()
+    tsl.add(_series(0, 10))
+    tsl.add(_series(20, 30))
+    tsl.add(_series(40, 50))
+    assert tsl.find(Segment(5, 25)) == [0, 1]
+    assert tsl.find(Segment(10, 20)) == []
+    assert tsl.find(Segment(45, 60)) == [2]
+
+    out = tsl.crop_segments(SegmentList([Segment(5, 25), Segment(29, 30)]))
+    assert isinstance(out, store.TimeSeriesStore)
+    assert out.segments == SegmentList([Segment(5, 10), Segment(20, 25),
+                                        Segment(29, 30)])
+    # cropped data are views of the stored data
+    assert shares_memory(out[0].value, tsl[0].value)
+    nptest.assert_array_equal(out[0].value, arange(5, 10))
+
+    # check index is rebuilt after insertion
+    tsl.add(_series(10, 20))
+    assert tsl.find(Segment(5, 25)) == [0]
+
+
+def test_parse_size():
+    assert store.parse_size(100) == 100
+    assert store.parse_size('16G') == 16 * 1024 ** 3
+    assert store.parse_size('1.5 MB') == 1.5 * 1024 ** 2
+    with pytest.raises(ValueError):
+        store.parse_size('lots')
+
+
+def test_memory_store(tmpdir):
+    budget = store.MemoryBudget(limit='500B', scratch_dir=str(tmpdir))
+    data = store.MemoryStore('test', budget=budget)
+    try:
+        for i in range(3):
+            tsl = store.TimeSeriesStore()
+            tsl.add(_series(i * 10, i * 10 + 30))  # 240 bytes each
+            data['X1:TEST-%d' % i] = tsl
+
+        # least-recently-used entry spilled to disk
+        assert data.spilled == 240
+        assert list(data._spilled) == ['X1:TEST-0']
+        assert 'X1:TEST-0' in data
+        assert len(data) == 3
+        assert budget.used <= budget.limit
+
+        # and reloaded when accessed (spilling the next LRU)
+        hits = data.hits
+        reloaded = data['X1:TEST-0']
+        assert data.misses == 1 and data.hits == hits
+        assert isinstance(reloaded, store.TimeSeriesStore)
+        nptest.assert_array_equal(reloaded[0].value, arange(0, 30))
+        assert reloaded[0].name == 'X1:TEST'
+        assert list(data._spilled) == ['X1:TEST-1']
+        assert data.stats['spilled'] == 480
+
+        # missing keys count as misses
+        assert data.get('X1:TEST-3') is None
+        assert data.misses == 2
+    finally:
+        budget.cleanup()
+
+
+def test_memory_store_shared_budget(tmpdir):
+    budget = store.MemoryBudget(limit='500B', scratch_dir=str(tmpdir))
+    data = store.MemoryStore('data', budget=budget)
+    spectrograms = store.MemoryStore('spectrograms', budget=budget)
+    try:
+        for i, container in enumerate((data, spectrograms, data)):
+            tsl = store.TimeSeriesStore()
+            tsl.add(_series(i * 10, i * 10 + 30))  # 240 bytes each
+            container['X1:TEST-%d' % i] = tsl
+
+        # entries from both containers are tracked by the same budget
+        assert list(data._spilled) == ['X1:TEST-0']
+        assert list(spectrograms._spilled) == []
+        assert budget.used <= budget.limit
+
+        # reloading from one container can spill from the other
+        data['X1:TEST-0']
+        assert list(spectrograms._spilled) == ['X1:TEST-1']
+        reloaded = spectrograms['X1:TEST-1']
+        nptest.assert_array_equal(reloaded[0].value, arange(10, 40))
+        assert list(data._spilled) == ['X1:TEST-2']
+
+        # entries are forgotten when their container is deleted
+        used = budget.used
+        del spectrograms
+        assert budget.used == used - 240
+    finally:
+        budget.cleanup()
+
+
+def test_span_cache():
+    cache = store.SpanCache(
+        lambda result, start, end: [x for x in result if start <= x < end])
+    with pytest.raises(KeyError):
+        cache.get('test', 0, 10)
+    cache.add('test', 0, 10, list(range(10)))
+    assert cache.get('test', 2, 5) == [2, 3, 4]
+    with pytest.raises(KeyError):
+        cache.get('test', 5, 15)
+    with pytest.raises(KeyError):
+        cache.get('other', 2, 5)
+    assert (cache.hits, cache.misses) == (1, 3)
@@ -24,8 +24,15 @@ import os.path
 
 import pytest
 
-from gwsumm import tabs
-from gwsumm.plot import SummaryPlot
+from numpy import (arange, testing as nptest)
+
+from gwpy.timeseries import (TimeSeries, TimeSeriesDict, StateVector)
+
+from gwsumm import (globalv, tabs)
+from gwsumm.plot import (SummaryPlot, get_plot)
+from gwsumm.state import SummaryState
+
+from .common import empty_globalv_CHANNELS
 
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
 
@@ -153,3 +160,35 @@ class TestPlotTab(TestTab):
             tab.set_layout([1, (1, 2, 1)])
         with pytest.warns(DeprecationWarning):
             tab.layout = [1]
+
+
+# -- data tab
+
+@empty_globalv_CHANNELS
+def test_data_tab_process_state(tmpdir):
+    globalv.DATA = type(globalv.DATA)()
+    tsd = TimeSeriesDict()
+    for name in ('X1:TEST-TAB_A', 'X1:TEST-TAB_B'):
+        tsd[name] = TimeSeries(arange(16.), sample_rate=1, epoch=0,
+                               channel=name, name=name)
+    gwf = str(tmpdir.join('X-X1_TEST-0-16.gwf'))
+    tsd.write(gwf)
+
+    state = SummaryState('test', known=[(0, 16)], active=[(0, 16)])
+    state.ready = True
+    tab = tabs.get_tab('data')('Test', states=[state], span=(0, 16),
+                               mode='gps', noplots=True)
+    tab.plots.append(get_plot('timeseries')(
+        ['X1:TEST-TAB_A'], 0, 16, state=state))
+    tab.plots.append(get_plot('statevector')(
+        ['X1:TEST-TAB_B'], 0, 16, state=state))
+
+    # both channels are read in a single pass
+    tab.process_state(state, nds=False, datacache=[gwf])
+    a, = globalv.DATA['X1:TEST-TAB_A']
+    b, = globalv.DATA['X1:TEST-TAB_B']
+    assert not isinstance(a, StateVector)
+    assert isinstance(b, StateVector)
+    nptest.assert_array_equal(a.value, arange(16.))
+    nptest.assert_array_equal(b.value, arange(16))
+    globalv.DATA = type(globalv.DATA)()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of GWSumm.
+#
+# GWSumm is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWSumm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWSumm.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests for `gwsumm.data.welch`
+
+"""
+
+import pytest
+
+from numpy import (random, testing as nptest)
+
+from gwpy.timeseries import TimeSeries
+
+from gwsumm.data import welch
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+
+def test_chunk_starts():
+    # first step is shortened by half the overlap, last chunk is pinned
+    assert list(welch.chunk_starts(100, 20, 4)) == [0, 18, 38, 58, 76]
+    assert list(welch.chunk_starts(100, 20, 0)) == [0, 20, 40, 60, 80]
+    assert list(welch.chunk_starts(10, 20, 0)) == []
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'fftlength': 2, 'overlap': 1, 'average': 'median'},
+    {'fftlength': 4, 'window': 'hamming'},
+])
+def test_batch_welch(kwargs):
+    data = random.randn(3, 64 * 40)
+    freqs, psds = welch.batch_welch(data, 64, 8, **kwargs)
+    assert psds.shape == welch.output_shape(3, data.shape[1], 64, 8,
+                                            **kwargs)
+    average = kwargs.pop('average', 'mean')
+    method = {'mean': 'welch', 'median': 'median'}[average]
+    for row, psd in zip(data, psds):
+        ref = TimeSeries(row, sample_rate=64).spectrogram(
+            8, method=method, **kwargs)
+        nptest.assert_allclose(psd, ref.value, rtol=1e-10)
+        nptest.assert_array_equal(freqs, ref.frequencies.value)
+
+
+def test_map_welch(tmpdir, monkeypatch):
+    monkeypatch.setattr(welch, 'SHARED_MEMORY_DIR', str(tmpdir))
+    jobs = [([random.randn(32 * 60), random.randn(32 * 60)], 32,
+             {'stride': 10, 'fftlength': 2, 'overlap': 1,
+              'average': 'median'}) for i in range(5)]
+    serial = list(welch.map_welch(jobs, nproc=1))
+    assert not tmpdir.listdir()
+    pooled = welch.map_welch(jobs, nproc=2)
+    first = next(pooled)
+    # jobs still in flight are held in shared memory
+    assert tmpdir.listdir()
+    pooled = [first] + list(pooled)
+    assert not tmpdir.listdir()
+    assert len(pooled) == len(jobs)
+    for (f1, p1), (f2, p2) in zip(serial, pooled):
+        nptest.assert_array_equal(f1, f2)
+        nptest.assert_array_equal(p1, p2)
@@ -29,15 +29,16 @@ from lal.utils import CacheEntry
 from glue.lal import Cache
 from glue.ligolw import lsctables
 
-from gwpy.io.cache import cache_segments
+from gwpy.io.cache import (cache_segments, file_segment)
 from gwpy.table import (EventTable, filters as table_filters)
 from gwpy.table.filter import parse_column_filters
 from gwpy.table.io.pycbc import filter_empty_files as filter_pycbc_live_files
-from gwpy.segments import (DataQualityFlag, SegmentList)
+from gwpy.segments import (DataQualityFlag, Segment, SegmentList)
 
 import gwtrigfind
 
 from . import globalv
+from .store import (insert_segment, SpanCache)
 from .utils import (re_cchar, vprint, safe_eval)
 from .config import GWSummConfigParser
 from .channels import get_channel
@@ -105,6 +106,69 @@ for name in lsctables.TableByName:
     }
 
 
+def _sieve_trigger_files(cache, start, end):
+    """Return those files from a cache that overlap ``[start, end)``
+
+    Files whose names cannot be parsed for a GPS segment are kept.
+    """
+    span = Segment(start, end)
+    out = []
+    for url in cache:
+        try:
+            seg = file_segment(url)
+        except (AttributeError, TypeError, ValueError):
+            out.append(url)
+        else:
+            if seg.intersects(span):
+                out.append(url)
+    return type(cache)(out)
+
+
+# in-process cache of trigger file lookups
+TRIGFIND_CACHE = SpanCache(_sieve_trigger_files)
+
+
+def find_trigger_files(channel, etg, start, end, **kwargs):
+    """Find trigger files for the given channel and ETG
+
+    This wraps :func:`gwtrigfind.find_trigger_files`, caching the results
+    for the rest of the process, so that a repeat request for a span
+    contained in one already queried is answered from memory.
+
+    Parameters
+    ----------
+    channel : `str`
+        the name of the channel
+
+    etg : `str`
+        the name of the event trigger generator
+
+    start : `float`
+        the GPS start time of the search
+
+    end : `float`
+        the GPS end time of the search
+
+    **kwargs
+        other keyword arguments are passed to
+        :func:`gwtrigfind.find_trigger_files`
+
+    Returns
+    -------
+    cache : `list` of `str`
+        the list of trigger file paths
+    """
+    key = (str(channel), etg) + tuple(sorted(
+        (k, str(v)) for k, v in kwargs.items()))
+    try:
+        return TRIGFIND_CACHE.get(key, start, end)
+    except KeyError:
+        cache = gwtrigfind.find_trigger_files(channel, etg, start, end,
+                                              **kwargs)
+        TRIGFIND_CACHE.add(key, start, end, type(cache)(cache))
+        return cache
+
+
 def get_etg_table(etg):
     """Find which table should be used for the given etg
 
@@ -222,7 +286,7 @@ def get_triggers(channel, etg, segments, config=GWSummConfigParser(),
                 # find trigger files
                 if cache is None and not etg.lower() == 'hacr':
                     try:
-                        segcache = gwtrigfind.find_trigger_files(
+                        segcache = find_trigger_files(
                             str(channel), trigfindetg, segment[0], segment[1],
                             **trigfindkwargs)
                     except ValueError as e:
@@ -281,11 +345,12 @@ def add_triggers(table, key, segments=None):
     except KeyError:
         new = globalv.TRIGGERS[key] = table
         new.meta.setdefault('segments', SegmentList())
+        new.meta['segments'].coalesce()
     else:
         new = globalv.TRIGGERS[key] = vstack_tables((old, table))
         new.meta = old.meta
-        new.meta['segments'] |= table.meta.get('segments', SegmentList())
-    new.meta['segments'].coalesce()
+        for seg in table.meta.get('segments', SegmentList()):
+            insert_segment(new.meta['segments'], seg)
     return new
 
 